@@ -1,12 +1,30 @@
+import uuid
+
 import streamlit as st
 
-from src.engine.orchestrator import start_story, next_step
-from src.engine.auto_continue_agent import should_auto_continue
+from src.engine.turn_worker import TurnWorker
+from src.engine.warmup import start_warmup, get_warmup_status, is_warm
+from src.engine.state import trim_history
+from src.storage.journal import StoryJournal, list_stories, HISTORY_TAIL
+from src.utils.json_repair import parse_json_lenient
+from src.utils.ledger import get_ledger
 
 # Configuration générale de la page Streamlit.
 # On définit le titre, l’icône et la mise en page.
 st.set_page_config(page_title="Stories by AI", page_icon="📘", layout="wide")
 
+
+@st.cache_resource
+def launch_warmup():
+    """
+    Démarre le préchauffage (modèles, embeddings, lore) une seule fois par processus,
+    en arrière-plan, pour que le premier joueur ne paie pas tous les chargements.
+    """
+    return start_warmup()
+
+
+launch_warmup()
+
 # Initialisation des différentes variables stockées dans la session.
 # Elles permettent de conserver l'état du jeu entre les interactions.
 if "codex" not in st.session_state:
@@ -21,53 +39,366 @@ if "scene" not in st.session_state:
 if "theme" not in st.session_state:
     st.session_state.theme = "Fantasy"
 
+# Historique affiché : les HISTORY_TAIL dernières scènes seulement, la première
+# étant la scène numéro history_start (à partir de 0).
 if "history" not in st.session_state:
     st.session_state.history = []
+    st.session_state.history_start = 0
+
+if "journal" not in st.session_state:
+    st.session_state.journal = None
+
+# Les appels au moteur tournent dans un thread d'arrière-plan propre à la session :
+# la page reste réactive et affiche la progression du tour en cours.
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex[:8]
+
+if "worker" not in st.session_state:
+    st.session_state.worker = TurnWorker(session=st.session_state.session_id)
+
+if "turn_error" not in st.session_state:
+    st.session_state.turn_error = None
+
+# Export texte de l'histoire, construit au fil de l'eau : seules les nouvelles
+# scènes y sont ajoutées à chaque rafraîchissement.
+if "export_text" not in st.session_state:
+    st.session_state.export_text = ""
+    st.session_state.export_count = 0
+    st.session_state.export_story = None
 
+# Nombre de scènes affichées par page dans l'historique.
+HISTORY_PAGE_SIZE = 10
+
+# Nombre maximum d'éléments (flags, objets) affichés dans le résumé de l'état.
+STATE_SUMMARY_ITEMS = 10
 
 def start_new_game():
     """
-    Lance une nouvelle histoire.
-    Cette fonction demande au moteur narratif de créer un codex, un état initial
-    et une première scène. Elle réinitialise aussi l'historique affiché dans l'interface.
+    Lance une nouvelle histoire en arrière-plan.
+    Le moteur narratif crée un codex, un état initial et une première scène ;
+    finish_new_game les installe dans la session une fois prêts.
+    """
+    st.session_state.worker.submit_start(st.session_state.theme)
+
+
+def finish_new_game(data):
+    """
+    Installe la nouvelle histoire produite par le moteur.
+    Réinitialise aussi l'historique affiché dans l'interface.
     """
-    data = start_story(theme=st.session_state.theme)
     st.session_state.codex = data["codex"]
     st.session_state.state = data["state"]
     st.session_state.scene = data["scene"]
 
-    # On remet l'historique à zéro et on ajoute la première scène.
+    # On remet l'historique à zéro et on ajoute la première scène (et celles
+    # que le moteur a enchaînées à sa suite).
+    scenes = played_scenes(data["scene"])
     st.session_state.history = []
-    st.session_state.history.append({"scene_text": data["scene"]["scene_text"]})
+    st.session_state.history_start = 0
+    for scene in scenes:
+        add_to_history(scene)
+
+    # Sauvegarde sur disque : l'histoire survit à un rafraîchissement de la page.
+    # Comme dans finish_turn, les scènes enchaînées sont journalisées dans
+    # l'ordre, et le nouvel état n'accompagne que la dernière.
+    opening_state = data.get("opening_state", data["state"])
+    journal = StoryJournal(data["state"]["story_id"])
+    journal.create(data["codex"], opening_state, scenes[0])
+    for scene in scenes[1:-1]:
+        journal.append_turn(scene, opening_state)
+    if len(scenes) > 1:
+        journal.append_turn(scenes[-1], data["state"])
+    st.session_state.journal = journal
+    st.session_state.worker.claim(journal.story_id)
+    st.query_params["story"] = journal.story_id
+
+
+def resume_game(story_id):
+    """
+    Recharge une histoire sauvegardée (dernier snapshot + fin du journal).
+    L'identifiant peut venir de l'URL : un identifiant invalide est ignoré.
+    """
+    try:
+        journal = StoryJournal(story_id)
+    except ValueError:
+        return False
+    if not journal.exists():
+        return False
+
+    # Un tour encore en cours concerne l'histoire précédente : on l'arrête,
+    # comme celui d'une session antérieure (rafraîchissement) sur cette histoire.
+    st.session_state.worker.cancel()
+    st.session_state.worker.claim(story_id)
+
+    data = journal.load()
+    st.session_state.codex = data["codex"]
+    st.session_state.state = data["state"]
+    st.session_state.scene = data["scene"]
+    st.session_state.history = data["history"]
+    st.session_state.history_start = data["history_start"]
+    st.session_state.journal = journal
+    st.query_params["story"] = story_id
+    return True
 
 
 def process_input(user_input):
     """
     Traite une action du joueur.
-    Cette fonction envoie l'action au moteur narratif, récupère la scène suivante,
-    met à jour l'état interne et ajoute la scène à l'historique.
+    L'action est envoyée au moteur narratif en arrière-plan ; un tour encore
+    en cours est annulé (son flux Ollama est fermé). finish_turn applique
+    ensuite la scène obtenue.
     """
-    new_scene, new_state = next_step(
-        user_input=user_input,
-        codex=st.session_state.codex,
-        state=st.session_state.state
+    st.session_state.worker.submit_turn(
+        user_input,
+        st.session_state.codex,
+        st.session_state.state
     )
 
+    # On relance l'application pour afficher la progression.
+    st.rerun()
+
+
+def played_scenes(scene):
+    """
+    Scènes produites par un clic, dans l'ordre : les scènes de transition
+    enchaînées par le moteur ("chained_scenes"), puis la scène finale.
+    Les copies renvoyées n'ont plus le champ "chained_scenes".
+    """
+    final = {k: v for k, v in scene.items() if k != "chained_scenes"}
+    return list(scene.get("chained_scenes") or []) + [final]
+
+
+def add_to_history(scene):
+    """
+    Ajoute une scène à l'historique affiché, limité aux HISTORY_TAIL dernières :
+    les plus anciennes restent dans le journal de sauvegarde.
+    """
+    history = st.session_state.history
+    history.append({"scene_text": scene.get("scene_text", "Scène introuvable.")})
+    overflow = len(history) - HISTORY_TAIL
+    if overflow > 0:
+        del history[:overflow]
+        st.session_state.history_start += overflow
+
+
+def finish_turn(new_scene, new_state):
+    """
+    Applique le résultat d'un tour : met à jour l'état interne
+    et ajoute la scène (précédée des scènes enchaînées) à l'historique.
+    """
+    previous_state = st.session_state.state
+    scenes = played_scenes(new_scene)
+
     # Mise à jour de la scène et de l'état narratif.
     st.session_state.scene = new_scene
     st.session_state.state = new_state
 
-    # On ajoute la scène générée à l'historique affiché dans l'interface.
-    entry = {"scene_text": new_scene.get("scene_text", "Scène introuvable.")}
-    st.session_state.history.append(entry)
+    # On ajoute les scènes générées à l'historique affiché dans l'interface.
+    for scene in scenes:
+        add_to_history(scene)
+    entry = st.session_state.history[-1]
 
     # On ajoute aussi la scène dans l'historique interne du moteur.
     if "history" not in st.session_state.state:
         st.session_state.state["history"] = []
     st.session_state.state["history"].append(entry)
+    trim_history(st.session_state.state)
 
-    # On relance l'application pour rafraîchir l'affichage.
-    st.rerun()
+    # On enregistre le tour dans le journal de sauvegarde, une entrée par
+    # scène ; le nouvel état n'accompagne que la dernière.
+    if st.session_state.journal is not None:
+        for scene in scenes[:-1]:
+            st.session_state.journal.append_turn(scene, previous_state)
+        st.session_state.journal.append_turn(scenes[-1], st.session_state.state)
+
+
+def collect_finished_job():
+    """
+    Récupère le travail terminé par le moteur en arrière-plan, s'il y en a un,
+    et l'applique à la session.
+    """
+    outcome = st.session_state.worker.take_result()
+    if outcome is None:
+        return
+
+    if outcome["status"] == "done":
+        if outcome["kind"] == "start":
+            finish_new_game(outcome["result"])
+        else:
+            finish_turn(*outcome["result"])
+    elif outcome["status"] == "error":
+        st.session_state.turn_error = outcome["error"]
+
+
+collect_finished_job()
+
+# Après un rafraîchissement, on reprend l'histoire indiquée dans l'URL.
+if st.session_state.codex is None and "story" in st.query_params:
+    resume_game(st.query_params["story"])
+
+
+def summarize_state(state):
+    """
+    Construit un résumé de taille bornée de l'état narratif pour la barre latérale.
+    L'état complet grandit avec l'historique : on n'affiche que les derniers
+    éléments et des compteurs.
+    """
+    flags = state.get("flags", {})
+    inventory = state.get("inventory", [])
+    milestones = (st.session_state.codex or {}).get("milestones", [])
+    index = state.get("milestone_index", 0)
+
+    return {
+        "milestone": f"{index + 1}/{len(milestones)} — {milestones[index]}"
+        if index < len(milestones) else f"{index + 1} (au-delà du codex)",
+        "inventaire": inventory[-STATE_SUMMARY_ITEMS:],
+        "objets": len(inventory),
+        "flags": dict(list(flags.items())[-STATE_SUMMARY_ITEMS:]),
+        "nombre_de_flags": len(flags),
+        "entrées_historique": len(state.get("history", []))
+    }
+
+
+def update_export_text():
+    """
+    Met à jour la version texte de l'historique utilisée pour l'export.
+    Seules les scènes ajoutées depuis le dernier appel sont formatées ;
+    le texte est reconstruit uniquement si l'histoire a changé.
+    export_count compte les scènes de l'histoire (numérotation absolue).
+    """
+    history = st.session_state.history
+    offset = st.session_state.history_start
+    total = offset + len(history)
+    story_id = (st.session_state.state or {}).get("story_id")
+
+    if story_id != st.session_state.export_story or st.session_state.export_count > total:
+        st.session_state.export_text = ""
+        st.session_state.export_count = 0
+        st.session_state.export_story = story_id
+
+    text = st.session_state.export_text
+    for n in range(max(st.session_state.export_count, offset), total):
+        part = f"--- Scène {n + 1} ---\n{history[n - offset]['scene_text']}\n"
+        text = f"{text}\n{part}" if text else part
+
+    st.session_state.export_text = text
+    st.session_state.export_count = total
+    return text
+
+
+# Libellés affichés pour les étapes du préchauffage.
+WARMUP_LABELS = {"models": "Modèle de langage", "embeddings": "Mémoire (embeddings)", "rag": "Lore (RAG)"}
+WARMUP_ICONS = {"pending": "⏳", "running": "⏳", "ready": "✅", "error": "❌"}
+
+
+@st.fragment(run_every=2)
+def warmup_panel():
+    """
+    Affiche l'état du préchauffage ; le fragment se rafraîchit seul
+    toutes les deux secondes sans relancer toute la page.
+    """
+    if is_warm():
+        errors = [s for s, info in get_warmup_status().items() if info["state"] == "error"]
+        if errors:
+            st.caption("Préchauffage terminé avec des erreurs : " + ", ".join(WARMUP_LABELS[s] for s in errors))
+        else:
+            st.caption("✅ Moteur prêt")
+        return
+
+    st.caption("Préchauffage du moteur…")
+    for stage, info in get_warmup_status().items():
+        st.caption(f"{WARMUP_ICONS[info['state']]} {WARMUP_LABELS[stage]}")
+
+
+# Libellés affichés pour les étapes d'un tour en cours.
+STAGE_LABELS = {
+    "pending": "Préparation…",
+    "codex": "Création de l'univers…",
+    "classifying": "Analyse de l'action…",
+    "retrieving": "Recherche dans la mémoire…",
+    "writing": "Écriture de la scène…",
+    "deciding": "Suite de l'histoire…"
+}
+
+
+def preview_scene_text(raw):
+    """
+    Extrait le texte de scène d'une réponse JSON encore incomplète.
+    """
+    data, _ = parse_json_lenient(raw)
+    if isinstance(data, dict) and isinstance(data.get("scene_text"), str):
+        return data["scene_text"]
+    return ""
+
+
+@st.fragment(run_every=0.5)
+def turn_progress():
+    """
+    Affiche l'étape du tour en cours et le texte déjà écrit par le modèle.
+    Quand le moteur a terminé, toute la page est relancée pour afficher le résultat.
+    """
+    progress = st.session_state.worker.poll()
+    if progress["status"] == "idle":
+        return
+    if progress["status"] != "running":
+        st.rerun()
+
+    st.info(STAGE_LABELS.get(progress["stage"], "Le moteur travaille…"))
+    if progress["stage"] == "writing":
+        preview = preview_scene_text(progress["text"])
+        if preview:
+            st.write(preview)
+
+    if st.button("⏹ Arrêter", key="stop_turn"):
+        st.session_state.worker.cancel()
+        st.rerun()
+
+
+# Nombre d'appels récents affichés dans le panneau de debug.
+LEDGER_RECENT_CALLS = 10
+
+
+def ledger_panel():
+    """
+    Panneau de debug : tokens et temps des appels au modèle de la session,
+    d'après les statistiques renvoyées par Ollama.
+    """
+    summary = get_ledger().summary(session=st.session_state.session_id)
+    if not summary["calls"]:
+        st.caption("Aucun appel au modèle enregistré pour cette session.")
+        return
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Tokens / tour", f"{summary['per_turn']['prompt_tokens'] + summary['per_turn']['eval_tokens']:.0f}")
+    col2.metric("Génération", f"{summary['eval_tokens_per_s']:.1f} tok/s")
+    col3.metric("Rechargements", summary["reloads"])
+
+    st.caption("Par étape")
+    st.table([
+        {
+            "étape": stage,
+            "appels": agg["calls"],
+            "prompt": agg["prompt_tokens"],
+            "générés": agg["eval_tokens"],
+            "tok/s": round(agg["eval_tokens_per_s"], 1),
+            "chargement (s)": round(agg["load_s"], 2),
+            "durée (s)": round(agg["wall_s"], 2)
+        }
+        for stage, agg in summary["by_stage"].items()
+    ])
+
+    st.caption("Derniers appels")
+    st.table([
+        {
+            "étape": r["stage"],
+            "modèle": r["model"],
+            "prompt": r["prompt_tokens"],
+            "générés": r["eval_tokens"],
+            "chargement (s)": round(r["load_s"], 2),
+            "durée (s)": round(r["wall_s"], 2)
+        }
+        for r in reversed(get_ledger().records(session=st.session_state.session_id, limit=LEDGER_RECENT_CALLS))
+    ])
 
 
 # --- Interface utilisateur (UI) ---
@@ -75,6 +406,7 @@ def process_input(user_input):
 with st.sidebar:
     # Titre principal dans la barre latérale.
     st.title("Stories by AI")
+    warmup_panel()
 
     # Choix du thème avant de démarrer une histoire.
     st.subheader("Thème de l'histoire")
@@ -91,51 +423,79 @@ with st.sidebar:
         start_new_game()
         st.rerun()
 
+    # Reprise d'une histoire sauvegardée.
+    saved = list_stories(limit=20)
+    if saved:
+        labels = {
+            m["story_id"]: f"{m.get('pitch', '')[:40]}… (tour {m.get('turn', 0)})"
+            for m in saved
+        }
+        selected = st.selectbox(
+            "Reprendre une histoire :",
+            list(labels.keys()),
+            format_func=lambda story_id: labels[story_id]
+        )
+        if st.button("📂 Reprendre"):
+            resume_game(selected)
+            st.rerun()
+
     st.markdown("---")
 
     # Affichage du codex généré par le moteur narratif.
     st.subheader("Codex (univers)")
     if st.session_state.codex:
-        st.json(st.session_state.codex)
+        st.json(st.session_state.codex, expanded=False)
 
     st.markdown("---")
 
-    # Affichage de l'état narratif interne.
+    # Affichage d'un résumé borné de l'état narratif interne.
     st.subheader("État narratif")
     if st.session_state.state:
-        st.json(st.session_state.state)
+        st.json(summarize_state(st.session_state.state))
 
     st.markdown("---")
 
-    # Historique complet des scènes déjà jouées.
+    # Historique des scènes déjà jouées, affiché page par page :
+    # seules les scènes de la page choisie sont rendues.
     st.subheader("Historique des scènes")
+    history = st.session_state.history
     with st.expander("Voir l'historique"):
-        for i, entry in enumerate(st.session_state.history):
-            st.markdown(f"**Scène {i + 1}**")
-            st.write(entry["scene_text"])
-            st.markdown("---")
+        if history:
+            page_count = (len(history) - 1) // HISTORY_PAGE_SIZE + 1
+            page = st.number_input(
+                f"Page (sur {page_count})",
+                min_value=1,
+                max_value=page_count,
+                value=page_count
+            )
+            start = (page - 1) * HISTORY_PAGE_SIZE
+            for i in range(start, min(start + HISTORY_PAGE_SIZE, len(history))):
+                st.markdown(f"**Scène {st.session_state.history_start + i + 1}**")
+                st.write(history[i]["scene_text"])
+                st.markdown("---")
 
     # Export de l'histoire sous forme de fichier texte.
-    if st.session_state.history:
-        def build_history_text():
-            """
-            Construit une version texte de l'historique complet,
-            utilisée pour l'export en fichier.
-            """
-            lines = []
-            for i, entry in enumerate(st.session_state.history):
-                lines.append(f"--- Scène {i + 1} ---\n{entry['scene_text']}\n")
-            return "\n".join(lines)
-
-        history_text = build_history_text()
-
+    if history:
         st.download_button(
             label="Télécharger l'histoire",
-            data=history_text,
+            data=update_export_text(),
             file_name="histoire_codex.txt",
             mime="text/plain"
         )
 
+    st.markdown("---")
+
+    # Statistiques des appels au modèle (tokens, débit, rechargements).
+    with st.expander("🔧 Debug : tokens et temps"):
+        ledger_panel()
+
+
+# Progression du tour en cours (rafraîchie sans relancer toute la page).
+turn_progress()
+
+if st.session_state.turn_error:
+    st.error(f"Le moteur a rencontré une erreur : {st.session_state.turn_error}")
+    st.session_state.turn_error = None
 
 # Si aucune histoire n'a été lancée, on invite l'utilisateur à en créer une.
 if st.session_state.codex is None:
@@ -145,15 +505,13 @@ if st.session_state.codex is None:
 # On récupère la scène actuelle pour l'afficher.
 scene = st.session_state.scene
 
-# Vérifier si la scène doit auto-continuer
-state = st.session_state.state
-codex = st.session_state.codex
-
-if isinstance(scene, dict) and isinstance(state, dict) and isinstance(codex, dict):
-    decision = should_auto_continue(scene, state, codex)
-    if decision == "AUTO_CONTINUE":
-        process_input("")
-        st.stop()
+# Les scènes de transition enchaînées par le moteur pendant ce clic (dans le
+# budget de temps, voir auto_continue_budget.py) sont lues avant la scène actuelle.
+chained_scenes = scene.get("chained_scenes") or []
+if chained_scenes:
+    st.caption(f"⏩ {len(chained_scenes)} scène(s) enchaînée(s) pendant ce tour :")
+    for previous in chained_scenes:
+        st.write(previous.get("scene_text", ""))
 
 # Affichage de la scène en cours dans un bloc visuel.
 st.subheader("Scène actuelle")
@@ -179,6 +537,12 @@ st.markdown(
 # Section des actions possibles.
 st.subheader("🎮 Actions possibles")
 
+# L'histoire voulait encore avancer quand le budget du clic a été atteint :
+# le joueur décide de poursuivre.
+if scene.get("auto_continue"):
+    if st.button("⏩ Continuer l'histoire"):
+        process_input("")
+
 choices = scene.get("choices", [])
 
 # Si la scène propose des choix prédéfinis, on les affiche sous forme de boutons.
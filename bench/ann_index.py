@@ -0,0 +1,119 @@
+"""
+Banc des types d'index de la mémoire FAISS (src/memory/ann_index.py).
+
+Des vecteurs synthétiques regroupés en thèmes (comme des scènes d'un même
+univers) sont indexés avec chaque type d'index. Pour chacun, le banc mesure :
+- le rappel@k par rapport à la recherche exacte
+- la latence d'une requête (p50, p99)
+- la taille de l'index en octets par vecteur
+- le temps de construction (entraînement compris)
+et vérifie qu'une sauvegarde relue renvoie les mêmes résultats.
+
+Usage :
+    python -m bench.ann_index --vectors 50000 --dim 384 --k 5
+    python -m bench.ann_index --types flat,hnsw --json ann.json
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from bench.load_test import percentile
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int, latent_dim: int, seed: int = 0) -> np.ndarray:
+    """
+    Vecteurs normalisés répartis autour de `clusters` centres.
+
+    Comme des embeddings de texte, ils vivent près d'un sous-espace de faible
+    dimension (`latent_dim`) plongé dans `dim` dimensions, plus un léger bruit.
+    """
+    rng = np.random.default_rng(seed)
+    projection = rng.standard_normal((latent_dim, dim)).astype(np.float32)
+    centers = rng.standard_normal((clusters, latent_dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    latent = centers[labels] + 0.6 * rng.standard_normal((n, latent_dim)).astype(np.float32)
+    vectors = latent @ projection + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def bench_type(kind: str, data: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    from src.memory import ann_index
+
+    started = time.perf_counter()
+    index = ann_index.build_index(kind, data.shape[1], data if kind in ("int8", "ivfpq") else None)
+    index.add(data)
+    build_s = time.perf_counter() - started
+
+    latencies = []
+    found = np.empty((len(queries), k), dtype=np.int64)
+    for i, query in enumerate(queries):
+        started = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - started)
+        found[i] = ids[0]
+
+    recall = np.mean([len(set(found[i]) & set(truth[i])) / k for i in range(len(queries))])
+
+    # Sauvegarde puis relecture : l'index entraîné doit répondre à l'identique.
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f"{kind}.faiss")
+        ann_index.save_index(index, path)
+        reloaded = ann_index.load_index(path)
+        _, reloaded_ids = reloaded.search(queries[:20], k)
+        reload_ok = bool(np.array_equal(reloaded_ids, found[:20]))
+
+    return {
+        "type": kind,
+        "recall_at_k": float(recall),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "bytes_per_vector": ann_index.index_bytes(index) / len(data),
+        "build_s": build_s,
+        "reload_ok": reload_ok
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rappel, latence et taille des index de la mémoire FAISS.")
+    parser.add_argument("--vectors", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=384, help="dimension (384 pour le modèle d'embedding par défaut)")
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--latent-dim", type=int, default=32, help="dimension intrinsèque des données")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--types", default="flat,hnsw,int8,ivfpq")
+    parser.add_argument("--json", dest="json_path", default=None, help="écrit les résultats dans ce fichier")
+    args = parser.parse_args(argv)
+
+    data = synthetic_vectors(args.vectors, args.dim, args.clusters, args.latent_dim)
+    # Requêtes : variations bruitées de vecteurs existants.
+    rng = np.random.default_rng(1)
+    queries = data[rng.integers(0, len(data), args.queries)] + 0.3 * rng.standard_normal((args.queries, args.dim)).astype(np.float32) / np.sqrt(args.dim)
+    queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+    # Vérité terrain : recherche exacte par produit scalaire.
+    scores = queries @ data.T
+    truth = np.argsort(-scores, axis=1)[:, :args.k]
+
+    print(f"{args.vectors} vecteurs de dimension {args.dim}, {args.queries} requêtes, k={args.k}")
+    print(f"{'index':>6} {'rappel@k':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'octets/vect':>12} {'constr. (s)':>12} {'relecture':>10}")
+    reports = []
+    for kind in [t.strip() for t in args.types.split(",") if t.strip()]:
+        report = bench_type(kind, data, queries, truth, args.k)
+        reports.append(report)
+        print(
+            f"{kind:>6} {report['recall_at_k']:>9.1%} {report['p50_ms']:>9.3f} {report['p99_ms']:>9.3f} "
+            f"{report['bytes_per_vector']:>12.1f} {report['build_s']:>12.2f} {'ok' if report['reload_ok'] else 'ÉCART':>10}"
+        )
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Banc du serveur d'embeddings partagé (src/memory/embedding_server.py).
+
+P processus envoient chacun R requêtes de T textes (comme des scènes ajoutées
+à la mémoire), dans deux configurations :
+- "local" : chaque processus charge son propre modèle d'embedding
+- "server" : un seul modèle, dans un serveur qui regroupe les requêtes
+Le banc affiche le débit (textes/s), la mémoire résidente totale et, pour
+le serveur, le nombre moyen de textes par appel au modèle.
+
+Usage :
+    python -m bench.embedding_server --processes 4 --requests 50 --texts 2
+    python -m bench.embedding_server --modes server --socket /tmp/bench_embeddings.sock
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from bench.load_test import RssSampler
+
+
+def _text(worker: int, i: int, j: int) -> str:
+    return f"Scène {i} du joueur {worker} : le vent se lève sur la forêt, indice numéro {j}."
+
+
+def _client(worker: int, requests: int, texts: int, address, barrier, rss) -> None:
+    if address is None:
+        from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
+        embeddings = FastEmbedEmbeddings()
+    else:
+        from src.memory.embedding_server import RemoteEmbeddings
+        embeddings = RemoteEmbeddings(address)
+
+    # Tous les processus commencent ensemble, modèle chargé.
+    barrier.wait()
+    with RssSampler() as sampler:
+        for i in range(requests):
+            embeddings.embed_documents([_text(worker, i, j) for j in range(texts)])
+    rss.put(sampler.peak_mb)
+
+
+def run_mode(mode: str, processes: int, requests: int, texts: int, address: str) -> dict:
+    """
+    Lance les processus clients et mesure le débit de la configuration.
+    """
+    server = None
+    if mode == "server":
+        from src.memory.embedding_server import EmbeddingServer
+        server = EmbeddingServer(address)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    barrier = multiprocessing.Barrier(processes + 1)
+    rss = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(
+            target=_client, args=(w, requests, texts, address if server else None, barrier, rss)
+        )
+        for w in range(processes)
+    ]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    started = time.perf_counter()
+    with RssSampler() as server_rss:
+        for w in workers:
+            w.join()
+    elapsed = time.perf_counter() - started
+
+    total = processes * requests * texts
+    report = {
+        "mode": mode,
+        "texts": total,
+        "elapsed_s": elapsed,
+        "texts_per_s": total / elapsed if elapsed else 0.0,
+        # Somme des pics des clients, plus le serveur (ce processus) s'il y en a un.
+        "rss_mb": sum(rss.get() for _ in workers) + (server_rss.peak_mb if server else 0.0)
+    }
+    if server is not None:
+        report["texts_per_batch"] = server.stats()["texts_per_batch"]
+        server.close()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serveur d'embeddings partagé contre un modèle par processus.")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=50, help="requêtes par processus")
+    parser.add_argument("--texts", type=int, default=2, help="textes par requête")
+    parser.add_argument("--modes", default="local,server")
+    parser.add_argument("--socket", default=None, help="socket du serveur (par défaut : fichier temporaire)")
+    parser.add_argument("--json", dest="json_path", default=None, help="écrit les résultats dans ce fichier")
+    args = parser.parse_args(argv)
+
+    address = args.socket or os.path.join(tempfile.mkdtemp(), "embeddings.sock")
+    print(f"{args.processes} processus, {args.requests} requêtes de {args.texts} textes chacun")
+    print(f"{'mode':>7} {'textes/s':>10} {'RSS (Mo)':>10} {'textes/lot':>11}")
+    reports = []
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        report = run_mode(mode, args.processes, args.requests, args.texts, address)
+        reports.append(report)
+        per_batch = f"{report['texts_per_batch']:>11.1f}" if "texts_per_batch" in report else f"{'-':>11}"
+        print(f"{mode:>7} {report['texts_per_s']:>10.1f} {report['rss_mb']:>10.1f} {per_batch}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Banc de charge : plusieurs joueurs virtuels simultanés contre le moteur.
+
+Chaque joueur virtuel lance start_story puis enchaîne des next_step
+(choix proposé par la scène, ou action scriptée). Les appels au modèle
+partent vers un faux serveur Ollama local (bench/stub_ollama.py) : on mesure
+le moteur lui-même (mémoire vectorielle, embeddings, RAG, HTTP), pas le GPU.
+
+Usage :
+    python -m bench.load_test --levels 1,2,4,8 --turns 5
+    python -m bench.load_test --mode processes --levels 2,4 --delay 0.05
+    python -m bench.load_test --ollama http://127.0.0.1:11434   # vrai serveur
+
+Pour chaque niveau de concurrence, le banc affiche le débit (tours/s),
+les latences p50/p99 d'un tour, le pic de mémoire résidente et le taux d'erreurs.
+La mémoire résidente est relevée pendant le niveau (processus du banc, plus
+ses processus enfants en mode processes) : chaque niveau a son propre pic.
+"""
+import argparse
+import contextlib
+import json
+import math
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Optional
+
+# Actions utilisées quand la scène ne propose aucun choix.
+SCRIPTED_ACTIONS = [
+    "J'examine les environs avec attention.",
+    "Je parle au voyageur près du feu.",
+    "Je suis le sentier vers la forêt.",
+    "Je fouille le coffre abandonné.",
+    "Je me dirige vers le port."
+]
+
+# Délai entre deux relevés de la mémoire résidente pendant un niveau (s).
+RSS_SAMPLE_INTERVAL_S = 0.05
+
+
+def percentile(values, p):
+    """
+    Percentile p (entre 0 et 100) d'une liste de valeurs, par rang le plus proche.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = math.ceil(p / 100 * len(ordered))
+    return ordered[min(len(ordered), max(1, rank)) - 1]
+
+
+def current_rss_mb(pid: Optional[int] = None) -> float:
+    """
+    Mémoire résidente actuelle (Mo) d'un processus, le processus courant par
+    défaut : lue dans /proc, sinon avec psutil s'il est installé ; 0 si elle
+    ne peut pas être lue (processus disparu…).
+    """
+    try:
+        with open(f"/proc/{pid or 'self'}/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss / (1024 * 1024)
+    except Exception:
+        # psutil absent, ou processus déjà terminé.
+        return 0.0
+
+
+class RssSampler:
+    """
+    Relève la mémoire résidente actuelle à intervalle régulier, dans un thread,
+    le temps d'un bloc `with`, et en garde le maximum (attribut peak_mb).
+
+    C'est la seule mesure de pic des bancs : contrairement à ru_maxrss (pic sur
+    toute la vie du processus), elle ne concerne que le bloc, et un niveau
+    n'hérite pas du pic du précédent.
+    """
+
+    def __init__(self, children: bool = False, interval: float = RSS_SAMPLE_INTERVAL_S):
+        """
+        Paramètres :
+            children (bool) : ajoute la mémoire des processus enfants vivants.
+            interval (float) : délai entre deux relevés (s).
+        """
+        self.children = children
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="rss-sampler", daemon=True)
+
+    def sample(self) -> float:
+        rss = current_rss_mb()
+        if self.children:
+            rss += sum(current_rss_mb(child.pid) for child in multiprocessing.active_children())
+        self.peak_mb = max(self.peak_mb, rss)
+        return rss
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self) -> "RssSampler":
+        self.sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+
+def play_session(player: int, turns: int, theme: str = "fantasy") -> dict:
+    """
+    Joue une partie scriptée et mesure la durée de chaque tour.
+
+    Retour :
+        dict : latences des tours (s), durée de démarrage et erreurs rencontrées.
+    """
+    # Import tardif : en mode processus, chaque processus charge son propre moteur.
+    from src.engine.orchestrator import start_story, next_step
+
+    result = {"player": player, "start": None, "latencies": [], "errors": []}
+    try:
+        started = time.perf_counter()
+        data = start_story(theme=theme)
+        result["start"] = time.perf_counter() - started
+    except Exception:
+        result["errors"].append(traceback.format_exc(limit=3))
+        return result
+
+    codex, state, scene = data["codex"], data["state"], data["scene"]
+    for turn in range(turns):
+        choices = scene.get("choices") or []
+        action = choices[(player + turn) % len(choices)] if choices else SCRIPTED_ACTIONS[turn % len(SCRIPTED_ACTIONS)]
+        try:
+            started = time.perf_counter()
+            scene, state = next_step(user_input=action, codex=codex, state=state)
+            result["latencies"].append(time.perf_counter() - started)
+        except Exception:
+            result["errors"].append(traceback.format_exc(limit=3))
+
+    return result
+
+
+def _run_session(args):
+    return play_session(*args)
+
+
+def _silence_worker():
+    # Le moteur écrit beaucoup dans la console : on fait taire chaque processus.
+    sys.stdout = open(os.devnull, "w")
+
+
+def run_level(concurrency: int, turns: int, mode: str) -> dict:
+    """
+    Lance `concurrency` joueurs en parallèle et agrège leurs mesures.
+    """
+    jobs = [(player, turns) for player in range(concurrency)]
+    if mode == "processes":
+        executor = ProcessPoolExecutor(max_workers=concurrency, initializer=_silence_worker)
+    else:
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    # La console est coupée pour toute la durée du niveau (et non thread par
+    # thread : sys.stdout est partagé par tous les threads).
+    # Le relevé de mémoire s'arrête après l'arrêt des processus du pool.
+    started = time.perf_counter()
+    with RssSampler(children=(mode == "processes")) as rss:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), executor:
+            results = list(executor.map(_run_session, jobs))
+    elapsed = time.perf_counter() - started
+
+    latencies = [lat for r in results for lat in r["latencies"]]
+    errors = [e for r in results for e in r["errors"]]
+    attempted = concurrency * turns
+
+    return {
+        "concurrency": concurrency,
+        "turns": len(latencies),
+        "elapsed_s": elapsed,
+        "throughput_tps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_s": percentile(latencies, 50),
+        "p99_s": percentile(latencies, 99),
+        "start_p50_s": percentile([r["start"] for r in results if r["start"] is not None], 50),
+        "peak_rss_mb": rss.peak_mb,
+        "error_rate": len(errors) / attempted if attempted else 0.0,
+        "first_error": errors[0] if errors else None
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banc de charge multi-joueurs du moteur narratif.")
+    parser.add_argument("--levels", default="1,2,4,8", help="niveaux de concurrence, séparés par des virgules")
+    parser.add_argument("--turns", type=int, default=5, help="tours joués par joueur virtuel")
+    parser.add_argument("--mode", choices=["threads", "processes"], default="threads")
+    parser.add_argument("--delay", type=float, default=0.0, help="latence simulée du faux modèle (s)")
+    parser.add_argument("--ollama", default=None, help="adresse d'un vrai serveur Ollama (sinon faux serveur local)")
+    parser.add_argument("--json", dest="json_path", default=None, help="écrit les résultats dans ce fichier")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.ollama:
+        os.environ["OLLAMA_HOST"] = args.ollama
+    else:
+        from bench.stub_ollama import start_stub_server
+        server, url = start_stub_server(first_token_delay=args.delay)
+        os.environ["OLLAMA_HOST"] = url
+
+    print(f"{'joueurs':>8} {'tours':>6} {'tours/s':>8} {'p50 (s)':>8} {'p99 (s)':>8} {'RSS (Mo)':>9} {'erreurs':>8}")
+    reports = []
+    for level in [int(x) for x in args.levels.split(",") if x.strip()]:
+        report = run_level(level, args.turns, args.mode)
+        reports.append(report)
+        print(
+            f"{report['concurrency']:>8} {report['turns']:>6} {report['throughput_tps']:>8.2f} "
+            f"{report['p50_s']:>8.3f} {report['p99_s']:>8.3f} {report['peak_rss_mb']:>9.1f} "
+            f"{report['error_rate']:>8.1%}"
+        )
+        if report["first_error"]:
+            print(report["first_error"], file=sys.stderr)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Banc de qualité de la compaction de la mémoire longue.
+
+Une campagne scriptée est jouée directement contre la mémoire "flat" :
+chaque scène contient un fait unique (un objet laissé dans un lieu), et le
+milestone avance régulièrement. On mesure ensuite, pour des faits anciens,
+si la recherche retrouve encore une entrée qui les mentionne (rappel@k),
+sans compaction puis avec compaction.
+
+Usage :
+    python -m bench.memory_compaction --scenes 400 --per-milestone 40
+    python -m bench.memory_compaction --summarizer llm --ollama http://127.0.0.1:11434
+
+Par défaut, les résumés sont extractifs (sans modèle) : le banc mesure la
+politique de compaction elle-même. Avec --summarizer llm, les résumés sont
+écrits par le modèle (vrai serveur Ollama, ou faux serveur local).
+"""
+import argparse
+import json
+import os
+import time
+
+OBJECTS = [
+    "l'amulette", "la dague", "le grimoire", "la lanterne", "le sceau", "la carte",
+    "la clé", "le calice", "la boussole", "le bouclier", "la flûte", "le miroir",
+    "la couronne", "l'anneau", "le parchemin", "la fiole", "le masque", "l'épée",
+    "la plume", "le talisman"
+]
+PLACES = [
+    "au moulin", "sous le vieux pont", "dans la crypte", "près du phare", "à la taverne",
+    "dans la tour d'ivoire", "au bord du lac", "dans la mine abandonnée", "au marché",
+    "dans la chapelle", "sur la falaise", "dans la bibliothèque", "au campement",
+    "dans les marais", "à la forge", "dans le jardin suspendu", "au port",
+    "dans la grotte", "sur la colline", "dans les catacombes"
+]
+PEOPLE = ["Aelwyn", "Maître Orvan", "Lyria", "le passeur", "la reine", "le forgeron", "l'ermite"]
+
+
+def campaign_scene(i: int) -> dict:
+    """
+    Scène i de la campagne scriptée : le fait est dans la première phrase.
+    """
+    obj = OBJECTS[i % len(OBJECTS)]
+    place = PLACES[(i // len(OBJECTS)) % len(PLACES)]
+    person = PEOPLE[i % len(PEOPLE)]
+    return {
+        "text": (
+            f"Tu caches {obj} {place}, sous le regard de {person}. "
+            "La nuit tombe lentement et le vent porte des rumeurs lointaines. "
+            "Tes compagnons reprennent la route sans un mot."
+        ),
+        "query": f"Où ai-je caché {obj} {place} ?",
+        "fact": (obj, place)
+    }
+
+
+def recall_at_k(story_id: str, queries, k: int, skip_recent: int) -> float:
+    """
+    Part des requêtes dont au moins un des k résultats mentionne le fait recherché.
+    """
+    from src.memory.vector_store import search_memory
+
+    hits = 0
+    for query, (obj, place) in queries:
+        results = search_memory(query, k=k, filters={"story_id": story_id}, skip_recent=skip_recent)
+        if any(obj in r["scene_text"] and place in r["scene_text"] for r in results):
+            hits += 1
+    return hits / len(queries) if queries else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Qualité de la recherche après compaction de la mémoire.")
+    parser.add_argument("--scenes", type=int, default=400, help="nombre de scènes de la campagne")
+    parser.add_argument("--per-milestone", type=int, default=40, help="scènes par milestone")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=50, help="faits anciens interrogés")
+    parser.add_argument("--summarizer", choices=["extractive", "llm"], default="extractive")
+    parser.add_argument("--ollama", default=None, help="adresse d'un vrai serveur Ollama (avec --summarizer llm)")
+    parser.add_argument("--json", dest="json_path", default=None, help="écrit le rapport dans ce fichier")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.summarizer == "llm":
+        if args.ollama:
+            os.environ["OLLAMA_HOST"] = args.ollama
+        else:
+            from bench.stub_ollama import start_stub_server
+            server, url = start_stub_server()
+            os.environ["OLLAMA_HOST"] = url
+
+    # Imports tardifs : OLLAMA_HOST doit être fixé avant de charger le moteur.
+    from src.memory import vector_store, compaction
+
+    # La compaction est déclenchée explicitement, pas pendant l'insertion.
+    vector_store.COMPACTION_ENABLED = False
+    summarizer = compaction.summarize_scenes if args.summarizer == "llm" else compaction.extractive_summary
+
+    story_id = f"bench-{int(time.time())}"
+    scenes = [campaign_scene(i) for i in range(args.scenes)]
+    started = time.perf_counter()
+    for i, scene in enumerate(scenes):
+        vector_store.add_scene_to_memory(
+            scene["text"],
+            metadata={"story_id": story_id, "milestone_index": i // args.per_milestone, "flags": {}}
+        )
+    insert_s = time.perf_counter() - started
+
+    # Faits anciens : hors des scènes récentes, que la compaction ne touche pas.
+    old = scenes[:max(0, args.scenes - compaction.KEEP_RECENT)]
+    step = max(1, len(old) // args.queries)
+    queries = [(s["query"], s["fact"]) for s in old[::step][:args.queries]]
+
+    store = vector_store.get_flat_store()
+    report = {
+        "scenes": args.scenes,
+        "summarizer": args.summarizer,
+        "insert_s": insert_s,
+        "entries_before": store.story_count(story_id),
+        "recall_before": recall_at_k(story_id, queries, args.k, skip_recent=0)
+    }
+
+    compaction_report = compaction.compact_story(story_id, store=store, summarizer=summarizer)
+    report.update(
+        entries_after=compaction_report["after"],
+        summaries=compaction_report["summaries"],
+        dropped=compaction_report["dropped"],
+        compaction_s=compaction_report["seconds"],
+        recall_after=recall_at_k(story_id, queries, args.k, skip_recent=0),
+        max_entries=compaction.MAX_ENTRIES_PER_STORY
+    )
+
+    print(f"Entrées : {report['entries_before']} -> {report['entries_after']} "
+          f"(limite {report['max_entries']}, {report['summaries']} résumés, {report['dropped']} supprimées)")
+    print(f"Rappel@{args.k} sur {len(queries)} faits anciens : "
+          f"{report['recall_before']:.1%} -> {report['recall_after']:.1%}")
+    print(f"Compaction : {report['compaction_s']:.2f} s")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
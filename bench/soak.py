@@ -0,0 +1,262 @@
+"""
+Banc d'endurance : une longue campagne jouée d'une traite contre le moteur.
+
+Un seul joueur enchaîne start_story puis des centaines de next_step contre
+le faux serveur Ollama local (bench/stub_ollama.py). À chaque tour, le banc
+relève :
+- la taille des prompts envoyés au modèle (caractères et tokens, d'après le
+  registre de tokens)
+- la mémoire résidente du processus
+- le nombre de vecteurs de l'histoire dans la mémoire longue
+- la taille de l'état de la partie (JSON), qui est aussi ce que garde
+  st.session_state
+- la durée du tour et de chacune de ses étapes
+
+Les défauts de croissance n'apparaissent qu'après une centaine de tours :
+le banc calcule la pente (moindres carrés, par tour) de chaque mesure une fois
+la campagne en régime et échoue (code de sortie 1) si l'une d'elles dépasse
+sa borne. Le régime commence après la seconde moitié de la campagne (--warmup)
+et, avec la mémoire "flat" compactée, jamais avant que la mémoire de
+l'histoire n'atteigne le seuil de compaction : avant, les vecteurs croissent
+d'un par tour, normalement. Pour les mesures d'occupation (RSS, vecteurs,
+état), la pente est celle du pic atteint : la compaction de la mémoire donne
+une courbe en dents de scie, bornée, qui ne doit pas être prise pour une fuite.
+
+Usage :
+    python -m bench.soak --turns 500
+    python -m bench.soak --turns 200 --max-prompt-slope 1 --json soak.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+
+from bench.load_test import SCRIPTED_ACTIONS, current_rss_mb
+
+# Pentes maximales tolérées, par tour, une fois la campagne en régime.
+DEFAULT_BOUNDS = {
+    "prompt_chars": 2.0,
+    "prompt_tokens": 0.5,
+    "rss_mb": 0.05,
+    "vectors": 0.05,
+    "state_bytes": 5.0,
+    "turn_ms": 0.1,
+    "stage_ms": 0.1
+}
+
+# Mesures d'occupation, comparées par leur pic courant.
+PEAK_METRICS = ("rss_mb", "vectors", "state_bytes")
+
+
+def slope(values: List[float]) -> float:
+    """
+    Pente de la droite des moindres carrés passant par les valeurs (par tour).
+    """
+    n = len(values)
+    if n < 2:
+        return 0.0
+    mean_x = (n - 1) / 2
+    mean_y = sum(values) / n
+    num = sum((x - mean_x) * (y - mean_y) for x, y in enumerate(values))
+    den = sum((x - mean_x) ** 2 for x in range(n))
+    return num / den
+
+
+def memory_vectors(story_id: str) -> int:
+    """
+    Nombre de vecteurs de la mémoire longue : ceux de l'histoire avec la
+    mémoire "flat", l'index entier avec la mémoire "faiss".
+    """
+    from src.memory import vector_store
+
+    if vector_store.MEMORY_BACKEND == "flat":
+        return vector_store.get_flat_store().story_count(story_id)
+    return vector_store.get_vectorstore().index.ntotal
+
+
+def steady_start(count: int, warmup: float) -> int:
+    """
+    Premier tour du régime : après la part `warmup` de la campagne, et
+    après le seuil de compaction quand la mémoire "flat" est compactée.
+    """
+    from src.memory import vector_store
+    from src.memory.compaction import COMPACTION_THRESHOLD
+
+    start = int(count * warmup)
+    if vector_store.MEMORY_BACKEND == "flat" and vector_store.COMPACTION_ENABLED:
+        start = max(start, COMPACTION_THRESHOLD + 1)
+    return min(start, count)
+
+
+def play_turn(step, session: str) -> Dict:
+    """
+    Exécute une étape du moteur dans son propre TurnContext et relève
+    les appels au modèle et la durée de chaque étape.
+    """
+    from src.utils.turn_context import TurnContext, turn_context
+    from src.utils.ledger import get_ledger
+
+    turn = TurnContext(session=session)
+    started = time.perf_counter()
+    with turn_context(turn):
+        result = step()
+    elapsed = time.perf_counter() - started
+
+    calls = [r for r in get_ledger().records(session, limit=50) if r["turn"] == turn.turn_id]
+    return {
+        "result": result,
+        "turn_ms": elapsed * 1000,
+        "calls": len(calls),
+        "prompt_chars": sum(r["prompt_chars"] for r in calls),
+        "prompt_tokens": sum(r["prompt_tokens"] for r in calls),
+        "stages_ms": {stage: s * 1000 for stage, s in turn.stage_durations().items()}
+    }
+
+
+def run_campaign(turns: int, theme: str = "fantasy", fused=None, progress_every: int = 50) -> List[Dict]:
+    """
+    Joue la campagne et renvoie une mesure par tour (le tour 0 est start_story).
+    La sortie du moteur (et de la compaction en arrière-plan) est coupée ;
+    seule la progression est affichée.
+    """
+    out = sys.stdout
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return _play_campaign(turns, theme, fused, progress_every, out)
+
+
+def _play_campaign(turns: int, theme: str, fused, progress_every: int, out) -> List[Dict]:
+    from src.engine.orchestrator import start_story, next_step
+
+    session = f"soak-{int(time.time())}"
+    measure = play_turn(lambda: start_story(theme=theme), session)
+    data = measure.pop("result")
+    codex, state, scene = data["codex"], data["state"], data["scene"]
+    story_id = state.get("story_id")
+
+    samples = []
+    for i in range(turns + 1):
+        if i:
+            choices = scene.get("choices") or []
+            action = choices[i % len(choices)] if choices else SCRIPTED_ACTIONS[i % len(SCRIPTED_ACTIONS)]
+            measure = play_turn(
+                lambda: next_step(user_input=action, codex=codex, state=state, fused=fused), session
+            )
+            scene, state = measure.pop("result")
+
+        measure.update(
+            turn=i,
+            rss_mb=current_rss_mb(),
+            vectors=memory_vectors(story_id),
+            state_bytes=len(json.dumps(state, ensure_ascii=False).encode("utf-8")),
+            history=len(state.get("history", []))
+        )
+        samples.append(measure)
+        if progress_every and i % progress_every == 0:
+            print(f"tour {i:>4} : prompt {measure['prompt_chars']:>6} car., RSS {measure['rss_mb']:.1f} Mo, "
+                  f"{measure['vectors']} vecteurs, état {measure['state_bytes']} o, {measure['turn_ms']:.1f} ms", file=out)
+    return samples
+
+
+def growth_report(samples: List[Dict], bounds: Dict[str, float], start: int) -> List[Dict]:
+    """
+    Pente de chaque mesure à partir du tour `start` (voir steady_start),
+    comparée à sa borne. Les étapes du moteur sont comparées à la borne "stage_ms".
+    """
+    steady = samples[start:]
+    series = {key: [s[key] for s in steady] for key in ("prompt_chars", "prompt_tokens", "turn_ms")}
+    for key in PEAK_METRICS:
+        peak = max([s[key] for s in samples[:start]], default=0)
+        series[key] = []
+        for s in steady:
+            peak = max(peak, s[key])
+            series[key].append(peak)
+    stages = sorted({stage for s in steady for stage in s["stages_ms"]})
+    for stage in stages:
+        series[f"{stage}_ms"] = [s["stages_ms"].get(stage, 0.0) for s in steady]
+
+    report = []
+    for key, values in series.items():
+        bound = bounds.get(key, bounds["stage_ms"])
+        value = slope(values)
+        report.append({
+            "metric": key,
+            "first": values[0] if values else 0.0,
+            "last": values[-1] if values else 0.0,
+            "slope": value,
+            "bound": bound,
+            "ok": value <= bound
+        })
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Campagne longue : croissance des prompts, de la mémoire et des latences.")
+    parser.add_argument("--turns", type=int, default=500)
+    parser.add_argument("--theme", default="fantasy")
+    parser.add_argument("--fused", choices=["on", "off"], default=None, help="force le mode tour fusionné")
+    parser.add_argument("--warmup", type=float, default=0.5, help="part de la campagne ignorée pour les pentes (au moins jusqu'au seuil de compaction)")
+    parser.add_argument("--delay", type=float, default=0.0, help="latence simulée du faux modèle (s)")
+    parser.add_argument("--ollama", default=None, help="adresse d'un vrai serveur Ollama (sinon faux serveur local)")
+    parser.add_argument("--max-prompt-slope", type=float, default=DEFAULT_BOUNDS["prompt_chars"], help="caractères de prompt par tour")
+    parser.add_argument("--max-token-slope", type=float, default=DEFAULT_BOUNDS["prompt_tokens"], help="tokens de prompt par tour")
+    parser.add_argument("--max-rss-slope", type=float, default=DEFAULT_BOUNDS["rss_mb"], help="Mo de RSS par tour")
+    parser.add_argument("--max-vectors-slope", type=float, default=DEFAULT_BOUNDS["vectors"], help="vecteurs par tour")
+    parser.add_argument("--max-state-slope", type=float, default=DEFAULT_BOUNDS["state_bytes"], help="octets d'état par tour")
+    parser.add_argument("--max-latency-slope", type=float, default=DEFAULT_BOUNDS["turn_ms"], help="ms par tour (tour et étapes)")
+    parser.add_argument("--json", dest="json_path", default=None, help="écrit les mesures et le bilan dans ce fichier")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.ollama:
+        os.environ["OLLAMA_HOST"] = args.ollama
+    else:
+        from bench.stub_ollama import start_stub_server
+        server, url = start_stub_server(first_token_delay=args.delay)
+        os.environ["OLLAMA_HOST"] = url
+
+    bounds = {
+        "prompt_chars": args.max_prompt_slope,
+        "prompt_tokens": args.max_token_slope,
+        "rss_mb": args.max_rss_slope,
+        "vectors": args.max_vectors_slope,
+        "state_bytes": args.max_state_slope,
+        "turn_ms": args.max_latency_slope,
+        "stage_ms": args.max_latency_slope
+    }
+    fused = {"on": True, "off": False}.get(args.fused)
+
+    started = time.perf_counter()
+    samples = run_campaign(args.turns, args.theme, fused)
+    elapsed = time.perf_counter() - started
+    start = steady_start(len(samples), args.warmup)
+    report = growth_report(samples, bounds, start)
+
+    print(f"{args.turns} tours en {elapsed:.1f} s ; pentes sur les {len(samples) - start} derniers tours")
+    print(f"{'mesure':>16} {'début':>10} {'fin':>10} {'pente/tour':>11} {'borne':>8} {'':>6}")
+    for r in report:
+        print(f"{r['metric']:>16} {r['first']:>10.1f} {r['last']:>10.1f} {r['slope']:>11.3f} "
+              f"{r['bound']:>8.3f} {'ok' if r['ok'] else 'TROP':>6}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"turns": args.turns, "elapsed_s": elapsed, "steady_start": start,
+                       "growth": report, "samples": samples}, f, indent=2)
+
+    if server is not None:
+        server.shutdown()
+
+    if len(samples) - start < 2:
+        print(f"Campagne trop courte : le régime commence au tour {start}.", file=sys.stderr)
+        sys.exit(1)
+
+    failed = [r["metric"] for r in report if not r["ok"]]
+    if failed:
+        print("Croissance hors bornes : " + ", ".join(failed), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Faux serveur Ollama pour les bancs d'essai.
+
+Il répond à POST /api/chat en streaming (une ligne JSON par fragment, puis
+un enregistrement final "done" avec les statistiques), comme Ollama.
+L'option num_predict coupe la réponse (environ 4 caractères par token),
+avec done_reason "length".
+La réponse dépend du rôle de l'appel, reconnu à son message système :
+codex, classification d'intention, scène, auto-continue, tour fusionné.
+
+Usage autonome :
+    python -m bench.stub_ollama --port 11435 --delay 0.2
+    OLLAMA_HOST=http://127.0.0.1:11435 streamlit run app.py
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CODEX = {
+    "pitch": "Un royaume brisé cherche la Couronne d'Aube.",
+    "univers": "Des forêts anciennes, des cités de cristal et des marais oubliés.",
+    "personnages": ["Aelwyn la Vagabonde", "Maître Orvan", "Lyria Vent-Argent"],
+    "lieux": ["Forêt Murmurante", "Port des Brumes", "Cité de Luneclaire"],
+    "milestones": ["Quitter le village", "Trouver la carte", "Traverser le marais", "Rejoindre la cité"]
+}
+
+_counter = itertools.count()
+
+
+def _scene(n: int) -> dict:
+    return {
+        "scene_text": (
+            f"Scène {n}. Le vent se lève sur la Forêt Murmurante tandis qu'Aelwyn "
+            "examine les traces laissées dans la boue. Au loin, le Port des Brumes s'illumine."
+        ),
+        "choices": ["Suivre les traces", "Rejoindre le port", "Interroger Maître Orvan"],
+        "consequences": {
+            "milestone_progress": n % 10 == 0,
+            "flags": {f"indice_{n % 5}": True},
+            "inventory_add": ["torche"] if n % 7 == 0 else []
+        }
+    }
+
+
+def build_reply(payload: dict) -> str:
+    """
+    Choisit la réponse à renvoyer selon le type d'appel.
+    """
+    messages = payload.get("messages", [])
+    system = messages[0]["content"] if messages else ""
+    n = next(_counter)
+
+    if isinstance(payload.get("format"), dict) and "intent" in payload["format"].get("properties", {}):
+        turn = dict(_scene(n), intent="IN_GAME", auto_continue=False)
+        return json.dumps(turn, ensure_ascii=False)
+    if "agent ReAct" in system:
+        return "Thought: le joueur agit dans l'histoire.\nAction: classify\nFinal Answer: IN_GAME"
+    if "agent de décision" in system:
+        return "WAIT_FOR_PLAYER"
+    if "narration interactive" in system:
+        return json.dumps(CODEX, ensure_ascii=False)
+    if "complètes des scènes" in system:
+        return json.dumps({"choices": ["Continuer"]}, ensure_ascii=False)
+    if "résumes" in system:
+        return "Résumé : le héros a exploré la forêt et trouvé plusieurs indices."
+    return json.dumps(_scene(n), ensure_ascii=False)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Comme Ollama : HTTP/1.1, un fragment HTTP (chunked) par ligne du flux.
+    protocol_version = "HTTP/1.1"
+
+    # Latence simulée : délai avant le premier fragment, puis entre fragments.
+    first_token_delay = 0.0
+    chunk_delay = 0.0
+    chunk_size = 16
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            # Connexion fermée par le client (annulation, délai dépassé).
+            pass
+
+    def _send_line(self, record: dict):
+        data = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+
+        started = time.perf_counter()
+        reply = build_reply(payload)
+        done_reason = "stop"
+        num_predict = (payload.get("options") or {}).get("num_predict")
+        if num_predict is not None and 0 <= num_predict and len(reply) > num_predict * 4:
+            reply = reply[:num_predict * 4]
+            done_reason = "length"
+        prompt_chars = sum(len(m.get("content", "")) for m in payload.get("messages", []))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        time.sleep(self.first_token_delay)
+        try:
+            for i in range(0, len(reply), self.chunk_size):
+                chunk = {"message": {"role": "assistant", "content": reply[i:i + self.chunk_size]}, "done": False}
+                self._send_line(chunk)
+                if self.chunk_delay:
+                    time.sleep(self.chunk_delay)
+
+            # Enregistrement final avec des statistiques au format d'Ollama (nanosecondes).
+            elapsed = int((time.perf_counter() - started) * 1e9)
+            final = {
+                "message": {"role": "assistant", "content": ""},
+                "done": True,
+                "done_reason": done_reason,
+                "total_duration": elapsed,
+                "load_duration": 0,
+                "prompt_eval_count": prompt_chars // 4,
+                "prompt_eval_duration": int(self.first_token_delay * 1e9),
+                "eval_count": max(1, len(reply) // 4),
+                "eval_duration": max(1, elapsed - int(self.first_token_delay * 1e9))
+            }
+            self._send_line(final)
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # Le client a fermé le flux (annulation) : rien d'autre à faire.
+            pass
+
+
+def start_stub_server(port: int = 0, first_token_delay: float = 0.0, chunk_delay: float = 0.0):
+    """
+    Démarre le faux serveur dans un thread.
+
+    Paramètres :
+        port (int) : port d'écoute (0 = port libre choisi par le système).
+        first_token_delay (float) : délai simulé avant le premier fragment, en secondes.
+        chunk_delay (float) : délai simulé entre deux fragments, en secondes.
+
+    Retour :
+        (server, url) : le serveur (server.shutdown() pour l'arrêter) et son adresse.
+    """
+    handler = type("ConfiguredStubHandler", (StubHandler,), {
+        "first_token_delay": first_token_delay,
+        "chunk_delay": chunk_delay
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Faux serveur Ollama pour les bancs d'essai.")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--delay", type=float, default=0.0, help="délai avant le premier fragment (s)")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="délai entre fragments (s)")
+    args = parser.parse_args()
+
+    server, url = start_stub_server(args.port, args.delay, args.chunk_delay)
+    print("Faux serveur Ollama :", url)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,13 @@
 from src.utils.ollama_client import ollama_chat
+from src.engine.state import prompt_state
 
 # Modèle utilisé pour décider si l'histoire doit avancer automatiquement.
 MODEL_NAME = "mistral"
 
+# Limites de l'appel : la réponse attendue est un seul mot.
+AUTO_CONTINUE_DEADLINE_S = 20.0
+AUTO_CONTINUE_MAX_TOKENS = 30
+
 
 def should_auto_continue(scene: dict, state: dict, codex: dict) -> str:
     """
@@ -42,7 +47,7 @@ def should_auto_continue(scene: dict, state: dict, codex: dict) -> str:
 
     Données :
     Scène : {scene}
-    État : {state}
+    État : {prompt_state(state)}
     Codex : {codex}
 
     Réponds uniquement par :
@@ -57,7 +62,10 @@ def should_auto_continue(scene: dict, state: dict, codex: dict) -> str:
         [
             {"role": "system", "content": "Tu es un agent de décision narratif."},
             {"role": "user", "content": prompt}
-        ]
+        ],
+        stage="auto_continue",
+        deadline=AUTO_CONTINUE_DEADLINE_S,
+        max_tokens=AUTO_CONTINUE_MAX_TOKENS
     )
 
     # On nettoie la réponse et on la met en majuscules pour simplifier la détection.
@@ -0,0 +1,104 @@
+import threading
+import time
+from typing import Dict, Any, Optional
+
+# Temps maximal d'un clic du joueur (en secondes) : au-delà, aucune scène
+# de transition n'est plus enchaînée et le joueur reprend la main.
+CLICK_BUDGET_S = 45.0
+
+# Nombre maximal de scènes enchaînées par clic, même si le budget le permet.
+MAX_CHAINED_STEPS = 3
+
+# Durée estimée d'une étape tant qu'aucune n'a été mesurée.
+DEFAULT_STEP_S = 15.0
+
+# Poids d'une nouvelle mesure dans la moyenne glissante des durées d'étape.
+STEP_TIME_ALPHA = 0.3
+
+# Durées d'étape mesurées, par mode ("fused" ou "pipeline"), partagées par
+# toutes les sessions du processus : elles dépendent surtout du serveur Ollama.
+_step_times: Dict[str, float] = {}
+_lock = threading.Lock()
+
+
+def record_step_time(mode: str, seconds: float):
+    """
+    Ajoute la durée mesurée d'une étape à la moyenne glissante de son mode.
+    """
+    with _lock:
+        previous = _step_times.get(mode)
+        if previous is None:
+            _step_times[mode] = seconds
+        else:
+            _step_times[mode] = (1 - STEP_TIME_ALPHA) * previous + STEP_TIME_ALPHA * seconds
+
+
+def estimated_step_time(mode: str) -> float:
+    """
+    Durée attendue de la prochaine étape de ce mode, d'après les mesures.
+    """
+    with _lock:
+        return _step_times.get(mode, DEFAULT_STEP_S)
+
+
+class AutoContinueBudget:
+    """
+    Budget de temps d'un clic du joueur.
+
+    Le moteur enchaîne des scènes de transition tant que la scène suivante,
+    d'après la durée mesurée des étapes précédentes, tient dans le temps
+    restant (et dans la limite de MAX_CHAINED_STEPS). Sinon, la main
+    revient au joueur.
+    """
+
+    def __init__(self, budget_s: float = CLICK_BUDGET_S, max_steps: int = MAX_CHAINED_STEPS):
+        """
+        Paramètres :
+            budget_s (float) : temps maximal du clic, en secondes.
+            max_steps (int) : nombre maximal de scènes enchaînées.
+        """
+        self.budget_s = budget_s
+        self.max_steps = max_steps
+        self.started = time.perf_counter()
+        self.chained_steps = 0
+        self.stopped_by: Optional[str] = None
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def allows_another(self, mode: str) -> bool:
+        """
+        Indique si une scène de plus peut être enchaînée dans ce clic.
+        La raison d'un refus ("max_steps" ou "budget") est conservée.
+        """
+        if self.chained_steps >= self.max_steps:
+            self.stopped_by = "max_steps"
+            return False
+        if self.elapsed() + estimated_step_time(mode) > self.budget_s:
+            self.stopped_by = "budget"
+            return False
+        self.stopped_by = None
+        return True
+
+    def chain(self):
+        """
+        Décompte une scène enchaînée, avant de la générer.
+        """
+        self.chained_steps += 1
+
+    def record_step(self, mode: str, seconds: float):
+        """
+        Enregistre la durée d'une étape terminée, qui alimente l'estimation.
+        """
+        record_step_time(mode, seconds)
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Bilan du clic : scènes enchaînées, temps écoulé et raison de l'arrêt.
+        """
+        return {
+            "chained_steps": self.chained_steps,
+            "elapsed_s": self.elapsed(),
+            "budget_s": self.budget_s,
+            "stopped_by": self.stopped_by
+        }
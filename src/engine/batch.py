@@ -0,0 +1,233 @@
+"""
+Génération d'histoires en lot, sans interface.
+
+Chaque ligne du manifeste (JSONL) décrit une histoire à jouer :
+    {"id": "foret-1", "theme": "fantasy", "seed": 42, "turns": 6,
+     "choices": ["J'entre dans la forêt.", "Je suis la rivière."]}
+
+- theme : thème passé à start_story (par défaut "fantasy")
+- seed : graine transmise à Ollama et au choix automatique des actions
+- choices : actions jouées dans l'ordre ; au-delà, l'action est tirée
+  parmi les choix proposés par la scène
+- turns : nombre de tours joués (par défaut : le nombre de choix scriptés,
+  ou DEFAULT_TURNS)
+- fused : force ou désactive le mode tour fusionné
+
+Les histoires sont réparties sur un pool de processus (un modèle d'embedding
+chargé par processus) ; un sémaphore partagé limite le nombre d'appels
+simultanés à Ollama. Chaque histoire terminée est écrite aussitôt dans le
+fichier de résultats (JSONL), avec ses durées.
+
+Usage :
+    python -m src.engine.batch manifeste.jsonl --out resultats.jsonl
+    python -m src.engine.batch manifeste.jsonl --workers 4 --ollama-concurrency 2
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Any, List
+
+# Nombre de tours joués quand le manifeste ne le précise pas.
+DEFAULT_TURNS = 5
+
+# Action jouée quand la scène ne propose aucun choix.
+DEFAULT_ACTION = "Je continue mon chemin."
+
+
+def load_manifest(path: str) -> List[Dict[str, Any]]:
+    """
+    Lit le manifeste : une histoire par ligne (JSONL), lignes vides ignorées.
+    Les histoires sans identifiant reçoivent leur numéro de ligne.
+    """
+    stories = []
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                story = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}, ligne {number} : JSON invalide ({e})")
+            if not isinstance(story, dict):
+                raise ValueError(f"{path}, ligne {number} : un objet JSON est attendu.")
+            story.setdefault("id", str(number))
+            stories.append(story)
+    return stories
+
+
+def pick_action(spec: Dict[str, Any], turn: int, scene: Dict[str, Any], rng: random.Random) -> str:
+    """
+    Action du joueur pour un tour : choix scripté s'il y en a un,
+    sinon un des choix proposés par la scène, tiré avec la graine de l'histoire.
+    """
+    scripted = spec.get("choices") or []
+    if turn < len(scripted):
+        return scripted[turn]
+    choices = scene.get("choices") or []
+    return rng.choice(choices) if choices else DEFAULT_ACTION
+
+
+def run_story(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Joue une histoire du manifeste et mesure chaque étape.
+
+    Retour :
+        dict : résultat prêt à être écrit en JSONL (scènes, état final,
+               durées, tokens consommés, erreur éventuelle).
+    """
+    # Imports tardifs : chaque processus du pool charge son propre moteur.
+    from src.engine.orchestrator import start_story, next_step
+    from src.utils.ollama_client import generation_options
+    from src.utils.turn_context import TurnContext, turn_context
+    from src.utils.ledger import get_ledger
+
+    seed = spec.get("seed")
+    rng = random.Random(seed)
+    options = {"seed": seed} if seed is not None else {}
+    turns = spec.get("turns", len(spec.get("choices") or []) or DEFAULT_TURNS)
+    session = f"batch-{spec['id']}-{os.getpid()}"
+
+    result = {
+        "id": spec["id"],
+        "theme": spec.get("theme", "fantasy"),
+        "seed": seed,
+        "status": "ok",
+        "worker": os.getpid(),
+        "scenes": [],
+        "timing": {"start_s": None, "turns_s": []}
+    }
+    started = time.perf_counter()
+    try:
+        with turn_context(TurnContext(session=session)), generation_options(**options):
+            step_started = time.perf_counter()
+            data = start_story(theme=result["theme"])
+            result["timing"]["start_s"] = time.perf_counter() - step_started
+
+            codex, state, scene = data["codex"], data["state"], data["scene"]
+            result["story_id"] = state.get("story_id")
+            result["codex"] = codex
+            result["scenes"].append({"turn": 0, "action": None, **scene})
+
+            for turn in range(turns):
+                action = pick_action(spec, turn, scene, rng)
+                step_started = time.perf_counter()
+                scene, state = next_step(user_input=action, codex=codex, state=state, fused=spec.get("fused"))
+                result["timing"]["turns_s"].append(time.perf_counter() - step_started)
+                result["scenes"].append({"turn": turn + 1, "action": action, **scene})
+    except Exception:
+        result["status"] = "error"
+        result["error"] = traceback.format_exc(limit=5)
+    else:
+        result["state"] = {k: v for k, v in state.items() if k != "history"}
+
+    result["timing"]["total_s"] = time.perf_counter() - started
+    summary = get_ledger().summary(session)
+    result["tokens"] = {
+        "calls": summary["calls"],
+        "prompt_tokens": summary["prompt_tokens"],
+        "eval_tokens": summary["eval_tokens"],
+        "wall_s_by_stage": {str(stage): s["wall_s"] for stage, s in summary["by_stage"].items()}
+    }
+    return result
+
+
+def _init_worker(slots, verbose: bool):
+    # Un processus du pool : limite d'appels partagée, modèle d'embedding
+    # chargé une fois avant la première histoire.
+    from src.utils.ollama_client import limit_concurrency
+    from src.memory.embeddings import get_embeddings
+
+    if not verbose:
+        # Le moteur écrit beaucoup dans la console.
+        sys.stdout = open(os.devnull, "w")
+    limit_concurrency(slots)
+    get_embeddings()
+
+
+def run_batch(
+    stories: List[Dict[str, Any]],
+    out_path: str,
+    workers: int = 2,
+    ollama_concurrency: int = 2,
+    verbose: bool = False
+) -> Dict[str, Any]:
+    """
+    Joue toutes les histoires du manifeste sur un pool de processus et écrit
+    chaque résultat dans `out_path` dès qu'il est disponible.
+
+    Paramètres :
+        stories (list[dict]) : histoires du manifeste (voir load_manifest).
+        out_path (str) : fichier JSONL de sortie (complété s'il existe).
+        workers (int) : nombre de processus.
+        ollama_concurrency (int) : appels simultanés maximum à Ollama, tous processus confondus.
+        verbose (bool) : laisse les processus écrire dans la console.
+
+    Retour :
+        dict : bilan (histoires réussies, en erreur, durée, débit).
+    """
+    slots = multiprocessing.Semaphore(ollama_concurrency)
+    report = {"stories": len(stories), "ok": 0, "errors": 0, "story_s": []}
+
+    started = time.perf_counter()
+    with open(out_path, "a", encoding="utf-8") as out, ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(slots, verbose)
+    ) as executor:
+        futures = {executor.submit(run_story, spec): spec for spec in stories}
+        for future in as_completed(futures):
+            spec = futures[future]
+            try:
+                result = future.result()
+            except Exception:
+                # Processus du pool tombé : l'histoire est notée en erreur.
+                result = {"id": spec["id"], "status": "error", "error": traceback.format_exc(limit=5)}
+
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+
+            if result["status"] == "ok":
+                report["ok"] += 1
+                report["story_s"].append(result["timing"]["total_s"])
+            else:
+                report["errors"] += 1
+            print(f"[{report['ok'] + report['errors']}/{len(stories)}] {result['id']} : {result['status']}"
+                  + (f" ({result['timing']['total_s']:.1f} s)" if result["status"] == "ok" else ""))
+
+    report["elapsed_s"] = time.perf_counter() - started
+    report["stories_per_min"] = 60 * report["ok"] / report["elapsed_s"] if report["elapsed_s"] else 0.0
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Génération d'histoires en lot, sans interface.")
+    parser.add_argument("manifest", help="manifeste JSONL (une histoire par ligne)")
+    parser.add_argument("--out", default="batch_results.jsonl", help="fichier JSONL des résultats")
+    parser.add_argument("--workers", type=int, default=2, help="nombre de processus")
+    parser.add_argument("--ollama-concurrency", type=int, default=2, help="appels simultanés maximum à Ollama")
+    parser.add_argument("--ollama", default=None, help="adresse du serveur Ollama (sinon OLLAMA_HOST)")
+    parser.add_argument("--verbose", action="store_true", help="affiche la sortie du moteur")
+    args = parser.parse_args(argv)
+
+    if args.ollama:
+        # Transmis aux processus du pool, qui importent le client après coup.
+        os.environ["OLLAMA_HOST"] = args.ollama
+
+    stories = load_manifest(args.manifest)
+    report = run_batch(stories, args.out, args.workers, args.ollama_concurrency, args.verbose)
+
+    print(f"{report['ok']}/{report['stories']} histoires en {report['elapsed_s']:.1f} s "
+          f"({report['stories_per_min']:.1f} histoires/min, {report['errors']} en erreur)")
+    if report["story_s"]:
+        print(f"Durée d'une histoire : médiane {statistics.median(report['story_s']):.1f} s, "
+              f"max {max(report['story_s']):.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,13 @@
-import json
 from src.utils.ollama_client import ollama_chat
+from src.utils.json_repair import parse_json_lenient
 
 MODEL_NAME = "mistral"
 
+# Limites de l'appel : un codex complet tient largement en 900 tokens.
+# Un codex coupé est complété par le décodage tolérant.
+CODEX_DEADLINE_S = 120.0
+CODEX_MAX_TOKENS = 900
+
 
 def generate_codex(theme: str = "fantasy"):
     """
@@ -52,28 +57,18 @@ Le thème est : "{theme}".
         [
             {"role": "system", "content": "Tu es un assistant expert en narration interactive. Réponds uniquement en JSON strict."},
             {"role": "user", "content": prompt}
-        ]
+        ],
+        stage="codex",
+        deadline=CODEX_DEADLINE_S,
+        max_tokens=CODEX_MAX_TOKENS
     )
 
-    # Nettoyage minimal de la réponse brute.
-    cleaned = raw.strip()
-
-    # Certains modèles renvoient un bloc markdown ```json ... ```
-    if cleaned.startswith("```"):
-        cleaned = cleaned.split("```")[1]
-        cleaned = cleaned.replace("json", "").strip()
-
-    # Parfois, le modèle ajoute une phrase avant le JSON.
-    # On cherche la première accolade ouvrante.
-    if not cleaned.startswith("{"):
-        idx = cleaned.find("{")
-        if idx != -1:
-            cleaned = cleaned[idx:]
-
-    # Tentative de parsing JSON.
-    try:
-        codex = json.loads(cleaned)
-    except Exception:
+    # Décodage tolérant : bloc markdown, phrase avant le JSON, virgules
+    # en trop ou réponse coupée sont corrigés localement.
+    codex, status = parse_json_lenient(raw)
+    if status == "repaired":
+        print("JSON du codex corrigé localement.")
+    if not isinstance(codex, dict):
         print("Erreur JSON dans generate_codex. Réponse brute :", raw)
         codex = {
             "pitch": "Erreur de génération.",
@@ -0,0 +1,343 @@
+import copy
+import threading
+import unicodedata
+from collections import OrderedDict, deque
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from src.utils.turn_context import current_turn
+
+# Nombre de tours pendant lesquels une entité mentionnée reste "active".
+ACTIVE_WINDOW = 5
+
+# Nombre maximum d'entités actives transmises au modèle.
+MAX_ACTIVE = 8
+
+# Nombre de scènes récentes relues quand le suivi est reconstruit (reprise de partie).
+REBUILD_SCENES = 5
+
+# Nombre maximum d'histoires dont le suivi reste en mémoire ; au-delà, le
+# suivi le moins récemment utilisé est oublié et reconstruit s'il resservait.
+MAX_TRACKERS = 64
+
+
+def fold(text: str) -> str:
+    """
+    Minuscules sans accents, caractère par caractère : le texte garde la même
+    longueur, ce qui permet de vérifier les limites de mots sur le texte plié.
+    """
+    return "".join(unicodedata.normalize("NFD", c)[0].lower() for c in text)
+
+
+class AhoCorasick:
+    """
+    Automate d'Aho-Corasick : trouve toutes les occurrences d'un ensemble
+    de motifs en un seul passage sur le texte, en temps linéaire.
+    """
+
+    def __init__(self, patterns: List[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        self.patterns = patterns
+
+        for index, pattern in enumerate(patterns):
+            node = 0
+            for c in pattern:
+                if c not in self._goto[node]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[node][c] = len(self._goto) - 1
+                node = self._goto[node][c]
+            self._out[node].append(index)
+
+        # Liens d'échec calculés en largeur, niveau par niveau.
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for c, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and c not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(c, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def finditer(self, text: str):
+        """
+        Parcourt le texte et renvoie les occurrences (début, fin, indice du motif).
+        """
+        node = 0
+        for i, c in enumerate(text):
+            while node and c not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(c, 0)
+            for index in self._out[node]:
+                yield i - len(self.patterns[index]) + 1, i + 1, index
+
+
+def _aliases(name: str, kind: str) -> List[str]:
+    """
+    Alias reconnus pour une entité : le nom complet, et pour un personnage
+    son premier mot ("Aelwyn la Vagabonde" -> "Aelwyn").
+    Les lieux ne gardent que leur nom complet ("Forêt" seul serait trop vague).
+    """
+    aliases = [name]
+    first = name.split()[0] if name.split() else ""
+    if kind == "personnage" and len(first) >= 4 and first != name:
+        aliases.append(first)
+    return aliases
+
+
+class EntityTracker:
+    """
+    Suivi des entités (personnages, lieux, éléments du lore) mentionnées
+    dans une histoire.
+
+    L'automate est construit une fois par histoire à partir des noms et alias
+    du codex et du RAG. Chaque action du joueur et chaque scène générée sont
+    parcourues en un seul passage ; on retient pour chaque entité le dernier
+    tour où elle a été mentionnée.
+    """
+
+    def __init__(self, entities: List[Tuple[str, str]], aliases: Optional[Dict[str, List[str]]] = None):
+        """
+        Paramètres :
+            entities (list[(nom, type)]) : entités à suivre ; type parmi
+                                           "personnage", "lieu", "lore".
+            aliases (dict) : alias supplémentaires par nom d'entité.
+        """
+        self.entities = entities
+        self.turn = 0
+        self.last_seen: Dict[int, int] = {}
+
+        patterns = []
+        self._pattern_entity: List[int] = []
+        seen = set()
+        for entity_index, (name, kind) in enumerate(entities):
+            for alias in _aliases(name, kind) + (aliases or {}).get(name, []):
+                key = fold(alias)
+                if key and key not in seen:
+                    seen.add(key)
+                    patterns.append(key)
+                    self._pattern_entity.append(entity_index)
+
+        self._automaton = AhoCorasick(patterns)
+
+    @classmethod
+    def from_codex(cls, codex: Dict[str, Any], lore: Iterable[Tuple[str, str, List[str]]] = ()) -> "EntityTracker":
+        """
+        Construit le suivi à partir du codex et des noms du lore.
+
+        Paramètres :
+            codex (dict) : codex de l'histoire (personnages, lieux).
+            lore (itérable de (category, name, aliases)) : entrées du RAG.
+        """
+        entities = [(name, "personnage") for name in codex.get("personnages", []) if isinstance(name, str)]
+        entities += [(name, "lieu") for name in codex.get("lieux", []) if isinstance(name, str)]
+        aliases: Dict[str, List[str]] = {}
+
+        known = {fold(name): name for name, _ in entities}
+        for category, name, entry_aliases in lore:
+            key = fold(name)
+            if key not in known:
+                known[key] = name
+                kind = "personnage" if category == "characters" else "lore"
+                entities.append((name, kind))
+            if entry_aliases:
+                # Un lieu du codex présent dans le lore profite aussi de ses alias.
+                aliases.setdefault(known[key], []).extend(entry_aliases)
+
+        return cls(entities, aliases)
+
+    def next_turn(self):
+        self.turn += 1
+
+    def fork(self) -> "EntityTracker":
+        """
+        Copie du suivi qui partage l'automate mais pas les mentions :
+        un tour y lit et y note ses entités sans toucher au suivi partagé.
+        """
+        clone = copy.copy(self)
+        clone.last_seen = dict(self.last_seen)
+        return clone
+
+    def adopt(self, fork: "EntityTracker"):
+        """
+        Reprend les mentions d'une copie (voir fork) une fois son tour accepté.
+        """
+        self.turn = fork.turn
+        self.last_seen = dict(fork.last_seen)
+
+    def observe(self, text: Optional[str]) -> List[int]:
+        """
+        Repère les entités mentionnées dans un texte et les marque comme vues
+        au tour courant. Seules les occurrences de mots entiers comptent.
+
+        Retour :
+            list[int] : indices des entités trouvées.
+        """
+        if not text:
+            return []
+
+        folded = fold(text)
+        found = []
+        for start, end, pattern in self._automaton.finditer(folded):
+            if start > 0 and folded[start - 1].isalnum():
+                continue
+            if end < len(folded) and folded[end].isalnum():
+                continue
+            entity = self._pattern_entity[pattern]
+            self.last_seen[entity] = self.turn
+            if entity not in found:
+                found.append(entity)
+        return found
+
+    def active(self, window: int = ACTIVE_WINDOW, limit: int = MAX_ACTIVE) -> List[Tuple[str, str]]:
+        """
+        Entités mentionnées pendant les `window` derniers tours, de la plus
+        récente à la plus ancienne.
+
+        Retour :
+            list[(nom, type)]
+        """
+        recent = [
+            (turn, entity) for entity, turn in self.last_seen.items()
+            if self.turn - turn < window
+        ]
+        recent.sort(key=lambda item: (-item[0], item[1]))
+        return [self.entities[entity] for _, entity in recent[:limit]]
+
+
+def _lore_names(theme: str) -> List[Tuple[str, str, List[str]]]:
+    """
+    Noms du lore du thème : depuis la base SQLite si elle existe,
+    sinon depuis les fichiers JSON du RAG.
+    """
+    from src.rag.loader import load_rag
+    from src.rag.store import get_lore_store
+
+    try:
+        store = get_lore_store()
+        if store is not None:
+            return list(store.iter_names(theme))
+        return [
+            (category, entry.get("name") or entry.get("title"), entry.get("aliases", []))
+            for category, entries in load_rag(theme).items()
+            for entry in entries
+            if entry.get("name") or entry.get("title")
+        ]
+    except Exception as e:
+        # Sans lore lisible, on suit seulement les entités du codex.
+        print("❌ Lore indisponible pour le suivi des entités :", e)
+        return []
+
+
+# Un suivi par histoire, conservé entre les tours (du moins au plus récemment utilisé).
+_trackers: "OrderedDict[str, EntityTracker]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_tracker(codex: Dict[str, Any], state: Dict[str, Any]) -> EntityTracker:
+    """
+    Retourne le suivi d'entités de l'histoire, en le construisant au premier appel.
+
+    À la construction (nouvelle partie ou reprise après redémarrage), les
+    dernières scènes de l'historique sont relues pour retrouver les entités actives.
+
+    Dans un tour différé (voir TurnContext), le tour travaille sur sa propre
+    copie du suivi, reportée dans le suivi partagé quand il est accepté.
+    """
+    tracker = _shared_tracker(codex, state)
+    turn = current_turn()
+    if turn is None or not turn.deferred:
+        return tracker
+    key = ("tracker", state.get("story_id", ""))
+    fork = turn.forks.get(key)
+    if fork is None:
+        fork = turn.forks[key] = tracker.fork()
+        turn.on_accept(lambda: tracker.adopt(fork))
+    return fork
+
+
+def _shared_tracker(codex: Dict[str, Any], state: Dict[str, Any]) -> EntityTracker:
+    story_id = state.get("story_id", "")
+    with _lock:
+        tracker = _trackers.get(story_id)
+        if tracker is not None:
+            _trackers.move_to_end(story_id)
+            return tracker
+
+    # Absent (nouvelle histoire, reprise, ou suivi oublié) : on le reconstruit.
+    tracker = EntityTracker.from_codex(codex, _lore_names(codex.get("theme", "fantasy")))
+    scenes = [e["scene_text"] for e in state.get("history", []) if isinstance(e, dict) and "scene_text" in e]
+    for text in scenes[-REBUILD_SCENES:]:
+        tracker.next_turn()
+        tracker.observe(text)
+
+    with _lock:
+        tracker = _trackers.setdefault(story_id, tracker)
+        _trackers.move_to_end(story_id)
+        while len(_trackers) > MAX_TRACKERS:
+            _trackers.popitem(last=False)
+        return tracker
+
+
+def _mentioned_in(text: str, name: str, kind: str) -> bool:
+    # Même règle que observe : un nom ou un alias, en mots entiers.
+    folded = fold(text)
+    for alias in _aliases(name, kind):
+        key = fold(alias)
+        start = folded.find(key)
+        while key and start != -1:
+            end = start + len(key)
+            if (start == 0 or not folded[start - 1].isalnum()) and (end == len(folded) or not folded[end].isalnum()):
+                return True
+            start = folded.find(key, start + 1)
+    return False
+
+
+def pinned_entities(codex: Dict[str, Any], objective: str) -> List[Tuple[str, str]]:
+    """
+    Entités toujours transmises au modèle, qu'elles aient été mentionnées
+    récemment ou non : le protagoniste (premier personnage du codex) et les
+    personnages et lieux du codex cités par l'objectif en cours.
+    """
+    characters = [name for name in codex.get("personnages", []) if isinstance(name, str)]
+    places = [name for name in codex.get("lieux", []) if isinstance(name, str)]
+
+    pinned = [(characters[0], "personnage")] if characters else []
+    for name, kind in [(name, "personnage") for name in characters[1:]] + [(name, "lieu") for name in places]:
+        if _mentioned_in(objective, name, kind):
+            pinned.append((name, kind))
+    return pinned
+
+
+def build_codex_core(codex: Dict[str, Any], state: Dict[str, Any], active: List[Tuple[str, str]]) -> Dict[str, Any]:
+    """
+    Version réduite du codex transmise au modèle : le pitch, l'objectif en cours,
+    les entités qui ne doivent jamais manquer (voir pinned_entities), puis
+    les entités actuellement actives.
+
+    Paramètres :
+        codex (dict) : codex complet.
+        state (dict) : état narratif (pour le milestone en cours).
+        active (list[(nom, type)]) : entités actives (EntityTracker.active).
+
+    Retour :
+        dict : le cœur du codex.
+    """
+    milestones = codex.get("milestones", [])
+    index = state.get("milestone_index", 0)
+    objective = milestones[index] if index < len(milestones) else "Conclure l'histoire."
+
+    entities = list(dict.fromkeys(pinned_entities(codex, str(objective)) + list(active)))
+
+    return {
+        "pitch": codex.get("pitch", ""),
+        "theme": codex.get("theme", ""),
+        "objectif_actuel": objective,
+        "personnages_actifs": [name for name, kind in entities if kind == "personnage"],
+        "lieux_actifs": [name for name, kind in entities if kind == "lieu"],
+        "elements_actifs": [name for name, kind in entities if kind == "lore"]
+    }
@@ -0,0 +1,197 @@
+from typing import Dict, Any, Optional
+
+from src.utils.ollama_client import ollama_chat, is_truncated
+from src.utils.json_repair import parse_json_lenient
+from src.rag.query import get_context
+from src.engine.scene import trim_partial_text
+from src.engine.state import prompt_state
+
+MODEL_NAME = "mistral"
+
+# Limites de l'appel : une scène complète plus l'intention et la décision.
+FUSED_DEADLINE_S = 90.0
+FUSED_MAX_TOKENS = 750
+
+# Valeurs autorisées pour le champ "intent".
+INTENTS = ("IN_GAME", "OUT_OF_GAME")
+
+# Schéma JSON transmis à Ollama pour contraindre la sortie du modèle.
+# Une seule réponse regroupe l'intention, la scène et la décision d'auto-continue.
+TURN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "intent": {"type": "string", "enum": list(INTENTS)},
+        "scene_text": {"type": "string"},
+        "choices": {"type": "array", "items": {"type": "string"}},
+        "consequences": {
+            "type": "object",
+            "properties": {
+                "milestone_progress": {"type": "boolean"},
+                "flags": {"type": "object"},
+                "inventory_add": {"type": "array", "items": {"type": "string"}},
+                "inventory_remove": {"type": "array", "items": {"type": "string"}}
+            }
+        },
+        "auto_continue": {"type": "boolean"}
+    },
+    "required": ["intent", "scene_text", "choices", "consequences", "auto_continue"]
+}
+
+
+def validate_fused_turn(data: Any) -> Optional[Dict[str, Any]]:
+    """
+    Vérifie qu'une réponse fusionnée respecte le schéma attendu.
+
+    Paramètres :
+        data (Any) : objet JSON décodé depuis la réponse du modèle.
+
+    Retour :
+        dict | None : le tour normalisé, ou None si la réponse est inutilisable.
+    """
+    if not isinstance(data, dict):
+        return None
+
+    intent = str(data.get("intent", "")).strip().upper()
+    if intent not in INTENTS:
+        return None
+
+    scene_text = data.get("scene_text")
+    choices = data.get("choices")
+    consequences = data.get("consequences")
+    auto_continue = data.get("auto_continue")
+
+    # Une scène hors-jeu n'a pas besoin de texte : l'orchestrateur la remplace.
+    if intent == "IN_GAME" and (not isinstance(scene_text, str) or not scene_text.strip()):
+        return None
+    if not isinstance(choices, list) or not all(isinstance(c, str) for c in choices):
+        return None
+    if not isinstance(consequences, dict):
+        return None
+    if not isinstance(auto_continue, bool):
+        return None
+
+    return {
+        "intent": intent,
+        "scene_text": scene_text or "",
+        "choices": choices,
+        "consequences": consequences,
+        "auto_continue": auto_continue
+    }
+
+
+def generate_fused_turn(codex, state, user_input=None, memory="", long_memory="", codex_core=None):
+    """
+    Génère un tour complet en un seul appel au modèle.
+
+    Là où le pipeline classique enchaîne classify_intent, generate_scene
+    puis should_auto_continue, ce mode demande au modèle une réponse unique
+    contrainte par TURN_SCHEMA contenant :
+    - intent : IN_GAME ou OUT_OF_GAME
+    - scene_text, choices, consequences : la scène, comme generate_scene
+    - auto_continue : true si l'histoire doit avancer sans le joueur
+
+    Paramètres :
+        codex (dict) : informations de l'univers.
+        state (dict) : état narratif actuel.
+        user_input (str | None) : action du joueur.
+        memory (str) : résumé des dernières scènes.
+        long_memory (str) : contexte ancien retrouvé via la mémoire vectorielle.
+        codex_core (dict | None) : codex réduit transmis à la place du codex complet.
+
+    Retour :
+        dict | None : le tour validé, ou None si la réponse est invalide
+                      (l'appelant doit alors revenir au pipeline multi-appels).
+                      Si le délai est dépassé sans texte exploitable, le dict
+                      {"generation_error": "deadline"} est renvoyé : relancer
+                      le pipeline complet prendrait encore plus de temps.
+
+    Une réponse coupée reste utilisable si elle contient l'intention et du
+    texte : le texte est arrêté à sa dernière phrase complète et les champs
+    suivants reçoivent des valeurs neutres (aucun choix, aucun effet, pas
+    d'auto-continue).
+    """
+
+    # Contexte RAG, comme dans generate_scene.
+    rag_context = None
+    if user_input:
+        try:
+            rag_context = get_context(user_input, codex.get("theme", "fantasy"))
+        except Exception:
+            rag_context = None
+
+    prompt = f"""
+Tu es un moteur narratif pour un jeu interactif. La langue à utiliser est le français.
+Réponds UNIQUEMENT en JSON strict, sans texte avant ou après.
+
+Tu dois faire trois choses en une seule réponse :
+1. Classer l'action du joueur :
+   - IN_GAME = action dans l'univers du jeu
+   - OUT_OF_GAME = question hors jeu, recette, info réelle, etc.
+   Sans action du joueur, l'intention est IN_GAME.
+2. Si l'intention est IN_GAME, écrire la scène suivante.
+   Si l'intention est OUT_OF_GAME, laisser scene_text et choices vides.
+3. Décider si l'histoire doit continuer automatiquement :
+   - S'il y a des choix → auto_continue = false
+   - Si la scène est une transition narrative sans choix → auto_continue = true
+   - Si la scène demande explicitement une action → auto_continue = false
+
+CONTEXTE :
+Codex : {codex_core if codex_core is not None else codex}
+État actuel : {prompt_state(state)}
+Action du joueur : {user_input}
+
+Résumé des événements récents :
+{memory if memory else "Aucun."}
+
+Mémoire longue pertinente :
+{long_memory if long_memory else "Aucune."}
+
+Contexte RAG :
+{rag_context}
+
+FORMAT EXACT À RESPECTER :
+{{
+  "intent": "IN_GAME",
+  "scene_text": "Texte immersif ici.",
+  "choices": ["choix 1", "choix 2"],
+  "consequences": {{
+    "milestone_progress": true,
+    "flags": {{"quete_active": false}},
+    "inventory_add": []
+  }},
+  "auto_continue": false
+}}
+"""
+
+    raw = ollama_chat(
+        MODEL_NAME,
+        [
+            {"role": "system", "content": "Tu es un moteur narratif expert. Réponds uniquement en JSON strict."},
+            {"role": "user", "content": prompt}
+        ],
+        format=TURN_SCHEMA,
+        stage="fused_turn",
+        deadline=FUSED_DEADLINE_S,
+        max_tokens=FUSED_MAX_TOKENS
+    )
+    timed_out = getattr(raw, "done_reason", None) == "deadline"
+
+    # Même décodage tolérant que generate_scene.
+    data, status = parse_json_lenient(raw)
+    if data is None:
+        print("❌ Erreur JSON dans generate_fused_turn. Réponse brute :", raw)
+        return {"generation_error": "deadline"} if timed_out else None
+
+    if is_truncated(raw) and isinstance(data, dict):
+        if isinstance(data.get("scene_text"), str):
+            data["scene_text"] = trim_partial_text(data["scene_text"])
+        data.setdefault("choices", [])
+        data.setdefault("consequences", {})
+        data.setdefault("auto_continue", False)
+
+    turn = validate_fused_turn(data)
+    if turn is None:
+        print("❌ Tour fusionné invalide :", data)
+        if timed_out:
+            return {"generation_error": "deadline"}
+    return turn
@@ -3,6 +3,10 @@ from src.utils.ollama_client import ollama_chat
 # Modèle utilisé pour la classification d'intention.
 MODEL_NAME = "mistral"
 
+# Limites de l'appel : la réponse ReAct tient en quelques lignes.
+INTENT_DEADLINE_S = 30.0
+INTENT_MAX_TOKENS = 150
+
 
 def classify_intent(user_input: str) -> str:
     """
@@ -45,7 +49,10 @@ def classify_intent(user_input: str) -> str:
         [
             {"role": "system", "content": "Tu es un agent ReAct expert."},
             {"role": "user", "content": prompt}
-        ]
+        ],
+        stage="intent",
+        deadline=INTENT_DEADLINE_S,
+        max_tokens=INTENT_MAX_TOKENS
     )
 
     # On récupère la dernière ligne de la réponse,
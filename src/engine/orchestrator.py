@@ -1,18 +1,33 @@
-from typing import Tuple, Dict, Any
+import time
+import uuid
+from typing import Tuple, Dict, Any, Optional
 
 from src.engine.codex import generate_codex
 from src.engine.scene import generate_scene
-from src.engine.state import initial_state, update_state
+from src.engine.state import initial_state, update_state, trim_history
 from src.engine.intent_classifier import classify_intent
 from src.engine.auto_continue_agent import should_auto_continue
+from src.engine.auto_continue_budget import AutoContinueBudget
+from src.engine.fused_turn import generate_fused_turn
+from src.engine.entity_tracker import get_tracker, build_codex_core
 from src.memory.vector_store import add_scene_to_memory, search_memory
+from src.utils.turn_context import report_stage, after_accept
+
+# Mode "tour fusionné" : un seul appel au modèle par tour (intention, scène
+# et décision d'auto-continue) au lieu de trois. Désactivé par défaut ;
+# en cas de réponse invalide, on revient au pipeline multi-appels.
+FUSED_TURN_MODE = False
+
+# Nombre de scènes récentes transmises comme mémoire courte. Ces scènes sont
+# exclues de la recherche en mémoire longue pour ne pas être envoyées deux fois.
+SHORT_MEMORY_SCENES = 3
 
 
 # ============================================================
 # MÉMOIRE NARRATIVE : résumé des dernières scènes
 # ============================================================
 
-def build_memory_summary(state: Dict[str, Any], max_scenes: int = 3) -> str:
+def build_memory_summary(state: Dict[str, Any], max_scenes: int = SHORT_MEMORY_SCENES) -> str:
     """
     Construit un résumé compact des dernières scènes pour donner
     une mémoire contextuelle au modèle.
@@ -62,13 +77,18 @@ def start_story(theme: str = "fantasy") -> Dict[str, Any]:
         dict : structure contenant le codex, l'état et la première scène.
     """
 
+    report_stage("codex")
     codex = generate_codex(theme=theme)
     state = initial_state(codex)
 
     # On initialise l'historique interne.
     state["history"] = []
 
+    # Identifiant de l'histoire, utilisé pour la sauvegarde et la reprise.
+    state["story_id"] = uuid.uuid4().hex[:12]
+
     # Première scène générée sans action du joueur.
+    report_stage("writing")
     scene = generate_scene(
         codex=codex,
         state=state,
@@ -76,12 +96,18 @@ def start_story(theme: str = "fantasy") -> Dict[str, Any]:
         memory="",
         long_memory=""
     )
+    if scene.get("generation_error"):
+        scene = fallback_scene()
 
     # On ajoute la première scène à l'historique interne.
     first_text = scene.get("scene_text", "")
-    if first_text:
+    if first_text and not scene.get("fallback"):
         state["history"].append({"scene_text": first_text})
 
+    # Construction du suivi des entités (une fois par histoire) ; la première
+    # scène, déjà dans l'historique, est lue à cette occasion.
+    get_tracker(codex, state)
+
     return {
         "codex": codex,
         "state": state,
@@ -117,41 +143,318 @@ def handle_out_of_game(user_input: str) -> Dict[str, Any]:
     }
 
 
+# ============================================================
+# SCÈNE DE REPLI
+# ============================================================
+
+def fallback_scene(user_input: str = "") -> Dict[str, Any]:
+    """
+    Scène renvoyée quand le modèle n'a pas produit de scène exploitable
+    (délai dépassé sans texte, réponse vide ou invalide).
+
+    Elle ne change rien à l'histoire : l'état n'est pas modifié et la scène
+    n'entre ni dans la mémoire ni dans l'historique. Le premier choix
+    permet de retenter la même action.
+
+    Paramètres :
+        user_input (str) : action du joueur qui n'a pas abouti.
+
+    Retour :
+        dict : scène de repli (champ "fallback" à True).
+    """
+    text = (
+        "Le récit marque une pause, comme si le narrateur cherchait ses mots. "
+        "Autour de toi, rien n'a changé : tu peux reprendre ton action ou en tenter une autre."
+    )
+    choices = [user_input.strip()] if user_input and user_input.strip() else []
+    choices.append("Continuer l'aventure")
+
+    return {
+        "scene_text": text,
+        "choices": choices,
+        "consequences": {},
+        "auto_continue": False,
+        "fallback": True
+    }
+
+
+# ============================================================
+# ÉTAPES COMMUNES DU PIPELINE
+# ============================================================
+
+def retrieve_memories(user_input: str, state: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    Récupère la mémoire courte (dernières scènes) et la mémoire longue
+    (scènes anciennes proches de l'action du joueur).
+
+    Paramètres :
+        user_input (str) : action du joueur.
+        state (dict) : état narratif actuel.
+
+    Retour :
+        (memory, long_memory) : les deux contextes sous forme de texte.
+    """
+    # Mémoire courte : résumé des dernières scènes.
+    memory = build_memory_summary(state)
+    print("Mémoire courte transmise au modèle :", memory)
+
+    # Mémoire longue : recherche vectorielle dans les scènes passées.
+    long_memory_context = ""
+    if user_input.strip():
+        results = search_memory(
+            user_input,
+            k=5,
+            filters={"story_id": state.get("story_id")},
+            skip_recent=SHORT_MEMORY_SCENES
+        )
+        if results:
+            parts = [r["scene_text"] for r in results]
+            long_memory_context = "\n---\n".join(parts)
+
+    print("Mémoire longue pertinente :", long_memory_context)
+    return memory, long_memory_context
+
+
+def focus_codex(user_input: str, codex: Dict[str, Any], state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Ouvre un nouveau tour dans le suivi des entités, y lit l'action du joueur
+    et retourne le cœur du codex limité aux entités actives.
+
+    Paramètres :
+        user_input (str) : action du joueur.
+        codex (dict) : codex narratif complet.
+        state (dict) : état narratif actuel.
+
+    Retour :
+        dict : codex réduit à transmettre au modèle.
+    """
+    tracker = get_tracker(codex, state)
+    tracker.next_turn()
+    tracker.observe(user_input)
+    active = tracker.active()
+    print("Entités actives :", [name for name, _ in active])
+    return build_codex_core(codex, state, active)
+
+
+def commit_scene(scene: Dict[str, Any], state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Applique une scène générée : mise à jour de l'état narratif,
+    ajout dans la mémoire vectorielle et dans l'historique interne.
+
+    Paramètres :
+        scene (dict) : scène générée.
+        state (dict) : état narratif actuel.
+
+    Retour :
+        dict : l'état mis à jour.
+    """
+    # Mise à jour de l'état narratif selon les conséquences.
+    consequences = scene.get("consequences", {})
+    new_state = update_state(state, consequences)
+    print("Nouvel état :", new_state)
+
+    # Ajout de la scène dans la mémoire vectorielle, partagée par le processus :
+    # dans un tour en arrière-plan, seulement quand son résultat est accepté.
+    scene_text = scene.get("scene_text", "")
+    if scene_text:
+        metadata = {
+            "story_id": new_state.get("story_id"),
+            "milestone_index": new_state.get("milestone_index"),
+            "flags": dict(new_state.get("flags", {}))
+        }
+        after_accept(lambda: add_scene_to_memory(scene_text, metadata=metadata))
+
+        # Ajout dans la mémoire interne.
+        if "history" not in new_state:
+            new_state["history"] = []
+        new_state["history"].append({"scene_text": scene_text})
+        trim_history(new_state)
+
+    return new_state
+
+
 # ============================================================
 # PIPELINE PRINCIPAL
 # ============================================================
 
+def next_step_fused(
+    user_input: str,
+    codex: Dict[str, Any],
+    state: Dict[str, Any],
+    codex_core: Optional[Dict[str, Any]] = None,
+    memories: Optional[Tuple[str, str]] = None
+) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    Variante de next_step en un seul appel au modèle par tour.
+
+    L'intention, la scène et la décision d'auto-continue sont produites
+    par generate_fused_turn. Si la réponse est invalide, la fonction
+    renvoie None sans avoir modifié l'état : l'appelant reprend alors
+    le pipeline multi-appels.
+
+    Paramètres :
+        user_input (str) : action du joueur.
+        codex (dict) : codex narratif.
+        state (dict) : état narratif actuel.
+        codex_core (dict | None) : codex réduit (voir focus_codex).
+        memories ((str, str) | None) : mémoires déjà récupérées
+                                       (voir retrieve_memories).
+
+    Retour :
+        (scene, new_state) | None
+    """
+    if memories is None:
+        report_stage("retrieving")
+        memories = retrieve_memories(user_input, state)
+    memory, long_memory_context = memories
+
+    report_stage("writing")
+    turn = generate_fused_turn(
+        codex=codex,
+        state=state,
+        user_input=user_input,
+        memory=memory,
+        long_memory=long_memory_context,
+        codex_core=codex_core
+    )
+    if turn is None:
+        return None
+    if turn.get("generation_error"):
+        print("❌ Tour fusionné sans scène exploitable : scène de repli.")
+        return fallback_scene(user_input), state
+
+    # Sans action du joueur (auto-continue), on reste forcément dans le jeu.
+    intent = turn["intent"] if user_input.strip() else "IN_GAME"
+    print("Intent détecté (tour fusionné) :", intent)
+
+    if intent == "OUT_OF_GAME":
+        return handle_out_of_game(user_input), state
+
+    scene = {
+        "scene_text": turn["scene_text"],
+        "choices": turn["choices"],
+        "consequences": turn["consequences"],
+        # La décision est conservée pour que l'interface n'ait pas
+        # à interroger de nouveau le modèle.
+        "auto_continue": turn["auto_continue"] and not turn["choices"]
+    }
+    print("Scene générée :", scene)
+
+    get_tracker(codex, state).observe(scene["scene_text"])
+    new_state = commit_scene(scene, state)
+
+    print("Décision auto-continue :", scene["auto_continue"])
+    return scene, new_state
+
+
 def next_step(
     user_input: str,
     codex: Dict[str, Any],
     state: Dict[str, Any],
-    auto_depth: int = 0
+    fused: Optional[bool] = None,
+    budget: Optional[AutoContinueBudget] = None
 ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
     """
     Pipeline principal exécuté à chaque action du joueur.
 
+    Cette fonction joue l'étape demandée par le joueur (voir play_step),
+    puis enchaîne les scènes de transition (auto-continue) tant que le
+    budget de temps du clic le permet : la durée mesurée des étapes
+    précédentes indique si une scène de plus tient dans le temps restant.
+
+    Paramètres :
+        user_input (str) : action du joueur (vide pour une simple continuation).
+        codex (dict) : codex narratif.
+        state (dict) : état narratif actuel.
+        fused (bool | None) : force ou désactive le mode tour fusionné
+                              (par défaut : FUSED_TURN_MODE).
+        budget (AutoContinueBudget | None) : budget du clic, s'il a commencé
+                                             avant cet appel (sinon, un nouveau).
+
+    Retour :
+        (scene, new_state) : la dernière scène générée et l'état mis à jour.
+        La scène indique dans "chained_steps" le nombre de scènes enchaînées,
+        et "chained_scenes" contient, dans l'ordre, les scènes générées avant
+        elle pendant ce clic (déjà appliquées à l'état) ; "auto_continue" reste
+        à True si l'histoire voulait encore avancer quand le budget a rendu
+        la main au joueur.
+    """
+    if fused is None:
+        fused = FUSED_TURN_MODE
+    if budget is None:
+        budget = AutoContinueBudget()
+
+    mode = "fused" if fused else "pipeline"
+    chained_scenes = []
+    while True:
+        started = time.perf_counter()
+        scene, state, ran = play_step(user_input, codex, state, fused, budget)
+        # Un tour fusionné invalide a été rejoué par le pipeline : la durée
+        # est comptée au mode qui a effectivement produit la scène.
+        budget.record_step(ran, time.perf_counter() - started)
+
+        if not scene.get("auto_continue") or not budget.allows_another(mode):
+            break
+        # Scène de transition : l'histoire avance sans action du joueur.
+        chained_scenes.append(scene)
+        budget.chain()
+        user_input = ""
+
+    scene["chained_steps"] = budget.chained_steps
+    scene["chained_scenes"] = chained_scenes
+    print("Auto-continue :", budget.report())
+    return scene, state
+
+
+def play_step(
+    user_input: str,
+    codex: Dict[str, Any],
+    state: Dict[str, Any],
+    fused: bool,
+    budget: AutoContinueBudget
+) -> Tuple[Dict[str, Any], Dict[str, Any], str]:
+    """
+    Une étape du moteur, sans enchaînement.
+
     Cette fonction :
     - analyse l'intention du joueur
     - récupère la mémoire courte et longue
     - génère une nouvelle scène
     - met à jour l'état narratif
     - stocke la scène dans la mémoire vectorielle
-    - gère l'auto-continue si nécessaire
+    - décide si l'histoire doit avancer seule (champ "auto_continue")
 
     Paramètres :
-        user_input (str) : action du joueur.
+        user_input (str) : action du joueur (vide pour une continuation).
         codex (dict) : codex narratif.
         state (dict) : état narratif actuel.
-        auto_depth (int) : profondeur actuelle d'auto-continue.
+        fused (bool) : mode tour fusionné.
+        budget (AutoContinueBudget) : budget du clic en cours.
 
     Retour :
-        (scene, new_state) : la scène générée et l'état mis à jour.
+        (scene, new_state, mode) : la scène générée, l'état mis à jour et le
+        mode qui a produit la scène ("fused", ou "pipeline" après un repli).
     """
+    # Seules les entités mentionnées récemment sont transmises au modèle.
+    codex_core = focus_codex(user_input, codex, state)
+
+    # Mode fusionné : un seul appel au modèle, avec repli sur le pipeline
+    # classique si la réponse ne respecte pas le schéma. Les mémoires déjà
+    # récupérées servent aussi au repli.
+    memories = None
+    if fused:
+        report_stage("retrieving")
+        memories = retrieve_memories(user_input, state)
+        result = next_step_fused(user_input, codex, state, codex_core, memories)
+        if result is not None:
+            return result + ("fused",)
+        print("Tour fusionné invalide : retour au pipeline multi-appels.")
 
     # On détermine si le joueur est "dans le jeu" ou non.
     if user_input.strip() == "":
         intent = "IN_GAME"  # cas auto-continue : pas de classification
     else:
+        report_stage("classifying")
         intent = classify_intent(user_input)
 
     print("Intent détecté :", intent)
@@ -159,65 +462,45 @@ def next_step(
     # Si le joueur sort du cadre narratif, on renvoie une scène hors-jeu.
     if intent == "OUT_OF_GAME":
         scene = handle_out_of_game(user_input)
-        return scene, state
+        return scene, state, "pipeline"
 
-    # Mémoire courte : résumé des dernières scènes.
-    memory = build_memory_summary(state)
-    print("Mémoire courte transmise au modèle :", memory)
-
-    # Mémoire longue : recherche vectorielle dans les scènes passées.
-    long_memory_context = ""
-    if user_input.strip():
-        results = search_memory(user_input, k=5)
-        if results:
-            parts = [r["scene_text"] for r in results]
-            long_memory_context = "\n---\n".join(parts)
-
-    print("Mémoire longue pertinente :", long_memory_context)
+    if memories is None:
+        report_stage("retrieving")
+        memories = retrieve_memories(user_input, state)
+    memory, long_memory_context = memories
 
     # Génération de la nouvelle scène.
+    report_stage("writing")
     scene = generate_scene(
         codex=codex,
         state=state,
         user_input=user_input,
         memory=memory,
-        long_memory=long_memory_context
+        long_memory=long_memory_context,
+        codex_core=codex_core
     )
 
     print("Scene générée :", scene)
 
-    # Mise à jour de l'état narratif selon les conséquences.
-    consequences = scene.get("consequences", {})
-    new_state = update_state(state, consequences)
-    print("Nouvel état :", new_state)
-
-    # Ajout de la scène dans la mémoire vectorielle.
-    scene_text = scene.get("scene_text", "")
-    if scene_text:
-        add_scene_to_memory(
-            scene_text,
-            metadata={
-                "milestone_index": new_state.get("milestone_index"),
-                "flags": new_state.get("flags", {})
-            }
-        )
+    # Aucune scène exploitable : l'histoire n'avance pas.
+    if scene.get("generation_error"):
+        return fallback_scene(user_input), state, "pipeline"
 
-        # Ajout dans la mémoire interne.
-        if "history" not in new_state:
-            new_state["history"] = []
-        new_state["history"].append({"scene_text": scene_text})
+    get_tracker(codex, state).observe(scene.get("scene_text"))
+    new_state = commit_scene(scene, state)
 
     # Gestion de l'auto-continue : certaines scènes peuvent demander
-    # de continuer automatiquement sans action du joueur.
-    decision = should_auto_continue(scene, new_state, codex)
+    # de continuer automatiquement sans action du joueur. Si le budget du
+    # clic ne permet plus d'enchaîner, on s'épargne l'appel au modèle et
+    # on applique sa première règle : sans choix, l'histoire doit avancer.
+    if budget.allows_another("pipeline"):
+        report_stage("deciding")
+        decision = should_auto_continue(scene, new_state, codex)
+    else:
+        decision = "WAIT_FOR_PLAYER" if scene.get("choices") else "AUTO_CONTINUE"
     print("Décision auto-continue :", decision)
 
-    if decision == "AUTO_CONTINUE" and auto_depth < 3:
-        return next_step(
-            user_input="",
-            codex=codex,
-            state=new_state,
-            auto_depth=auto_depth + 1
-        )
-
-    return scene, new_state
+    # Comme en mode fusionné, la décision est conservée dans la scène :
+    # next_step (et l'interface) n'ont pas à interroger de nouveau le modèle.
+    scene["auto_continue"] = decision == "AUTO_CONTINUE"
+    return scene, new_state, "pipeline"
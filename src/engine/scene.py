@@ -1,16 +1,226 @@
-from src.utils.ollama_client import ollama_chat
+import re
+
+from src.utils.ollama_client import ollama_chat, is_truncated
+from src.utils.json_repair import parse_json_lenient
 from src.rag.query import get_context
-import json
+from src.engine.state import prompt_state
 
 MODEL_NAME = "mistral"
 
+# Limites d'un appel de génération de scène. Au-delà, le flux est coupé et
+# la partie déjà reçue est utilisée si elle contient du texte (voir parse_scene).
+SCENE_DEADLINE_S = 90.0
+SCENE_MAX_TOKENS = 700
+
+# Limites de la relance ciblée (quelques champs seulement).
+REASK_DEADLINE_S = 30.0
+REASK_MAX_TOKENS = 300
+
+# Fin de phrase : point, point d'exclamation ou d'interrogation, points de
+# suspension, éventuellement suivis d'un guillemet fermant (« ... ! »).
+_SENTENCE_END = re.compile(r"[.!?…](?:\s?[»\"”'])?(?=\s|$)")
+
+# Compteurs de décodage des scènes :
+# - ok : JSON valide du premier coup
+# - repaired : JSON corrigé localement
+# - reask : relance ciblée envoyée au modèle pour les champs manquants
+# - reask_ok : relance qui a permis de compléter la scène
+# - truncated : réponse coupée (limite de tokens ou délai), scène partielle utilisée
+# - failed : scène d'erreur renvoyée malgré tout
+SCENE_JSON_STATS = {"total": 0, "ok": 0, "repaired": 0, "reask": 0, "reask_ok": 0, "truncated": 0, "failed": 0}
+
+
+def get_scene_json_stats():
+    """
+    Retourne les compteurs de décodage des scènes et les taux correspondants
+    (rapportés au nombre total de scènes générées).
+    """
+    stats = dict(SCENE_JSON_STATS)
+    total = stats["total"]
+    for name in ("repaired", "reask", "truncated", "failed"):
+        stats[f"{name}_rate"] = stats[name] / total if total else 0.0
+    return stats
+
+
+def trim_partial_text(text):
+    """
+    Coupe un texte interrompu en cours de génération après sa dernière
+    phrase complète. S'il n'y en a pas, ou si la couper ferait perdre plus
+    de la moitié du texte, il est gardé tel quel et terminé par des points
+    de suspension.
+    """
+    text = text.rstrip()
+    ends = list(_SENTENCE_END.finditer(text))
+    if ends and ends[-1].end() >= len(text) // 2:
+        return text[:ends[-1].end()]
+    return text + "…" if text else text
+
+
+def invalid_scene_fields(scene):
+    """
+    Liste les champs d'une scène absents ou invalides.
+
+    Paramètres :
+        scene (dict) : scène décodée (éventuellement partielle).
+
+    Retour :
+        list[str] : noms des champs à redemander au modèle.
+    """
+    fields = []
+    text = scene.get("scene_text")
+    if not isinstance(text, str) or not text.strip():
+        fields.append("scene_text")
+    choices = scene.get("choices")
+    if not isinstance(choices, list) or not all(isinstance(c, str) for c in choices):
+        fields.append("choices")
+    if not isinstance(scene.get("consequences"), dict):
+        fields.append("consequences")
+    return fields
+
+
+# Exemple de valeur pour chaque champ, utilisé dans la relance ciblée.
+_FIELD_EXAMPLES = {
+    "scene_text": '"scene_text": "Texte immersif ici."',
+    "choices": '"choices": ["choix 1", "choix 2"]',
+    "consequences": '"consequences": {"milestone_progress": false, "flags": {}, "inventory_add": []}'
+}
+
+
+def reask_missing_fields(scene, fields, user_input=None):
+    """
+    Demande au modèle uniquement les champs manquants d'une scène,
+    au lieu de régénérer la scène complète.
+
+    Paramètres :
+        scene (dict) : scène partielle déjà décodée.
+        fields (list[str]) : champs à compléter.
+        user_input (str | None) : action du joueur, pour le contexte.
+
+    Retour :
+        dict : les champs obtenus (éventuellement vide si la relance échoue).
+    """
+    known = {k: v for k, v in scene.items() if k not in fields}
+    example = ",\n  ".join(_FIELD_EXAMPLES[f] for f in fields)
+
+    prompt = f"""
+Une scène d'un jeu narratif a été générée mais certains champs sont manquants ou invalides.
+Réponds UNIQUEMENT en JSON strict, sans texte avant ou après, avec seulement les champs demandés.
+La langue à utiliser est le français.
+
+Action du joueur : {user_input}
+Scène partielle : {known}
+
+Champs à fournir : {", ".join(fields)}
+
+FORMAT EXACT À RESPECTER :
+{{
+  {example}
+}}
+"""
+
+    raw = ollama_chat(
+        MODEL_NAME,
+        [
+            {"role": "system", "content": "Tu complètes des scènes JSON. Réponds uniquement en JSON strict."},
+            {"role": "user", "content": prompt}
+        ],
+        format="json",
+        stage="reask",
+        deadline=REASK_DEADLINE_S,
+        max_tokens=REASK_MAX_TOKENS
+    )
+
+    patch, _ = parse_json_lenient(raw)
+    if not isinstance(patch, dict):
+        print("❌ Relance ciblée inutilisable. Réponse brute :", raw)
+        return {}
+    return {k: v for k, v in patch.items() if k in fields}
+
+
+def parse_scene(raw, user_input=None):
+    """
+    Décode la réponse du modèle en scène, en trois niveaux :
+    1. JSON valide tel quel, ou corrigé localement (parse_json_lenient)
+    2. relance ciblée pour les seuls champs manquants ou invalides
+    3. scène d'erreur si la scène reste sans texte
+
+    Si la réponse a été coupée (limite de tokens ou délai), le texte reçu est
+    arrêté à sa dernière phrase complète ; après un délai dépassé, il n'y a
+    pas de relance, qui rallongerait encore le tour.
+
+    La scène d'erreur porte un champ "generation_error" ("deadline" ou
+    "invalid") : l'orchestrateur la remplace par sa scène de repli.
+
+    Paramètres :
+        raw (str) : réponse brute du modèle.
+        user_input (str | None) : action du joueur.
 
-def generate_scene(codex, state, user_input=None, memory="", long_memory=""):
+    Retour :
+        dict : scène contenant scene_text, choices et consequences.
+    """
+    SCENE_JSON_STATS["total"] += 1
+    truncated = is_truncated(raw)
+    timed_out = getattr(raw, "done_reason", None) == "deadline"
+
+    scene, status = parse_json_lenient(raw)
+    if not isinstance(scene, dict):
+        scene = {}
+        # Réponse sans aucun JSON : le modèle a parfois écrit la scène en prose.
+        if "{" not in raw and raw.strip():
+            scene = {"scene_text": raw.strip()}
+        status = "failed"
+
+    # Des conséquences absentes signifient simplement "aucun effet" :
+    # inutile de relancer le modèle pour si peu.
+    scene.setdefault("consequences", {})
+
+    if truncated:
+        SCENE_JSON_STATS["truncated"] += 1
+        if isinstance(scene.get("scene_text"), str):
+            scene["scene_text"] = trim_partial_text(scene["scene_text"])
+
+    if status in ("ok", "repaired") and not invalid_scene_fields(scene):
+        SCENE_JSON_STATS[status] += 1
+        return scene
+
+    # Certains champs manquent : on ne redemande que ceux-là
+    # (sauf si le délai est déjà dépassé).
+    fields = invalid_scene_fields(scene)
+    if not timed_out:
+        print("Champs de scène à redemander :", fields)
+        SCENE_JSON_STATS["reask"] += 1
+        scene.update(reask_missing_fields(scene, fields, user_input))
+
+    # Valeurs neutres pour ce qui n'est toujours pas utilisable.
+    remaining = invalid_scene_fields(scene)
+    if "choices" in remaining:
+        choices = scene.get("choices")
+        scene["choices"] = [choices] if isinstance(choices, str) else []
+    if "consequences" in remaining:
+        scene["consequences"] = {}
+
+    if "scene_text" in remaining:
+        print("❌ Erreur JSON dans generate_scene. Réponse brute :", raw)
+        SCENE_JSON_STATS["failed"] += 1
+        return {
+            "scene_text": "Erreur de génération.",
+            "choices": [],
+            "consequences": {},
+            "generation_error": "deadline" if timed_out else "invalid"
+        }
+
+    if not timed_out:
+        SCENE_JSON_STATS["reask_ok"] += 1
+    return scene
+
+
+def generate_scene(codex, state, user_input=None, memory="", long_memory="", codex_core=None):
     """
     Génère une nouvelle scène narrative en interrogeant le modèle Ollama.
 
     Cette fonction construit un prompt complet contenant :
-    - le codex (univers, personnages, lieux…)
+    - le codex (univers, personnages, lieux…), ou seulement son cœur
+      (pitch, objectif en cours, entités actives) si codex_core est fourni
     - l'état narratif actuel
     - l'action du joueur
     - la mémoire courte (résumé des dernières scènes)
@@ -28,6 +238,8 @@ def generate_scene(codex, state, user_input=None, memory="", long_memory=""):
         user_input (str | None) : action du joueur.
         memory (str) : résumé des dernières scènes.
         long_memory (str) : contexte plus ancien retrouvé via la mémoire vectorielle.
+        codex_core (dict | None) : codex réduit (voir entity_tracker.build_codex_core)
+                                   transmis à la place du codex complet.
 
     Retour :
         dict : scène générée, toujours sous forme de JSON.
@@ -60,8 +272,8 @@ RAPPELS IMPORTANTS :
 - Les champs doivent contenir directement les valeurs finales.
 
 CONTEXTE :
-Codex : {codex}
-État actuel : {state}
+Codex : {codex_core if codex_core is not None else codex}
+État actuel : {prompt_state(state)}
 Action du joueur : {user_input}
 
 Résumé des événements récents :
@@ -91,25 +303,11 @@ FORMAT EXACT À RESPECTER :
         [
             {"role": "system", "content": "Tu es un moteur narratif expert. Réponds uniquement en JSON strict."},
             {"role": "user", "content": prompt}
-        ]
+        ],
+        stage="scene",
+        deadline=SCENE_DEADLINE_S,
+        max_tokens=SCENE_MAX_TOKENS
     )
 
-    # Nettoyage minimal si le modèle renvoie un bloc markdown.
-    cleaned = raw.strip()
-    if cleaned.startswith("```"):
-        cleaned = cleaned.split("```")[1]
-        cleaned = cleaned.replace("json", "").strip()
-
-    # Tentative de parsing JSON.
-    # Si le modèle renvoie un JSON invalide, on renvoie une scène d'erreur.
-    try:
-        scene = json.loads(cleaned)
-    except Exception:
-        print("❌ Erreur JSON dans generate_scene. Réponse brute :", raw)
-        scene = {
-            "scene_text": "Erreur de génération.",
-            "choices": [],
-            "consequences": {}
-        }
-
-    return scene
+    # Décodage tolérant : correction locale, puis relance ciblée si besoin.
+    return parse_scene(raw, user_input)
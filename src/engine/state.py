@@ -1,3 +1,14 @@
+from collections import Counter
+
+# Nombre maximal d'entrées gardées dans state["history"]. Les scènes plus
+# anciennes restent accessibles via la mémoire longue : l'état (copié à chaque
+# tour, sauvegardé dans la session) ne grossit plus au fil de la partie.
+MAX_HISTORY = 30
+
+# Nombre maximal de flags transmis au modèle (les plus récemment ajoutés).
+MAX_PROMPT_FLAGS = 30
+
+
 def initial_state(codex):
     """
     Crée l'état initial de l'histoire à partir du codex.
@@ -70,5 +81,39 @@ def update_state(state, consequences):
 
     # On garde une trace des conséquences pour mémoire interne.
     state["history"].append(consequences)
+    trim_history(state)
+
+    return state
+
 
+def trim_history(state, max_entries=MAX_HISTORY):
+    """
+    Ne garde que les `max_entries` dernières entrées de state["history"].
+    """
+    history = state.get("history")
+    if history is not None and len(history) > max_entries:
+        del history[:len(history) - max_entries]
     return state
+
+
+def prompt_state(state):
+    """
+    Vue compacte de l'état transmise au modèle.
+
+    L'historique est retiré (les dernières scènes sont déjà envoyées comme
+    mémoire courte), l'inventaire est regroupé par objet ("torche x3") et
+    seuls les derniers flags sont gardés : la taille du prompt ne dépend
+    plus de la longueur de la partie.
+
+    Paramètres :
+        state (dict) : état narratif actuel.
+
+    Retour :
+        dict : état allégé, à insérer dans les prompts.
+    """
+    inventory = Counter(state.get("inventory", []))
+    flags = list(state.get("flags", {}).items())[-MAX_PROMPT_FLAGS:]
+    view = {k: v for k, v in state.items() if k not in ("history", "inventory", "flags")}
+    view["flags"] = dict(flags)
+    view["inventory"] = [item if count == 1 else f"{item} x{count}" for item, count in inventory.items()]
+    return view
@@ -0,0 +1,189 @@
+import copy
+import threading
+import weakref
+from typing import Dict, Any, Optional
+
+from src.engine.orchestrator import start_story, next_step, FUSED_TURN_MODE
+from src.engine.auto_continue_agent import should_auto_continue
+from src.engine.auto_continue_budget import AutoContinueBudget
+from src.utils.turn_context import TurnContext, TurnCancelled, turn_context, report_stage
+
+# Dernier worker ayant joué chaque histoire, pour tout le processus.
+# Un rafraîchissement de la page ouvre une nouvelle session, donc un nouveau
+# worker : le tour que l'ancien jouait encore sur l'histoire doit être arrêté.
+_story_workers: "weakref.WeakValueDictionary[str, TurnWorker]" = weakref.WeakValueDictionary()
+_registry_lock = threading.Lock()
+
+
+class TurnWorker:
+    """
+    Exécute les appels au moteur (nouvelle histoire, tour de jeu) dans un
+    thread d'arrière-plan, pour que l'interface reste réactive.
+
+    Un worker par session de jeu. Un seul travail à la fois : en soumettre
+    un nouveau annule celui en cours. L'interface interroge poll() pour
+    afficher la progression, puis récupère le résultat avec take_result().
+
+    Les écritures partagées d'un tour (mémoire longue, suivi des entités)
+    ne sont appliquées que par take_result : un tour annulé, remplacé ou
+    jamais récupéré n'en laisse aucune.
+    """
+
+    def __init__(self, session: Optional[str] = None):
+        """
+        Paramètres :
+            session (str | None) : identifiant de la session de jeu, repris
+                                   dans le registre de tokens.
+        """
+        self.session = session
+        self._lock = threading.Lock()
+        self._job_id = 0
+        self._turn: Optional[TurnContext] = None
+        self._status = "idle"
+        self._kind = None
+        self._result = None
+        self._error = None
+
+    def submit_start(self, theme: str):
+        """
+        Lance la création d'une nouvelle histoire (codex + première scène).
+        """
+        self._submit("start", self._start_job, theme)
+
+    def submit_turn(self, user_input: str, codex: Dict[str, Any], state: Dict[str, Any]):
+        """
+        Lance un tour de jeu. Le moteur travaille sur une copie de l'état :
+        un tour annulé laisse l'état de la session intact.
+        """
+        self.claim(state.get("story_id"))
+        self._submit("turn", next_step, user_input, codex, copy.deepcopy(state))
+
+    def claim(self, story_id: Optional[str]):
+        """
+        Déclare que ce worker joue désormais l'histoire : un autre worker qui
+        la jouait (session d'avant un rafraîchissement) voit son tour annulé.
+        """
+        if not story_id:
+            return
+        with _registry_lock:
+            previous = _story_workers.get(story_id)
+            _story_workers[story_id] = self
+        if previous is not None and previous is not self:
+            previous.cancel()
+
+    def _submit(self, kind, job, *args):
+        with self._lock:
+            if self._turn is not None:
+                self._turn.cancel()
+            self._job_id += 1
+            self._turn = TurnContext(self.session, deferred=True)
+            self._status = "running"
+            self._kind = kind
+            self._result = None
+            self._error = None
+            job_id, turn = self._job_id, self._turn
+
+        thread = threading.Thread(
+            target=self._run,
+            args=(job_id, turn, job, args),
+            name=f"turn-{job_id}",
+            daemon=True
+        )
+        thread.start()
+
+    @staticmethod
+    def _start_job(theme: str):
+        # La création de l'histoire compte dans le budget du clic.
+        budget = AutoContinueBudget()
+        mode = "fused" if FUSED_TURN_MODE else "pipeline"
+        data = start_story(theme=theme)
+        scene = data["scene"]
+        # Décision d'auto-continue sur la première scène, prise ici pour
+        # que l'interface n'ait pas à appeler le modèle elle-même.
+        if "auto_continue" not in scene and not scene.get("fallback") and budget.allows_another(mode):
+            report_stage("deciding")
+            scene["auto_continue"] = should_auto_continue(scene, data["state"], data["codex"]) == "AUTO_CONTINUE"
+
+        # Ouverture de transition : on enchaîne dans le même budget.
+        # La première scène précède alors les scènes enchaînées, comme pour un tour ;
+        # l'état d'ouverture est gardé pour que le journal débute à la première scène.
+        data["opening_state"] = copy.deepcopy(data["state"])
+        if scene.get("auto_continue") and budget.allows_another(mode):
+            budget.chain()
+            final, data["state"] = next_step("", data["codex"], data["state"], budget=budget)
+            final["chained_scenes"] = [scene] + final["chained_scenes"]
+            data["scene"] = final
+        else:
+            scene["auto_continue"] = bool(scene.get("auto_continue"))
+            scene["chained_steps"] = 0
+            scene["chained_scenes"] = []
+        return data
+
+    def _run(self, job_id, turn, job, args):
+        try:
+            with turn_context(turn):
+                result = job(*args)
+            status, error = "done", None
+        except TurnCancelled:
+            result, status, error = None, "cancelled", None
+        except Exception as e:
+            print("❌ Erreur du moteur en arrière-plan :", e)
+            result, status, error = None, "error", str(e)
+
+        with self._lock:
+            # Le résultat d'un travail remplacé ou annulé entre-temps est ignoré.
+            if job_id == self._job_id and self._status == "running":
+                self._status = "cancelled" if turn.cancelled else status
+                self._result = result if self._status == "done" else None
+                self._error = error
+
+    def cancel(self):
+        """
+        Annule le travail en cours ; le flux Ollama est fermé au prochain fragment.
+        """
+        with self._lock:
+            if self._turn is not None and self._status == "running":
+                self._turn.cancel()
+                self._status = "cancelled"
+
+    def poll(self) -> Dict[str, Any]:
+        """
+        Retourne l'état du worker : status ("idle", "running", "done",
+        "cancelled", "error"), type de travail, étape en cours, texte reçu
+        du modèle pendant l'appel en cours et éventuelle erreur.
+        """
+        with self._lock:
+            status, kind, error, turn = self._status, self._kind, self._error, self._turn
+        progress = turn.snapshot() if turn is not None else {"stage": None, "text": ""}
+        return {
+            "status": status,
+            "kind": kind,
+            "stage": progress["stage"],
+            "text": progress["text"],
+            "error": error
+        }
+
+    def take_result(self) -> Optional[Dict[str, Any]]:
+        """
+        Retourne le travail terminé une seule fois, puis repasse au repos.
+        Les écritures partagées d'un travail réussi sont appliquées ici.
+
+        Retour :
+            dict | None : {"kind", "status", "result", "error"}, ou None si
+                          aucun travail n'est terminé.
+        """
+        with self._lock:
+            if self._status in ("idle", "running"):
+                return None
+            outcome = {
+                "kind": self._kind,
+                "status": self._status,
+                "result": self._result,
+                "error": self._error
+            }
+            self._status = "idle"
+            self._result = None
+            turn = self._turn
+        if outcome["status"] == "done" and turn is not None:
+            turn.accept()
+        return outcome
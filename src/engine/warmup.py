@@ -0,0 +1,130 @@
+import threading
+import time
+from typing import Dict, Any
+
+from src.engine import codex, scene, intent_classifier, auto_continue_agent, fused_turn
+from src.utils.ollama_client import ollama_chat
+
+# Étapes du préchauffage, dans l'ordre d'exécution.
+STAGES = ("models", "embeddings", "rag")
+
+# Délai de chargement d'un modèle Ollama (s) : le premier chargement peut être
+# long, mais un serveur bloqué ne doit pas garder le préchauffage indéfiniment.
+WARMUP_DEADLINE_S = 600.0
+
+_status: Dict[str, Dict[str, Any]] = {
+    stage: {"state": "pending", "seconds": None, "error": None} for stage in STAGES
+}
+_thread = None
+_lock = threading.Lock()
+
+
+def configured_models():
+    """
+    Liste des modèles Ollama utilisés par le moteur (sans doublons).
+    """
+    names = [
+        codex.MODEL_NAME,
+        scene.MODEL_NAME,
+        intent_classifier.MODEL_NAME,
+        auto_continue_agent.MODEL_NAME,
+        fused_turn.MODEL_NAME
+    ]
+    return sorted(set(names))
+
+
+def _warm_models():
+    # Une réponse d'un seul token suffit à charger le modèle en mémoire ;
+    # il y reste DEFAULT_KEEP_ALIVE, durée renouvelée par chaque appel du moteur.
+    late = []
+    for model in configured_models():
+        raw = ollama_chat(
+            model,
+            [{"role": "user", "content": "Réponds OK."}],
+            options={"num_predict": 1},
+            stage="warmup",
+            deadline=WARMUP_DEADLINE_S
+        )
+        if raw.done_reason == "deadline":
+            late.append(model)
+    if late:
+        raise RuntimeError(f"modèles non chargés après {WARMUP_DEADLINE_S:.0f} s : {', '.join(late)}")
+
+
+def _warm_embeddings():
+    # get_embeddings() charge le modèle d'embedding ; le premier calcul initialise ONNX.
+    from src.memory.vector_store import get_flat_store
+    from src.memory.embeddings import get_embeddings
+
+    get_embeddings().embed_query("Préchauffage de la mémoire.")
+    get_flat_store()
+
+
+def _warm_rag(theme: str):
+    from src.rag.loader import load_rag
+    from src.rag.store import get_lore_store
+
+    store = get_lore_store()
+    if store is not None:
+        store.search("forêt", theme)
+    else:
+        load_rag(theme)
+
+
+def _run(theme: str):
+    steps = {
+        "models": _warm_models,
+        "embeddings": _warm_embeddings,
+        "rag": lambda: _warm_rag(theme)
+    }
+    for stage in STAGES:
+        with _lock:
+            _status[stage]["state"] = "running"
+        started = time.perf_counter()
+        try:
+            steps[stage]()
+            state, error = "ready", None
+        except Exception as e:
+            # Une étape en échec n'empêche pas les suivantes : le jeu reste
+            # utilisable, le premier tour paiera simplement ce chargement.
+            print(f"❌ Préchauffage '{stage}' en échec :", e)
+            state, error = "error", str(e)
+        with _lock:
+            _status[stage].update(state=state, seconds=time.perf_counter() - started, error=error)
+
+
+def start_warmup(theme: str = "fantasy") -> threading.Thread:
+    """
+    Lance le préchauffage en arrière-plan (une seule fois par processus) :
+    - chaque modèle Ollama configuré reçoit une requête minuscule avec keep_alive
+    - le modèle d'embedding est chargé et la mémoire vectorielle créée
+    - les données du RAG sont lues et mises en cache
+
+    Paramètres :
+        theme (str) : thème dont le RAG est préchargé.
+
+    Retour :
+        threading.Thread : le thread de préchauffage.
+    """
+    global _thread
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_run, args=(theme.lower(),), name="warmup", daemon=True)
+            _thread.start()
+    return _thread
+
+
+def get_warmup_status() -> Dict[str, Dict[str, Any]]:
+    """
+    Retourne l'état de chaque étape : "pending", "running", "ready" ou "error",
+    avec sa durée en secondes et l'éventuelle erreur.
+    """
+    with _lock:
+        return {stage: dict(info) for stage, info in _status.items()}
+
+
+def is_warm() -> bool:
+    """
+    Indique si le préchauffage est terminé (avec ou sans erreur).
+    """
+    return all(info["state"] in ("ready", "error") for info in get_warmup_status().values())
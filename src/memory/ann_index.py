@@ -0,0 +1,203 @@
+import math
+import os
+from typing import Optional
+
+import faiss
+import numpy as np
+
+# Types d'index disponibles pour la mémoire FAISS :
+# - "flat" : recherche exacte, 4 octets par dimension
+# - "hnsw" : graphe HNSW, rapide sur de gros volumes, vecteurs non compressés
+# - "int8" : recherche exhaustive sur des vecteurs quantifiés sur 8 bits (4x plus petits)
+# - "ivfpq" : listes inversées + quantification produit, pour les très gros corpus
+# - "auto" : "flat", puis "hnsw" au-delà du seuil ci-dessous
+# Les index quantifiés perdent du rappel (environ 72 % pour "ivfpq" sur le banc
+# bench/ann_index.py) : ils ne sont utilisés que s'ils sont choisis explicitement.
+INDEX_TYPES = ("flat", "hnsw", "int8", "ivfpq")
+
+# Seuil de promotion automatique (nombre de vecteurs).
+HNSW_THRESHOLD = 20_000
+
+# Taille de référence d'un corpus "ivfpq", pour dimensionner ses listes inversées.
+IVFPQ_THRESHOLD = 500_000
+
+# Paramètres HNSW : voisins par nœud et largeur de recherche.
+HNSW_M = 32
+HNSW_EF_SEARCH = 64
+
+# Paramètres IVF-PQ : listes sondées par recherche, octets par vecteur compressé.
+IVF_NPROBE = 16
+PQ_BYTES = 48
+
+# Nombre minimal de vecteurs d'entraînement pour les index quantifiés,
+# et taille maximale de l'échantillon d'entraînement lors d'une promotion.
+INT8_MIN_TRAIN = 1_000
+IVF_POINTS_PER_LIST = 39
+TRAIN_SAMPLE = 100_000
+
+
+def ivf_lists(n: int) -> int:
+    """
+    Nombre de listes inversées pour n vecteurs (environ 4·√n).
+    """
+    return max(1, int(4 * math.sqrt(n)))
+
+
+def min_train_size(kind: str, n: int = 0) -> int:
+    """
+    Nombre de vecteurs nécessaires pour entraîner un index de ce type.
+    """
+    if kind == "int8":
+        return INT8_MIN_TRAIN
+    if kind == "ivfpq":
+        return IVF_POINTS_PER_LIST * ivf_lists(max(n, IVFPQ_THRESHOLD))
+    return 0
+
+
+def resolve_index_type(configured: str, n: int) -> str:
+    """
+    Type d'index à utiliser pour n vecteurs.
+
+    En mode "auto", l'index est promu de "flat" à "hnsw" au-delà du seuil.
+    Un type quantifié choisi explicitement reste en "flat" tant qu'il n'y a
+    pas assez de vecteurs pour l'entraîner.
+    """
+    if configured == "auto":
+        if n >= HNSW_THRESHOLD:
+            return "hnsw"
+        return "flat"
+
+    if configured not in INDEX_TYPES:
+        raise ValueError(f"Type d'index inconnu : {configured}")
+    if n < min_train_size(configured, n):
+        return "flat"
+    return configured
+
+
+def _pq_subquantizers(dim: int) -> int:
+    # Le nombre de sous-quantificateurs doit diviser la dimension.
+    m = min(PQ_BYTES, dim)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def build_index(kind: str, dim: int, train_vectors: Optional[np.ndarray] = None, n: Optional[int] = None) -> faiss.Index:
+    """
+    Crée un index FAISS vide, en produit scalaire (vecteurs normalisés = cosinus).
+
+    Paramètres :
+        kind (str) : type d'index (voir INDEX_TYPES).
+        dim (int) : dimension des vecteurs.
+        train_vectors (np.ndarray | None) : vecteurs d'entraînement, requis
+                                            pour "int8" et "ivfpq".
+        n (int | None) : nombre de vecteurs attendus, pour dimensionner les listes
+                         IVF (par défaut : taille de l'échantillon d'entraînement).
+
+    Retour :
+        faiss.Index : index prêt à recevoir des vecteurs.
+    """
+    if kind == "flat":
+        return faiss.IndexFlatIP(dim)
+
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        return index
+
+    if train_vectors is None:
+        raise ValueError(f"L'index '{kind}' doit être entraîné.")
+    train_vectors = np.ascontiguousarray(train_vectors, dtype=np.float32)
+
+    if kind == "int8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+    elif kind == "ivfpq":
+        quantizer = faiss.IndexFlatIP(dim)
+        nlist = max(1, min(ivf_lists(n or len(train_vectors)), len(train_vectors) // IVF_POINTS_PER_LIST))
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_subquantizers(dim), 8, faiss.METRIC_INNER_PRODUCT)
+        index.nprobe = IVF_NPROBE
+    else:
+        raise ValueError(f"Type d'index inconnu : {kind}")
+
+    index.train(train_vectors)
+    return index
+
+
+def index_type(index: faiss.Index) -> str:
+    """
+    Type (au sens de INDEX_TYPES) d'un index FAISS existant.
+    """
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "int8"
+    return "flat"
+
+
+def promote(index: faiss.Index, kind: str) -> faiss.Index:
+    """
+    Reconstruit un index sous un autre type, avec les mêmes vecteurs
+    dans le même ordre (les positions restent valables).
+    """
+    vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else np.zeros((0, index.d), dtype=np.float32)
+    return build_from_vectors(kind, index.d, vectors)
+
+
+def build_from_vectors(kind: str, dim: int, vectors: np.ndarray) -> faiss.Index:
+    """
+    Construit un index de ce type contenant `vectors`, dans l'ordre
+    (entraînement compris : l'appel peut être long sur de gros volumes).
+    """
+    train = None
+    if kind in ("int8", "ivfpq"):
+        # L'entraînement se fait sur un échantillon : sa durée reste bornée.
+        train = vectors
+        if len(vectors) > TRAIN_SAMPLE:
+            rng = np.random.default_rng(0)
+            train = vectors[rng.choice(len(vectors), TRAIN_SAMPLE, replace=False)]
+    new_index = build_index(kind, dim, train, n=len(vectors))
+    if len(vectors):
+        new_index.add(vectors)
+    if isinstance(new_index, faiss.IndexIVF):
+        # Permet de reconstruire les vecteurs plus tard (sauvegarde, nouvelle promotion).
+        new_index.make_direct_map()
+    return new_index
+
+
+def save_index(index: faiss.Index, path: str):
+    """
+    Écrit un index (entraîné) sur disque, de façon atomique.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = path + ".tmp"
+    faiss.write_index(index, tmp)
+    os.replace(tmp, path)
+
+
+def configure_search(index: faiss.Index) -> faiss.Index:
+    """
+    Applique les paramètres de recherche actuels (efSearch, nprobe) à un index relu.
+    """
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = IVF_NPROBE
+    return index
+
+
+def load_index(path: str) -> faiss.Index:
+    """
+    Relit un index écrit par save_index.
+    """
+    return configure_search(faiss.read_index(path))
+
+
+def index_bytes(index: faiss.Index) -> int:
+    """
+    Taille sérialisée de l'index, en octets.
+    """
+    return int(faiss.serialize_index(index).size)
@@ -0,0 +1,290 @@
+import queue
+import re
+import threading
+import time
+from typing import Dict, Any, List, Callable, Optional
+
+from src.memory.embeddings import get_embeddings
+from src.memory.flat_store import FlatMemoryStore
+
+# Nombre d'entrées d'une histoire au-delà duquel la compaction est lancée.
+COMPACTION_THRESHOLD = 120
+
+# Taille maximale de la mémoire d'une histoire après compaction.
+MAX_ENTRIES_PER_STORY = 150
+
+# Les scènes les plus récentes ne sont jamais résumées.
+KEEP_RECENT = 30
+
+# Nombre de scènes regroupées dans un même résumé.
+COMPACTION_BATCH = 8
+
+# Modèle utilisé pour résumer les scènes, et longueur maximale d'un résumé.
+SUMMARY_MODEL = "mistral"
+SUMMARY_MAX_CHARS = 1200
+
+# Limites de l'appel de résumé (environ 4 caractères par token).
+SUMMARY_DEADLINE_S = 120.0
+SUMMARY_MAX_TOKENS = SUMMARY_MAX_CHARS // 3
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s")
+
+
+def extractive_summary(texts: List[str], max_chars: int = SUMMARY_MAX_CHARS) -> str:
+    """
+    Résumé de secours sans modèle : la première phrase de chaque scène.
+    """
+    sentences = [_SENTENCE_END.split(text.strip(), 1)[0] for text in texts if text.strip()]
+    return " ".join(sentences)[:max_chars]
+
+
+def summarize_scenes(texts: List[str]) -> str:
+    """
+    Résume un groupe de scènes consécutives en un paragraphe, avec le modèle.
+    En cas d'échec, le résumé extractif est utilisé.
+
+    Paramètres :
+        texts (list[str]) : scènes (ou résumés) à regrouper, dans l'ordre.
+
+    Retour :
+        str : le résumé.
+    """
+    from src.utils.ollama_client import ollama_chat, is_truncated
+
+    scenes = "\n---\n".join(texts)
+    prompt = f"""
+Voici des scènes successives d'une histoire interactive.
+Écris un résumé en français de {SUMMARY_MAX_CHARS} caractères maximum.
+Garde les noms des personnages, des lieux et des objets, les décisions du joueur
+et les faits qui pourraient compter plus tard. Réponds uniquement par le résumé.
+
+Scènes :
+{scenes}
+"""
+    try:
+        raw = ollama_chat(
+            SUMMARY_MODEL,
+            [
+                {"role": "system", "content": "Tu résumes fidèlement des scènes d'une histoire."},
+                {"role": "user", "content": prompt}
+            ],
+            stage="compaction",
+            deadline=SUMMARY_DEADLINE_S,
+            max_tokens=SUMMARY_MAX_TOKENS
+        )
+        # Un résumé coupé risque d'omettre les derniers faits : on préfère l'extractif.
+        summary = "" if is_truncated(raw) else raw.strip()
+    except Exception as e:
+        print("❌ Résumé de scènes en échec :", e)
+        summary = ""
+
+    return summary[:SUMMARY_MAX_CHARS] if summary else extractive_summary(texts)
+
+
+def plan_compaction(
+    entries: List[Dict[str, Any]],
+    keep_recent: int = KEEP_RECENT,
+    batch: int = COMPACTION_BATCH,
+    summaries: bool = False,
+    include_current: bool = False
+) -> List[List[int]]:
+    """
+    Choisit les groupes d'entrées à fusionner.
+
+    Seules les entrées anciennes (hors des `keep_recent` dernières) d'un
+    milestone terminé sont concernées, ou aussi celles du milestone en cours
+    avec `include_current`. Les groupes ne mélangent jamais deux milestones.
+
+    Paramètres :
+        entries (list[dict]) : {"id", "metadata"} de l'histoire, du plus ancien au plus récent.
+        keep_recent (int) : nombre d'entrées récentes à préserver.
+        batch (int) : taille maximale d'un groupe.
+        summaries (bool) : False pour regrouper les scènes, True pour
+                           fusionner entre eux les résumés d'un même milestone.
+        include_current (bool) : admet aussi le milestone en cours (et les
+                                 entrées sans milestone).
+
+    Retour :
+        list[list[int]] : groupes d'identifiants (au moins deux par groupe).
+    """
+    if len(entries) <= keep_recent:
+        return []
+
+    current = entries[-1]["metadata"].get("milestone_index")
+    if current is None and not include_current:
+        return []
+
+    groups: List[List[int]] = []
+    group: List[int] = []
+    group_milestone = None
+    for entry in entries[:len(entries) - keep_recent]:
+        metadata = entry["metadata"]
+        milestone = metadata.get("milestone_index")
+        if include_current:
+            finished = milestone is None or current is None or milestone <= current
+        else:
+            finished = milestone is not None and milestone < current
+        eligible = finished and bool(metadata.get("summary")) == summaries
+        if not eligible:
+            continue
+        if group and (milestone != group_milestone or len(group) >= batch):
+            groups.append(group)
+            group = []
+        group.append(entry["id"])
+        group_milestone = milestone
+    if group:
+        groups.append(group)
+
+    return [g for g in groups if len(g) >= 2]
+
+
+def _merge(store: FlatMemoryStore, ids: List[int], summarizer: Callable[[List[str]], str], embeddings) -> bool:
+    texts = [store.texts.get(i) for i in ids]
+    metadatas = [store.metadatas.get(i) for i in ids]
+    if any(t is None for t in texts) or any(m is None for m in metadatas):
+        return False
+
+    summary = summarizer(texts)
+    vector = embeddings.embed_documents([summary])[0]
+    metadata = {
+        "story_id": metadatas[-1].get("story_id"),
+        "milestone_index": metadatas[-1].get("milestone_index"),
+        "flags": metadatas[-1].get("flags", {}),
+        "summary": True,
+        "scene_count": sum(m.get("scene_count", 1) for m in metadatas)
+    }
+
+    # Le résumé prend la place de la plus ancienne scène du groupe.
+    if store.replace(ids[0], vector, summary, metadata) is None:
+        return False
+    store.remove(ids[1:])
+    return True
+
+
+def compact_story(
+    story_id: str,
+    store: Optional[FlatMemoryStore] = None,
+    summarizer: Callable[[List[str]], str] = summarize_scenes,
+    embeddings=None,
+    max_entries: int = MAX_ENTRIES_PER_STORY,
+    keep_recent: int = KEEP_RECENT,
+    batch: int = COMPACTION_BATCH,
+    threshold: int = COMPACTION_THRESHOLD
+) -> Dict[str, Any]:
+    """
+    Compacte la mémoire longue d'une histoire :
+    1. les anciennes scènes des milestones terminés sont résumées par groupes
+       de `batch`, et chaque groupe est remplacé par son résumé ;
+    2. si l'histoire dépasse encore `threshold` (milestone qui n'avance pas),
+       les anciennes scènes du milestone en cours sont résumées de même ;
+    3. si l'histoire dépasse encore `max_entries`, les résumés d'un même
+       milestone sont fusionnés ;
+    4. en dernier recours, les entrées les plus anciennes sont supprimées.
+
+    Retour :
+        dict : tailles avant/après, résumés créés, entrées supprimées, durée.
+    """
+    if store is None:
+        from src.memory.vector_store import get_flat_store
+        store = get_flat_store()
+    embeddings = embeddings or get_embeddings()
+
+    started = time.perf_counter()
+    before = store.story_count(story_id)
+    report = {"story_id": story_id, "before": before, "summaries": 0, "dropped": 0}
+
+    def entries():
+        return [{"id": i, "metadata": store.metadatas.get(i, {})} for i in store.story_entries(story_id)]
+
+    for group in plan_compaction(entries(), keep_recent, batch):
+        report["summaries"] += _merge(store, group, summarizer, embeddings)
+
+    remaining = entries()
+    if len(remaining) > threshold:
+        for group in plan_compaction(remaining, keep_recent, batch, include_current=True):
+            report["summaries"] += _merge(store, group, summarizer, embeddings)
+
+    remaining = entries()
+    if len(remaining) > max_entries:
+        groups = plan_compaction(remaining, keep_recent, batch=len(remaining), summaries=True, include_current=True)
+        for group in groups:
+            report["summaries"] += _merge(store, group, summarizer, embeddings)
+
+    ids = store.story_entries(story_id)
+    if len(ids) > max_entries:
+        report["dropped"] = store.remove(ids[:len(ids) - max_entries])
+
+    report["after"] = store.story_count(story_id)
+    report["seconds"] = time.perf_counter() - started
+    return report
+
+
+# ============================================================
+# COMPACTION EN ARRIÈRE-PLAN
+# ============================================================
+
+_queue: "queue.Queue[str]" = queue.Queue()
+_pending = set()
+_thread = None
+_lock = threading.Lock()
+
+# Taille des histoires dont la dernière compaction n'a rien libéré : elles ne
+# sont reprogrammées qu'une fois assez de nouvelles entrées arrivées pour
+# former un groupe (voir schedule_compaction).
+_idle: Dict[str, int] = {}
+
+
+def _worker():
+    while True:
+        story_id = _queue.get()
+        try:
+            report = compact_story(story_id)
+            print("Compaction de la mémoire :", report)
+            with _lock:
+                if report["after"] >= report["before"]:
+                    _idle[story_id] = report["after"]
+                else:
+                    _idle.pop(story_id, None)
+        except Exception as e:
+            print("❌ Compaction de la mémoire en échec :", e)
+        finally:
+            with _lock:
+                _pending.discard(story_id)
+            _queue.task_done()
+
+
+def schedule_compaction(story_id: str, size: int) -> bool:
+    """
+    Programme la compaction d'une histoire si sa mémoire dépasse le seuil.
+    Les compactions sont faites une par une, dans un thread d'arrière-plan ;
+    une histoire déjà en attente n'est pas ajoutée deux fois, et une histoire
+    dont la dernière compaction n'a rien libéré attend COMPACTION_BATCH
+    nouvelles entrées.
+
+    Paramètres :
+        story_id (str) : histoire concernée.
+        size (int) : nombre actuel d'entrées de l'histoire.
+
+    Retour :
+        bool : True si une compaction a été programmée.
+    """
+    global _thread
+    if not story_id or size <= COMPACTION_THRESHOLD:
+        return False
+
+    with _lock:
+        if story_id in _pending or size < _idle.get(story_id, 0) + COMPACTION_BATCH:
+            return False
+        _pending.add(story_id)
+        if _thread is None:
+            _thread = threading.Thread(target=_worker, name="memory-compaction", daemon=True)
+            _thread.start()
+    _queue.put(story_id)
+    return True
+
+
+def wait_for_compaction():
+    """
+    Attend la fin des compactions programmées (bancs d'essai, arrêt propre).
+    """
+    _queue.join()
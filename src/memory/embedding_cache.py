@@ -0,0 +1,275 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Nombre maximum d'embeddings gardés en mémoire vive.
+MEMORY_CACHE_SIZE = 4096
+
+# Nombre maximum d'embeddings gardés dans le cache disque.
+DISK_CACHE_SIZE = 100_000
+
+
+def text_key(text: str, namespace: str = "") -> str:
+    """
+    Clé de cache d'un texte : empreinte SHA-1 du texte et de l'espace de noms
+    (nom du modèle), pour ne jamais mélanger deux modèles d'embedding.
+    """
+    return hashlib.sha1(f"{namespace}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class DiskEmbeddingCache:
+    """
+    Cache disque des embeddings, en tableau mappé en mémoire (np.memmap).
+
+    - vectors.f32 : tableau (capacity, dim) de float32, lu à la demande par le système
+    - keys.jsonl : journal en ajout seul "clé -> case", relu à l'ouverture
+    - meta.json : dimension des vecteurs, pour rouvrir le cache au démarrage
+
+    Les cases sont réutilisées en tourniquet : une fois le cache plein,
+    la plus ancienne entrée est écrasée. La taille sur disque reste donc bornée.
+    """
+
+    def __init__(self, directory: str, dim: int, capacity: int = DISK_CACHE_SIZE):
+        os.makedirs(directory, exist_ok=True)
+        self.dim = dim
+        self.capacity = capacity
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.keys_path = os.path.join(directory, "keys.jsonl")
+        self.meta_path = os.path.join(directory, "meta.json")
+
+        # Un fichier d'une autre taille (capacité ou dimension modifiée) est recréé.
+        expected_size = capacity * dim * np.dtype(np.float32).itemsize
+        reuse = os.path.exists(self.vectors_path) and os.path.getsize(self.vectors_path) == expected_size
+        if not reuse and os.path.exists(self.keys_path):
+            os.remove(self.keys_path)
+        self._vectors = np.memmap(
+            self.vectors_path, dtype=np.float32, mode="r+" if reuse else "w+", shape=(capacity, dim)
+        )
+        with open(self.meta_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": dim}, f)
+
+        # Relecture du journal des clés : la dernière écriture d'une case l'emporte.
+        self._slots: Dict[str, int] = {}
+        self._keys: List[Optional[str]] = [None] * capacity
+        self._next = 0
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        key, slot = json.loads(line)
+                    except (ValueError, TypeError):
+                        continue
+                    previous = self._keys[slot]
+                    if previous is not None and self._slots.get(previous) == slot:
+                        del self._slots[previous]
+                    self._keys[slot] = key
+                    self._slots[key] = slot
+                    self._next = (slot + 1) % capacity
+
+        # Le journal est réécrit au propre s'il est devenu beaucoup plus long que le cache.
+        self._lines = len(self._slots)
+        self._compact()
+        self._log = open(self.keys_path, "a", encoding="utf-8")
+
+    @classmethod
+    def open_existing(cls, directory: str, capacity: int = DISK_CACHE_SIZE) -> Optional["DiskEmbeddingCache"]:
+        """
+        Rouvre un cache disque existant, ou renvoie None s'il n'y en a pas encore.
+        """
+        try:
+            with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+                dim = json.load(f)["dim"]
+        except (OSError, ValueError, KeyError):
+            return None
+        return cls(directory, dim=dim, capacity=capacity)
+
+    def _compact(self):
+        tmp_path = self.keys_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for key, slot in self._slots.items():
+                f.write(json.dumps([key, slot]) + "\n")
+        os.replace(tmp_path, self.keys_path)
+        self._lines = len(self._slots)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        slot = self._slots.get(key)
+        if slot is None:
+            return None
+        return np.array(self._vectors[slot])
+
+    def put(self, key: str, vector: np.ndarray):
+        if key in self._slots:
+            return
+
+        slot = self._next
+        self._next = (slot + 1) % self.capacity
+
+        previous = self._keys[slot]
+        if previous is not None:
+            self._slots.pop(previous, None)
+
+        self._vectors[slot] = vector
+        self._keys[slot] = key
+        self._slots[key] = slot
+
+        self._log.write(json.dumps([key, slot]) + "\n")
+        self._log.flush()
+        self._lines += 1
+
+        if self._lines > 2 * self.capacity:
+            self._log.close()
+            self._compact()
+            self._log = open(self.keys_path, "a", encoding="utf-8")
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Cache d'embeddings placé devant un modèle (FastEmbedEmbeddings ou compatible).
+
+    Même interface que le modèle : embed_documents(texts) et embed_query(text).
+    Chaque texte est identifié par son empreinte SHA-1 ; on cherche d'abord
+    dans un cache LRU en mémoire, puis dans le cache disque optionnel,
+    et seuls les textes absents des deux sont envoyés au modèle, en un seul lot.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        namespace: str = "",
+        max_entries: int = MEMORY_CACHE_SIZE,
+        disk_dir: Optional[str] = None,
+        disk_capacity: int = DISK_CACHE_SIZE
+    ):
+        self.embeddings = embeddings
+        self.namespace = namespace or getattr(embeddings, "model_name", "") or type(embeddings).__name__
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_capacity = disk_capacity
+
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Le cache disque est rouvert s'il existe ; sinon il sera créé au premier
+        # vecteur calculé, quand la dimension du modèle est connue.
+        self._disk: Optional[DiskEmbeddingCache] = None
+        if disk_dir is not None:
+            self._disk = DiskEmbeddingCache.open_existing(self._disk_path(), capacity=disk_capacity)
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    # --------------------------------------------------------
+    # Caches
+    # --------------------------------------------------------
+
+    def _lookup(self, key: str) -> Optional[np.ndarray]:
+        vector = self._memory.get(key)
+        if vector is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return vector
+
+        if self._disk is not None:
+            vector = self._disk.get(key)
+            if vector is not None:
+                self.disk_hits += 1
+                self._remember(key, vector)
+                return vector
+
+        return None
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_path(self) -> str:
+        # Un sous-dossier par modèle d'embedding.
+        return os.path.join(self.disk_dir, hashlib.sha1(self.namespace.encode("utf-8")).hexdigest()[:12])
+
+    def _store(self, key: str, vector: np.ndarray):
+        self._remember(key, vector)
+        if self.disk_dir is not None:
+            if self._disk is None:
+                self._disk = DiskEmbeddingCache(self._disk_path(), dim=len(vector), capacity=self.disk_capacity)
+            self._disk.put(key, vector)
+
+    # --------------------------------------------------------
+    # Interface du modèle d'embedding
+    # --------------------------------------------------------
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [text_key(text, self.namespace) for text in texts]
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+
+        with self._lock:
+            missing: Dict[str, List[int]] = {}
+            for i, key in enumerate(keys):
+                vector = self._lookup(key)
+                if vector is None:
+                    missing.setdefault(key, []).append(i)
+                else:
+                    results[i] = vector
+
+        if missing:
+            # Un seul appel au modèle pour tous les textes absents du cache.
+            todo = [texts[positions[0]] for positions in missing.values()]
+            computed = self.embeddings.embed_documents(todo)
+
+            with self._lock:
+                self.misses += len(todo)
+                for (key, positions), vector in zip(missing.items(), computed):
+                    vector = np.asarray(vector, dtype=np.float32)
+                    self._store(key, vector)
+                    for i in positions:
+                        results[i] = vector
+
+        return [vector.tolist() for vector in results]
+
+    def embed_query(self, text: str) -> List[float]:
+        # Les requêtes passent par le même cache que les documents : certains
+        # modèles ajoutent un préfixe aux requêtes, d'où une clé distincte.
+        key = text_key(text, self.namespace + ":query")
+
+        with self._lock:
+            vector = self._lookup(key)
+        if vector is not None:
+            return vector.tolist()
+
+        vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+        with self._lock:
+            self.misses += 1
+            self._store(key, vector)
+        return vector.tolist()
+
+    # --------------------------------------------------------
+    # Statistiques
+    # --------------------------------------------------------
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Retour :
+            dict : nombre de succès par niveau de cache, d'échecs, taux de succès
+                   et nombre d'entrées gardées dans chaque niveau.
+        """
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": len(self._disk) if self._disk is not None else 0
+            }
@@ -0,0 +1,466 @@
+"""
+Serveur d'embeddings partagé par tous les processus d'une machine.
+
+Un seul processus charge le modèle d'embedding ; les processus Streamlit,
+les processus du générateur en lot, etc. lui envoient leurs textes par un
+socket Unix ou un port local. Les requêtes qui arrivent en même temps sont
+regroupées en un seul appel au modèle, ce qui est bien plus efficace que
+des appels isolés.
+
+Usage :
+    python -m src.memory.embedding_server --socket /tmp/stories_embeddings.sock
+    python -m src.memory.embedding_server --port 7601
+
+Côté moteur, il suffit de définir la variable d'environnement
+EMBEDDING_SERVER (chemin du socket ou "hôte:port") : get_embeddings()
+renvoie alors un client RemoteEmbeddings au lieu de charger le modèle.
+
+Les clients s'authentifient avec la clé de la variable d'environnement
+EMBEDDING_SERVER_AUTHKEY (la même des deux côtés). Sur un port TCP, le
+serveur en exige toujours une : sans variable, il en tire une au hasard
+et l'affiche au démarrage.
+
+Protocole (messages de multiprocessing.connection, jamais de pickle) :
+    requête : JSON {"op": "documents" | "query" | "info" | "stats", "texts": [...]}
+    réponse : JSON {"n": ..., "dim": ...} suivi des vecteurs en float32 bruts,
+              ou JSON {"error": "..."} ; "info" et "stats" renvoient le JSON seul.
+"""
+import argparse
+import json
+import os
+import queue
+import secrets
+import socket
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client, answer_challenge, deliver_challenge
+from typing import Dict, Any, Callable, List, Optional, Tuple, Union
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Nombre maximum de textes calculés en un seul appel au modèle.
+MAX_BATCH = 64
+
+# Attente supplémentaire (ms) pour compléter un lot. Même sans attente, les
+# requêtes arrivées pendant le calcul du lot précédent sont regroupées.
+MAX_WAIT_MS = 0.0
+
+# Variable d'environnement contenant la clé d'authentification partagée.
+AUTHKEY_ENV = "EMBEDDING_SERVER_AUTHKEY"
+
+# Délai maximal d'attente d'une réponse du serveur, côté client (s).
+REQUEST_TIMEOUT_S = 30.0
+
+
+def default_authkey() -> Optional[bytes]:
+    """
+    Clé d'authentification lue dans EMBEDDING_SERVER_AUTHKEY, ou None.
+    """
+    value = os.environ.get(AUTHKEY_ENV)
+    return value.encode("utf-8") if value else None
+
+
+def _socket_in_use(path: str) -> bool:
+    """
+    Indique si un processus écoute encore sur le socket Unix.
+    """
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+
+def parse_address(value: str) -> Tuple[Union[str, Tuple[str, int]], str]:
+    """
+    Convertit "hôte:port" en adresse TCP, et tout le reste en chemin de socket Unix.
+
+    Retour :
+        (adresse, famille) : au format de multiprocessing.connection.
+    """
+    host, sep, port = value.rpartition(":")
+    if sep and port.isdigit() and "/" not in value:
+        return (host or "127.0.0.1", int(port)), "AF_INET"
+    return value, "AF_UNIX"
+
+
+def batches_queries(embeddings: Embeddings) -> bool:
+    """
+    Vrai si le modèle sait calculer plusieurs requêtes en un seul appel
+    (FastEmbed : query_embed accepte une liste et applique le préfixe des requêtes).
+    """
+    return callable(getattr(getattr(embeddings, "model", None), "query_embed", None))
+
+
+def embed_queries(embeddings: Embeddings, texts: List[str]) -> np.ndarray:
+    """
+    Embeddings de plusieurs requêtes, en un seul appel au modèle quand il le
+    permet (voir batches_queries), sinon un appel à embed_query par texte.
+    """
+    if batches_queries(embeddings):
+        vectors = embeddings.model.query_embed(
+            texts, batch_size=embeddings.batch_size, parallel=embeddings.parallel
+        )
+        return np.asarray(list(vectors), dtype=np.float32)
+    return np.asarray([embeddings.embed_query(t) for t in texts], dtype=np.float32)
+
+
+class _Request:
+    __slots__ = ("kind", "texts", "vectors", "error", "done")
+
+    def __init__(self, kind: str, texts: List[str]):
+        self.kind = kind
+        self.texts = texts
+        self.vectors: Optional[np.ndarray] = None
+        self.error: Optional[str] = None
+        self.done = threading.Event()
+
+
+class EmbeddingServer:
+    """
+    Serveur d'embeddings : un thread par client connecté, et un thread
+    unique qui regroupe les requêtes en lots et interroge le modèle.
+    """
+
+    def __init__(self, address: str, embeddings: Optional[Embeddings] = None,
+                 max_batch: int = MAX_BATCH, max_wait_ms: float = MAX_WAIT_MS,
+                 authkey: Optional[bytes] = None):
+        """
+        Paramètres :
+            address (str) : chemin du socket Unix ou "hôte:port".
+            embeddings (Embeddings | None) : modèle à servir (par défaut FastEmbed).
+            max_batch (int) : nombre maximum de textes par appel au modèle.
+            max_wait_ms (float) : attente maximale pour compléter un lot.
+            authkey (bytes | None) : clé exigée des clients (par défaut
+                                     EMBEDDING_SERVER_AUTHKEY ; tirée au
+                                     hasard sur un port TCP si absente).
+
+        Lève OSError si un autre serveur écoute déjà sur le socket Unix.
+        """
+        if embeddings is None:
+            from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
+            embeddings = FastEmbedEmbeddings()
+        self.embeddings = embeddings
+        self.model_name = getattr(embeddings, "model_name", "") or type(embeddings).__name__
+        self.dim = len(embeddings.embed_query("Initialisation du serveur d'embeddings."))
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+
+        self.address, self.family = parse_address(address)
+        self.authkey = authkey or default_authkey()
+        if self.authkey is None and self.family == "AF_INET":
+            # Un port TCP est joignable par tous les utilisateurs de la machine.
+            self.authkey = secrets.token_hex(16).encode("utf-8")
+        if self.family == "AF_UNIX" and os.path.exists(self.address):
+            if _socket_in_use(self.address):
+                raise OSError(f"Un serveur d'embeddings écoute déjà sur {self.address}.")
+            # Socket laissé par un serveur arrêté.
+            os.remove(self.address)
+        # L'authentification est faite dans le thread de chaque client, et non
+        # dans accept() : un client muet ne bloque pas les autres connexions.
+        self._listener = Listener(self.address, family=self.family)
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._closed = False
+
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.texts = 0
+        self.batches = 0
+        self.model_calls = 0
+
+    # --------------------------------------------------------
+    # Regroupement des requêtes
+    # --------------------------------------------------------
+
+    def _collect(self, first: _Request) -> List[_Request]:
+        batch = [first]
+        count = len(first.texts)
+        deadline = time.monotonic() + self.max_wait
+        while count < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    request = self._queue.get(timeout=remaining)
+                else:
+                    request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                # Arrêt demandé : on le remet pour la boucle principale.
+                self._queue.put(None)
+                break
+            batch.append(request)
+            count += len(request.texts)
+        return batch
+
+    def _compute(self, batch: List[_Request]):
+        calls = 0
+        documents = [r for r in batch if r.kind == "documents"]
+        try:
+            if any(r.texts for r in documents):
+                # Un seul appel au modèle pour tous les textes distincts du lot.
+                unique = list(dict.fromkeys(t for r in documents for t in r.texts))
+                vectors = np.asarray(self.embeddings.embed_documents(unique), dtype=np.float32)
+                calls += 1
+                rows = {text: i for i, text in enumerate(unique)}
+                for r in documents:
+                    r.vectors = vectors[[rows[t] for t in r.texts]]
+            for r in documents:
+                if not r.texts:
+                    r.vectors = np.zeros((0, self.dim), dtype=np.float32)
+
+            # Les requêtes ont leur propre préfixe (embed_query / query_embed) :
+            # elles forment un second appel au modèle, ou un appel par texte si
+            # le modèle ne sait pas les regrouper.
+            queries = [r for r in batch if r.kind == "query"]
+            unique = list(dict.fromkeys(t for r in queries for t in r.texts))
+            if unique:
+                vectors = embed_queries(self.embeddings, unique)
+                calls += 1 if batches_queries(self.embeddings) else len(unique)
+                rows = {text: i for i, text in enumerate(unique)}
+                for r in queries:
+                    r.vectors = vectors[[rows[t] for t in r.texts]]
+            for r in queries:
+                if not r.texts:
+                    r.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        except Exception as e:
+            print("❌ Calcul d'embeddings en échec :", e)
+            for r in batch:
+                if r.vectors is None:
+                    r.error = str(e)
+
+        with self._stats_lock:
+            self.batches += 1
+            self.model_calls += calls
+            self.requests += len(batch)
+            self.texts += sum(len(r.texts) for r in batch)
+        for r in batch:
+            r.done.set()
+
+    def _batch_loop(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            self._compute(self._collect(first))
+
+    # --------------------------------------------------------
+    # Connexions
+    # --------------------------------------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "model_name": self.model_name,
+                "requests": self.requests,
+                "texts": self.texts,
+                "batches": self.batches,
+                "model_calls": self.model_calls,
+                "texts_per_batch": self.texts / self.batches if self.batches else 0.0
+            }
+
+    def _reply(self, message: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[bytes]]:
+        op = message.get("op")
+        if op == "info":
+            return {"model_name": self.model_name, "dim": self.dim}, None
+        if op == "stats":
+            return self.stats(), None
+        if op not in ("documents", "query"):
+            return {"error": f"opération inconnue : {op}"}, None
+
+        texts = message.get("texts")
+        if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+            return {"error": "texts doit être une liste de chaînes"}, None
+
+        request = _Request(op, texts)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            return {"error": request.error}, None
+        return {"n": len(texts), "dim": self.dim}, request.vectors.tobytes()
+
+    def _serve_client(self, conn):
+        with conn:
+            if self.authkey is not None:
+                try:
+                    deliver_challenge(conn, self.authkey)
+                    answer_challenge(conn, self.authkey)
+                except (AuthenticationError, EOFError, OSError):
+                    return
+            while True:
+                try:
+                    raw = conn.recv_bytes()
+                except (EOFError, OSError):
+                    return
+                try:
+                    message = json.loads(raw.decode("utf-8"))
+                    header, payload = self._reply(message if isinstance(message, dict) else {})
+                except ValueError as e:
+                    header, payload = {"error": f"requête invalide : {e}"}, None
+                try:
+                    conn.send_bytes(json.dumps(header).encode("utf-8"))
+                    if payload is not None:
+                        conn.send_bytes(payload)
+                except (EOFError, OSError):
+                    return
+
+    def serve_forever(self):
+        """
+        Accepte les clients jusqu'à l'appel de close().
+        """
+        threading.Thread(target=self._batch_loop, name="embedding-batches", daemon=True).start()
+        while not self._closed:
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                if self._closed:
+                    return
+                raise
+            threading.Thread(target=self._serve_client, args=(conn,), daemon=True).start()
+
+    def close(self):
+        self._closed = True
+        self._queue.put(None)
+        self._listener.close()
+
+
+class RemoteEmbeddings(Embeddings):
+    """
+    Client du serveur d'embeddings, utilisable à la place du modèle local
+    (même interface embed_documents / embed_query, même model_name, donc
+    mêmes clés dans le cache d'embeddings).
+
+    Chaque thread garde sa propre connexion ; une connexion coupée est
+    rouverte une fois avant d'abandonner. Une réponse qui n'arrive pas dans
+    le délai ferme la connexion. Si un modèle de repli est fourni, il prend
+    alors le relais pour la suite du processus, au lieu de lever l'erreur.
+    """
+
+    def __init__(self, address: str, authkey: Optional[bytes] = None, timeout: float = REQUEST_TIMEOUT_S,
+                 fallback: Optional[Callable[[], Embeddings]] = None):
+        """
+        Paramètres :
+            address (str) : chemin du socket Unix ou "hôte:port".
+            authkey (bytes | None) : clé du serveur (par défaut EMBEDDING_SERVER_AUTHKEY).
+            timeout (float) : attente maximale d'une réponse (s).
+            fallback (callable | None) : construit le modèle local de repli.
+        """
+        self.address, self.family = parse_address(address)
+        self.authkey = authkey or default_authkey()
+        self.timeout = timeout
+        self._fallback = fallback
+        self._fallback_model: Optional[Embeddings] = None
+        self._fallback_lock = threading.Lock()
+        self._local = threading.local()
+        info, _ = self._call({"op": "info"})
+        self.model_name = info["model_name"]
+        self.dim = info["dim"]
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = Client(self.address, family=self.family, authkey=self.authkey)
+            self._local.conn = conn
+        return conn
+
+    def _receive(self, conn) -> bytes:
+        if not conn.poll(self.timeout):
+            raise TimeoutError(f"pas de réponse du serveur d'embeddings en {self.timeout} s")
+        return conn.recv_bytes()
+
+    def _drop_connection(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def _call(self, message: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[bytes]]:
+        for attempt in range(2):
+            try:
+                conn = self._connection()
+                conn.send_bytes(json.dumps(message).encode("utf-8"))
+                header = json.loads(self._receive(conn).decode("utf-8"))
+                payload = self._receive(conn) if "n" in header else None
+                break
+            except TimeoutError:
+                # La réponse tardive arriverait sur la requête suivante : on ferme.
+                self._drop_connection()
+                raise
+            except ValueError:
+                # Réponse illisible : le serveur attendait sans doute une clé.
+                self._drop_connection()
+                raise AuthenticationError("réponse illisible du serveur d'embeddings (clé d'authentification ?)")
+            except (EOFError, OSError):
+                self._drop_connection()
+                if attempt:
+                    raise
+        if "error" in header:
+            raise RuntimeError(f"Serveur d'embeddings : {header['error']}")
+        return header, payload
+
+    def _embed(self, op: str, texts: List[str]) -> np.ndarray:
+        model = self._fallback_model
+        if model is None:
+            try:
+                header, payload = self._call({"op": op, "texts": texts})
+                return np.frombuffer(payload, dtype=np.float32).reshape(header["n"], header["dim"])
+            except (EOFError, OSError, AuthenticationError) as e:
+                if self._fallback is None:
+                    raise
+                print(f"❌ Serveur d'embeddings indisponible ({e}) : modèle local.")
+                model = self._use_fallback()
+        if op == "documents":
+            return np.asarray(model.embed_documents(texts), dtype=np.float32)
+        return embed_queries(model, texts)
+
+    def _use_fallback(self) -> Embeddings:
+        with self._fallback_lock:
+            if self._fallback_model is None:
+                self._fallback_model = self._fallback()
+            return self._fallback_model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed("documents", list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed("query", [text])[0].tolist()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Statistiques du serveur (requêtes, lots, textes par lot).
+        """
+        return self._call({"op": "stats"})[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serveur d'embeddings partagé par les processus de la machine.")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--socket", default="/tmp/stories_embeddings.sock", help="chemin du socket Unix")
+    group.add_argument("--port", type=int, default=None, help="port TCP local (à la place du socket)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    args = parser.parse_args(argv)
+
+    address = f"{args.host}:{args.port}" if args.port is not None else args.socket
+    server = EmbeddingServer(address, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    print(f"Serveur d'embeddings ({server.model_name}, dimension {server.dim}) : {address}")
+    print(f"Côté moteur : EMBEDDING_SERVER={address}")
+    if server.authkey is not None and default_authkey() is None:
+        print(f"Clé tirée au hasard : {AUTHKEY_ENV}={server.authkey.decode('utf-8')}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
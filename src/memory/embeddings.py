@@ -0,0 +1,61 @@
+import os
+import threading
+
+from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
+
+from src.memory.embedding_cache import CachedEmbeddings
+
+# Dossier du cache disque des embeddings (None pour le désactiver).
+# Le cache disque n'est pas prévu pour être partagé par plusieurs processus.
+EMBEDDING_CACHE_DIR = None
+
+# Serveur d'embeddings partagé par les processus de la machine (voir
+# embedding_server.py) : chemin du socket Unix ou "hôte:port". Si la variable
+# d'environnement EMBEDDING_SERVER est vide, le modèle est chargé localement.
+EMBEDDING_SERVER = os.environ.get("EMBEDDING_SERVER") or None
+
+# Le modèle d'embedding est partagé par la mémoire longue et le RAG.
+# Il sera créé à la première utilisation, puis réutilisé.
+_embeddings = None
+
+# Le préchauffage et le premier joueur peuvent demander le modèle en même temps :
+# il ne doit être chargé qu'une fois.
+_lock = threading.Lock()
+
+
+def get_embeddings() -> CachedEmbeddings:
+    """
+    Retourne le modèle d'embedding partagé, précédé de son cache.
+
+    Le modèle FastEmbed est léger et fonctionne en local ; le cache évite
+    de recalculer l'embedding d'un texte déjà vu (scène mémorisée, choix
+    proposé puis cliqué par le joueur, etc.).
+
+    Si EMBEDDING_SERVER est défini, les textes sont envoyés au serveur
+    d'embeddings de la machine au lieu de charger le modèle dans ce processus.
+    Si le serveur est injoignable, ou cesse de répondre, le modèle local est utilisé.
+    """
+    global _embeddings
+    with _lock:
+        if _embeddings is None:
+            _embeddings = CachedEmbeddings(_load_model(), disk_dir=EMBEDDING_CACHE_DIR)
+    return _embeddings
+
+
+def _load_model():
+    if EMBEDDING_SERVER:
+        from multiprocessing import AuthenticationError
+        from src.memory.embedding_server import RemoteEmbeddings
+        try:
+            # Si le serveur cesse de répondre en cours de route, le modèle local prend le relais.
+            return RemoteEmbeddings(EMBEDDING_SERVER, fallback=FastEmbedEmbeddings)
+        except (OSError, EOFError, RuntimeError, AuthenticationError) as e:
+            print(f"❌ Serveur d'embeddings injoignable ({EMBEDDING_SERVER}) : modèle local.", e)
+    return FastEmbedEmbeddings()
+
+
+def embedding_cache_stats():
+    """
+    Retourne les statistiques du cache d'embeddings (taux de succès, tailles).
+    """
+    return get_embeddings().stats()
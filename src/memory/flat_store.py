@@ -0,0 +1,439 @@
+import math
+import threading
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from src.memory.ann_index import HNSW_THRESHOLD, HNSW_EF_SEARCH, build_from_vectors
+
+# Capacité initiale des tableaux ; elle double à chaque dépassement.
+INITIAL_CAPACITY = 256
+
+# Valeur utilisée pour un milestone absent des métadonnées.
+NO_MILESTONE = -1
+
+# Les lignes supprimées sont physiquement retirées quand elles dépassent
+# cette part des lignes occupées.
+REPACK_RATIO = 0.5
+
+# Sous cette part de lignes candidates, seules ces lignes sont scorées ;
+# au-delà, le produit sur tout le bloc contigu coûte moins que leur copie.
+GATHER_RATIO = 0.25
+
+# Au-delà de ANN_THRESHOLD entrées, un index HNSW (ann_index.py) est construit
+# en arrière-plan à côté des tableaux. Il sert aux recherches qui admettent au
+# moins ANN_MIN_CANDIDATES entrées ; les recherches plus sélectives (une histoire)
+# restent exactes sur leurs seules lignes candidates.
+ANN_THRESHOLD = HNSW_THRESHOLD
+ANN_MIN_CANDIDATES = 4_096
+
+# Sur-échantillonnage de l'index HNSW, en plus de l'inverse de la sélectivité
+# des filtres : marge pour les entrées obsolètes et le bonus de récence.
+ANN_OVERFETCH = 2.0
+
+# L'index HNSW est reconstruit quand cette part de ses vecteurs est obsolète
+# (entrées supprimées ou remplacées par un résumé).
+ANN_STALE_RATIO = 0.5
+
+
+class FlatMemoryStore:
+    """
+    Mémoire vectorielle minimale stockée dans des tableaux NumPy contigus.
+
+    Les vecteurs sont normalisés à l'insertion : le score cosinus d'une requête
+    contre toute la mémoire est un simple produit matrice-vecteur.
+    Les métadonnées utiles au filtrage (histoire, milestone, entrée active)
+    sont rangées dans des colonnes NumPy pour construire des masques
+    sans parcourir les entrées une à une.
+
+    Chaque entrée reçoit un identifiant stable : les lignes peuvent être
+    réorganisées (suppression, compactage) sans invalider les identifiants.
+    Les lignes restent dans l'ordre d'insertion, qui sert au calcul de récence.
+
+    Sur de gros volumes, un index HNSW tenu à jour à chaque écriture évite de
+    scorer toute la mémoire pour les recherches peu filtrées (voir ANN_THRESHOLD).
+    """
+
+    def __init__(self, initial_capacity: int = INITIAL_CAPACITY):
+        self._capacity = initial_capacity
+        self._size = 0
+        self._dim = None
+        self._vectors = None
+
+        # Colonnes de métadonnées alignées sur les vecteurs.
+        self._milestones = np.full(initial_capacity, NO_MILESTONE, dtype=np.int32)
+        self._stories = np.zeros(initial_capacity, dtype=np.int32)
+        self._alive = np.zeros(initial_capacity, dtype=bool)
+        self._ids = np.zeros(initial_capacity, dtype=np.int64)
+
+        # Correspondance identifiant d'histoire -> code entier (0 = aucune histoire),
+        # et nombre d'entrées vivantes par code, tenu à jour à chaque écriture.
+        self._story_codes: Dict[Any, int] = {None: 0}
+        self._story_counts: Dict[int, int] = {}
+
+        # Textes et métadonnées indexés par identifiant d'entrée.
+        self.texts: Dict[int, str] = {}
+        self.metadatas: Dict[int, Dict[str, Any]] = {}
+        self._rows: Dict[int, int] = {}
+        self._next_id = 0
+
+        # Index HNSW et identifiant d'entrée de chacune de ses positions.
+        self._ann = None
+        self._ann_ids: List[int] = []
+        self._ann_building = False
+
+        # L'interface peut ajouter et chercher depuis plusieurs threads.
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    # --------------------------------------------------------
+    # Écriture
+    # --------------------------------------------------------
+
+    def _grow(self, needed: int):
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        if capacity == self._capacity:
+            return
+
+        def resized(array, fill):
+            new = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+            new[:self._size] = array[:self._size]
+            return new
+
+        self._vectors = resized(self._vectors, 0)
+        self._milestones = resized(self._milestones, NO_MILESTONE)
+        self._stories = resized(self._stories, 0)
+        self._alive = resized(self._alive, False)
+        self._ids = resized(self._ids, 0)
+        self._capacity = capacity
+
+    def _story_code(self, story_id) -> int:
+        if story_id not in self._story_codes:
+            self._story_codes[story_id] = len(self._story_codes)
+        return self._story_codes[story_id]
+
+    @staticmethod
+    def _normalized(vectors) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix[None, :]
+
+        # Normalisation : le produit scalaire devient une similarité cosinus.
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def _count_story(self, code: int, delta: int):
+        self._story_counts[code] = self._story_counts.get(code, 0) + delta
+
+    def _write_row(self, row: int, entry_id: int, metadata: Dict[str, Any]):
+        milestone = metadata.get("milestone_index")
+        self._milestones[row] = NO_MILESTONE if milestone is None else int(milestone)
+        self._stories[row] = self._story_code(metadata.get("story_id"))
+        self._count_story(int(self._stories[row]), 1)
+        self._ids[row] = entry_id
+        self._alive[row] = True
+        self._rows[entry_id] = row
+
+    def add(self, vectors: Sequence[Sequence[float]], texts: List[str], metadatas: List[Dict[str, Any]]) -> List[int]:
+        """
+        Ajoute des entrées à la mémoire.
+
+        Paramètres :
+            vectors : embeddings des textes (une ligne par texte).
+            texts (list[str]) : textes mémorisés.
+            metadatas (list[dict]) : métadonnées associées.
+
+        Retour :
+            list[int] : identifiants des entrées ajoutées.
+        """
+        matrix = self._normalized(vectors)
+
+        with self._lock:
+            if self._vectors is None:
+                self._dim = matrix.shape[1]
+                self._vectors = np.zeros((self._capacity, self._dim), dtype=np.float32)
+
+            start = self._size
+            end = start + len(matrix)
+            self._grow(end)
+
+            ids = list(range(self._next_id, self._next_id + len(matrix)))
+            self._vectors[start:end] = matrix
+            for offset, (entry_id, text, metadata) in enumerate(zip(ids, texts, metadatas)):
+                self._write_row(start + offset, entry_id, metadata)
+                self.texts[entry_id] = text
+                self.metadatas[entry_id] = metadata
+
+            self._next_id += len(matrix)
+            self._size = end
+            self._index_ann(matrix, ids)
+
+        return ids
+
+    def replace(self, entry_id: int, vector: Sequence[float], text: str, metadata: Dict[str, Any]) -> Optional[int]:
+        """
+        Remplace une entrée par une nouvelle, à la même place dans l'ordre
+        d'insertion (utilisé pour substituer un résumé aux scènes qu'il regroupe).
+
+        Retour :
+            int | None : identifiant de la nouvelle entrée, ou None si l'entrée
+                         d'origine n'existe plus.
+        """
+        matrix = self._normalized(vector)
+        with self._lock:
+            row = self._rows.pop(entry_id, None)
+            if row is None:
+                return None
+            del self.texts[entry_id]
+            del self.metadatas[entry_id]
+            self._count_story(int(self._stories[row]), -1)
+
+            new_id = self._next_id
+            self._next_id += 1
+            self._vectors[row] = matrix[0]
+            self._write_row(row, new_id, metadata)
+            self.texts[new_id] = text
+            self.metadatas[new_id] = metadata
+            self._index_ann(matrix, [new_id])
+        return new_id
+
+    def remove(self, entry_ids: Sequence[int]) -> int:
+        """
+        Supprime des entrées. Les lignes libérées sont récupérées quand elles
+        deviennent trop nombreuses (voir REPACK_RATIO).
+
+        Retour :
+            int : nombre d'entrées effectivement supprimées.
+        """
+        removed = 0
+        with self._lock:
+            for entry_id in entry_ids:
+                row = self._rows.pop(entry_id, None)
+                if row is None:
+                    continue
+                self._alive[row] = False
+                self._count_story(int(self._stories[row]), -1)
+                del self.texts[entry_id]
+                del self.metadatas[entry_id]
+                removed += 1
+
+            if self._size and self._size - len(self._rows) > REPACK_RATIO * self._size:
+                self._repack()
+        return removed
+
+    def _repack(self):
+        # Les lignes vivantes sont regroupées en tête, dans le même ordre.
+        keep = np.flatnonzero(self._alive[:self._size])
+        count = len(keep)
+        for array in (self._vectors, self._milestones, self._stories, self._ids):
+            array[:count] = array[keep]
+        self._alive[:count] = True
+        self._alive[count:self._size] = False
+        self._size = count
+        self._rows = {int(entry_id): row for row, entry_id in enumerate(self._ids[:count])}
+
+    # --------------------------------------------------------
+    # Index HNSW
+    # --------------------------------------------------------
+
+    def _index_ann(self, matrix: np.ndarray, ids: List[int]):
+        # Appelée sous _lock après une écriture. L'ancienne version d'une entrée
+        # remplacée reste dans l'index : elle est écartée à la lecture.
+        if self._ann is not None:
+            self._ann.add(matrix)
+            self._ann_ids.extend(ids)
+
+        if self._ann_building or len(self._rows) < ANN_THRESHOLD:
+            return
+        stale = len(self._ann_ids) - len(self._rows)
+        if self._ann is None or stale > ANN_STALE_RATIO * len(self._ann_ids):
+            self._ann_building = True
+            threading.Thread(target=self._build_ann, name="flat-store-hnsw", daemon=True).start()
+
+    def _build_ann(self):
+        """
+        Construit l'index HNSW des entrées vivantes sans bloquer les joueurs :
+        seules la copie des vecteurs et l'échange final se font sous _lock.
+        Les entrées écrites pendant la construction sont reprises avant l'échange.
+        """
+        try:
+            with self._lock:
+                rows = np.flatnonzero(self._alive[:self._size])
+                vectors = self._vectors[rows]
+                ids = [int(entry_id) for entry_id in self._ids[rows]]
+                next_id = self._next_id
+            print(f"Mémoire : construction de l'index HNSW ({len(ids)} vecteurs), en arrière-plan")
+
+            index = build_from_vectors("hnsw", self._dim, vectors)
+
+            with self._lock:
+                late = sorted(entry_id for entry_id in self._rows if entry_id >= next_id)
+                if late:
+                    index.add(self._vectors[[self._rows[entry_id] for entry_id in late]])
+                    ids.extend(late)
+                self._ann, self._ann_ids = index, ids
+        except Exception as e:
+            print("❌ Construction de l'index HNSW de la mémoire en échec :", e)
+        finally:
+            with self._lock:
+                self._ann_building = False
+
+    def _ann_candidates(self, query: np.ndarray, candidates: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Lignes candidates les plus proches selon l'index HNSW, avec leur score.
+
+        Le nombre de voisins demandés croît avec l'inverse de la sélectivité
+        des filtres : une histoire minoritaire obtient quand même k résultats.
+        """
+        total = len(self._ann_ids)
+        fetch = min(total, int(math.ceil(k * total / len(candidates) * ANN_OVERFETCH)))
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = max(HNSW_EF_SEARCH, fetch)
+        sims, positions = self._ann.search(query[None, :], fetch, params=params)
+
+        allowed = np.zeros(self._size, dtype=bool)
+        allowed[candidates] = True
+        rows, scores = [], []
+        for sim, position in zip(sims[0], positions[0]):
+            if position < 0:
+                continue
+            row = self._rows.get(self._ann_ids[position])
+            if row is not None and allowed[row]:
+                rows.append(row)
+                scores.append(sim)
+        return np.asarray(rows, dtype=np.int64), np.asarray(scores, dtype=np.float32)
+
+    def story_count(self, story_id) -> int:
+        """
+        Nombre d'entrées d'une histoire, sans parcourir la mémoire.
+        """
+        with self._lock:
+            code = self._story_codes.get(story_id)
+            return 0 if code is None else self._story_counts.get(code, 0)
+
+    def story_entries(self, story_id) -> List[int]:
+        """
+        Identifiants des entrées d'une histoire, de la plus ancienne à la plus récente.
+        """
+        with self._lock:
+            code = self._story_codes.get(story_id)
+            if code is None:
+                return []
+            rows = np.flatnonzero(self._alive[:self._size] & (self._stories[:self._size] == code))
+            return [int(entry_id) for entry_id in self._ids[rows]]
+
+    # --------------------------------------------------------
+    # Recherche
+    # --------------------------------------------------------
+
+    def _filter_mask(self, filters: Optional[Dict[str, Any]]) -> np.ndarray:
+        """
+        Construit le masque des entrées autorisées par les filtres.
+
+        Filtres reconnus :
+            - "story_id" : identifiant d'histoire exact
+            - "milestone_index" : valeur exacte ou liste de valeurs admises
+            - "flags" : dict de flags qui doivent tous avoir la valeur donnée
+        """
+        mask = self._alive[:self._size].copy()
+        if not filters:
+            return mask
+
+        if "story_id" in filters:
+            code = self._story_codes.get(filters["story_id"])
+            if code is None:
+                return np.zeros(self._size, dtype=bool)
+            mask &= self._stories[:self._size] == code
+
+        if "milestone_index" in filters:
+            wanted = filters["milestone_index"]
+            if isinstance(wanted, (list, tuple, set)):
+                mask &= np.isin(self._milestones[:self._size], list(wanted))
+            else:
+                mask &= self._milestones[:self._size] == int(wanted)
+
+        # Les flags sont des dictionnaires libres : on ne teste que les
+        # entrées encore candidates.
+        flags = filters.get("flags")
+        if flags:
+            for i in np.flatnonzero(mask):
+                entry_flags = self.metadatas[int(self._ids[i])].get("flags", {})
+                if any(entry_flags.get(name) != value for name, value in flags.items()):
+                    mask[i] = False
+
+        return mask
+
+    def search(
+        self,
+        query_vector: Sequence[float],
+        k: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+        skip_recent: int = 0,
+        recency_weight: float = 0.0,
+        recency_half_life: float = 50.0
+    ) -> List[Tuple[float, int]]:
+        """
+        Recherche les entrées les plus proches d'un vecteur requête.
+
+        Paramètres :
+            query_vector : embedding de la requête.
+            k (int) : nombre maximum de résultats.
+            filters (dict | None) : filtres sur les métadonnées (voir _filter_mask).
+            skip_recent (int) : ignore les N dernières entrées admises par les filtres
+                                (déjà présentes dans la mémoire courte).
+            recency_weight (float) : bonus maximal ajouté au score des entrées récentes.
+            recency_half_life (float) : nombre d'entrées après lequel le bonus est divisé par deux.
+
+        Retour :
+            list[(score, id)] : résultats triés par score décroissant
+                                (identifiants d'entrée, voir texts et metadatas).
+        """
+        with self._lock:
+            if self._size == 0:
+                return []
+
+            query = np.asarray(query_vector, dtype=np.float32)
+            query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+            mask = self._filter_mask(filters)
+            candidates = np.flatnonzero(mask)
+
+            # Les entrées les plus récentes sont déjà dans la mémoire courte.
+            if skip_recent > 0:
+                candidates = candidates[:-skip_recent]
+            if len(candidates) == 0:
+                return []
+
+            rows = None
+            if self._ann is not None and len(candidates) >= ANN_MIN_CANDIDATES:
+                # Recherche approchée ; le bonus de récence ne réordonne que les
+                # voisins retenus par l'index.
+                rows, scores = self._ann_candidates(query, candidates, k)
+                if len(rows) < k:
+                    rows = None  # trop d'entrées obsolètes : calcul exact
+            if rows is not None:
+                positions = np.searchsorted(candidates, rows)
+            elif len(candidates) < GATHER_RATIO * self._size:
+                rows, positions = candidates, np.arange(len(candidates))
+                scores = self._vectors[candidates] @ query
+            else:
+                # Produit matrice-vecteur sur le bloc contigu, puis sélection des candidats.
+                rows, positions = candidates, np.arange(len(candidates))
+                scores = (self._vectors[:self._size] @ query)[candidates]
+
+            # Pondération par récence : l'âge est compté en nombre d'entrées
+            # admises par les filtres (donc en scènes de la même histoire).
+            if recency_weight > 0:
+                age = (len(candidates) - 1 - positions).astype(np.float32) + skip_recent
+                scores = scores + recency_weight * np.power(0.5, age / recency_half_life)
+
+            k = min(k, len(rows))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            return [(float(scores[i]), int(self._ids[rows[i]])) for i in top]
@@ -1,14 +1,89 @@
-from typing import Dict, Any, List
+import math
+import os
+import threading
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+from src.memory.embeddings import get_embeddings
+from src.memory.flat_store import FlatMemoryStore
+from src.memory.compaction import schedule_compaction
+from src.memory.ann_index import build_index, build_from_vectors, configure_search, index_type, resolve_index_type
+
+# Le modèle d'embedding (get_embeddings) est partagé avec le reste du moteur
+# et précédé d'un cache : une scène ou un choix déjà vus ne repassent pas dans
+# le modèle. Il est chargé au premier usage (ou par le préchauffage), pas à l'import.
+
+# Implémentation de la mémoire longue :
+# - "flat" : tableaux NumPy contigus, filtrage par métadonnées et récence ;
+#   au-delà de flat_store.ANN_THRESHOLD entrées, un index HNSW s'y ajoute
+# - "faiss" : vectorstore FAISS de LangChain (comportement historique)
+MEMORY_BACKEND = "flat"
+
+# Type d'index de la mémoire "faiss" : "flat", "hnsw", "int8", "ivfpq",
+# ou "auto" pour passer de "flat" à "hnsw" selon la taille (voir ann_index.py).
+FAISS_INDEX_TYPE = "auto"
+
+# Dossier de sauvegarde de la mémoire "faiss" (None : pas de sauvegarde).
+# L'index entraîné et les documents y sont écrits tous les FAISS_SAVE_EVERY ajouts,
+# et rechargés au démarrage.
+FAISS_INDEX_DIR = None
+FAISS_SAVE_EVERY = 50
 
-# Initialisation du modèle d'embedding utilisé pour convertir les textes
-# en vecteurs numériques. Ce modèle est léger et fonctionne en local.
-_embeddings = FastEmbedEmbeddings()
+# Compaction de la mémoire "flat" : au-delà d'un seuil, les anciennes scènes
+# d'une histoire sont résumées en arrière-plan (voir compaction.py).
+COMPACTION_ENABLED = True
+
+# Bonus de récence appliqué par la mémoire "flat" (0 pour le désactiver).
+RECENCY_WEIGHT = 0.1
+RECENCY_HALF_LIFE = 50.0
 
 # Le vectorstore est stocké dans une variable globale.
 # Il sera créé à la première utilisation, puis réutilisé.
 _vectorstore = None
+_flat_store = None
+_unsaved = 0
+_promoting = False
+
+# Nombre de documents par histoire dans le vectorstore FAISS, pour dimensionner
+# la recherche filtrée (voir _fetch_k).
+_faiss_story_counts: Dict[Any, int] = {}
+
+# Voisins demandés à FAISS avant le filtre de LangChain : au moins son défaut,
+# et ANN_OVERFETCH fois l'inverse de la sélectivité du filtre d'histoire.
+MIN_FETCH_K = 20
+ANN_OVERFETCH = 2.0
+
+# Plusieurs joueurs (threads) partagent la mémoire : la création des instances
+# et les accès au vectorstore FAISS, qui n'est pas thread-safe, sont protégés.
+_lock = threading.Lock()
+
+
+class _NormalizedEmbeddings(Embeddings):
+    """
+    Embeddings ramenés à une norme de 1 : le produit scalaire de FAISS
+    devient un cosinus. (L'option normalize_L2 de LangChain ne s'applique
+    pas à la distance MAX_INNER_PRODUCT.)
+    """
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+
+    @staticmethod
+    def _normalize(vectors) -> List[List[float]]:
+        array = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(array, axis=1, keepdims=True)
+        return (array / np.where(norms > 0, norms, 1.0)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._normalize(self.embeddings.embed_documents(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._normalize([self.embeddings.embed_query(text)])[0]
 
 
 def get_vectorstore():
@@ -18,14 +93,123 @@ def get_vectorstore():
 
     Le vectorstore est initialisé avec un texte neutre pour éviter
     d'avoir une base vide, ce qui simplifie les appels suivants.
+    Si FAISS_INDEX_DIR contient une sauvegarde, elle est rechargée.
+
+    Les vecteurs sont normalisés et comparés par produit scalaire (cosinus),
+    ce qui permet d'utiliser les index quantifiés et HNSW de ann_index.py.
     """
     global _vectorstore
-    if _vectorstore is None:
-        # Création d'un vectorstore minimal contenant un seul document.
-        _vectorstore = FAISS.from_texts(["Mémoire initiale."], _embeddings)
+    with _lock:
+        if _vectorstore is None:
+            options = {"distance_strategy": DistanceStrategy.MAX_INNER_PRODUCT}
+            embeddings = _NormalizedEmbeddings(get_embeddings())
+            if FAISS_INDEX_DIR and os.path.exists(os.path.join(FAISS_INDEX_DIR, "index.faiss")):
+                # Sauvegarde écrite par ce module : le désérialiseur peut lui faire confiance.
+                _vectorstore = FAISS.load_local(
+                    FAISS_INDEX_DIR, embeddings, allow_dangerous_deserialization=True, **options
+                )
+                configure_search(_vectorstore.index)
+                for doc in _vectorstore.docstore._dict.values():
+                    _count_story(doc.metadata.get("story_id"))
+            else:
+                # Création d'un vectorstore minimal contenant un seul document.
+                dim = len(embeddings.embed_query("Mémoire initiale."))
+                _vectorstore = FAISS(
+                    embedding_function=embeddings,
+                    index=build_index("flat", dim),
+                    docstore=InMemoryDocstore(),
+                    index_to_docstore_id={},
+                    **options
+                )
+                _vectorstore.add_texts(["Mémoire initiale."])
     return _vectorstore
 
 
+def _count_story(story_id):
+    if story_id is not None:
+        _faiss_story_counts[story_id] = _faiss_story_counts.get(story_id, 0) + 1
+
+
+def _fetch_k(vs, k: int, filters: Dict[str, Any]) -> int:
+    """
+    Nombre de voisins à demander à FAISS pour qu'un filtre appliqué après
+    la recherche laisse encore k documents (0 : aucun document ne peut passer).
+
+    Sans cette mise à l'échelle, une histoire minoritaire dans un index
+    partagé n'obtiendrait que quelques résultats, voire aucun.
+    """
+    total = vs.index.ntotal
+    matching = total
+    if "story_id" in filters:
+        matching = _faiss_story_counts.get(filters["story_id"], 0)
+    if matching == 0:
+        return 0
+    return min(total, max(MIN_FETCH_K, int(math.ceil(k * total / matching * ANN_OVERFETCH))))
+
+
+def _maybe_promote(vs):
+    # Appelée sous _lock après un ajout : au passage d'un seuil, le nouvel
+    # index est construit en arrière-plan (une seule promotion à la fois).
+    global _promoting
+    wanted = resolve_index_type(FAISS_INDEX_TYPE, vs.index.ntotal)
+    if wanted != index_type(vs.index) and not _promoting:
+        _promoting = True
+        threading.Thread(
+            target=_promote_in_background, args=(vs, wanted), name="faiss-promotion", daemon=True
+        ).start()
+
+
+def _promote_in_background(vs, kind: str):
+    """
+    Reconstruit l'index sous le type `kind` sans bloquer les joueurs :
+    seules la copie des vecteurs et l'échange final se font sous _lock.
+    Les vecteurs ajoutés pendant la construction sont repris avant l'échange,
+    dans le même ordre (les positions du docstore restent valables).
+    """
+    global _promoting
+    try:
+        with _lock:
+            current = index_type(vs.index)
+            count = vs.index.ntotal
+            vectors = vs.index.reconstruct_n(0, count)
+        print(f"Mémoire FAISS : index {current} -> {kind} ({count} vecteurs), en arrière-plan")
+
+        new_index = build_from_vectors(kind, vs.index.d, vectors)
+
+        with _lock:
+            if vs.index.ntotal > count:
+                new_index.add(vs.index.reconstruct_n(count, vs.index.ntotal - count))
+            vs.index = new_index
+    except Exception as e:
+        print("❌ Promotion de l'index FAISS en échec :", e)
+    finally:
+        with _lock:
+            _promoting = False
+
+
+def save_memory():
+    """
+    Écrit la mémoire "faiss" (index entraîné + documents) dans FAISS_INDEX_DIR.
+    """
+    global _unsaved
+    if not FAISS_INDEX_DIR or _vectorstore is None:
+        return
+    with _lock:
+        _vectorstore.save_local(FAISS_INDEX_DIR)
+        _unsaved = 0
+
+
+def get_flat_store() -> FlatMemoryStore:
+    """
+    Retourne l'instance globale de la mémoire NumPy, créée à la première utilisation.
+    """
+    global _flat_store
+    with _lock:
+        if _flat_store is None:
+            _flat_store = FlatMemoryStore()
+    return _flat_store
+
+
 def add_scene_to_memory(scene_text: str, metadata: Dict[str, Any]):
     """
     Ajoute une scène dans la mémoire vectorielle.
@@ -33,21 +217,50 @@ def add_scene_to_memory(scene_text: str, metadata: Dict[str, Any]):
     Paramètres :
         scene_text (str) : texte de la scène à mémoriser.
         metadata (dict) : informations associées à la scène
-                          (milestone, flags, etc.).
+                          (histoire, milestone, flags, etc.).
 
-    Le texte est converti en vecteur puis ajouté à la base FAISS.
+    Le texte est converti en vecteur puis ajouté à la mémoire.
+    Avec la mémoire "flat", une histoire qui dépasse le seuil de compaction
+    voit ses anciennes scènes résumées en arrière-plan.
     """
+    if MEMORY_BACKEND == "flat":
+        vector = get_embeddings().embed_documents([scene_text])
+        store = get_flat_store()
+        store.add(vector, [scene_text], [metadata])
+        story_id = metadata.get("story_id")
+        if COMPACTION_ENABLED and story_id:
+            schedule_compaction(story_id, store.story_count(story_id))
+        return
+
+    global _unsaved
     vs = get_vectorstore()
-    vs.add_texts([scene_text], metadatas=[metadata])
+    with _lock:
+        vs.add_texts([scene_text], metadatas=[metadata])
+        _count_story(metadata.get("story_id"))
+        _maybe_promote(vs)
+        _unsaved += 1
+        save_due = FAISS_INDEX_DIR and _unsaved >= FAISS_SAVE_EVERY
+    if save_due:
+        save_memory()
 
 
-def search_memory(query: str, k: int = 5) -> List[Dict[str, Any]]:
+def search_memory(
+    query: str,
+    k: int = 5,
+    filters: Optional[Dict[str, Any]] = None,
+    skip_recent: int = 0
+) -> List[Dict[str, Any]]:
     """
     Recherche les scènes les plus proches du texte fourni.
 
     Paramètres :
         query (str) : texte de la requête (souvent l'action du joueur).
         k (int) : nombre maximum de résultats à renvoyer.
+        filters (dict | None) : filtres sur les métadonnées
+                                ("story_id", "milestone_index", "flags").
+        skip_recent (int) : nombre de scènes récentes à ignorer, car déjà
+                            présentes dans la mémoire courte
+                            (ignoré par la mémoire "faiss").
 
     Retour :
         list[dict] : liste de résultats, chaque entrée contenant :
@@ -57,12 +270,44 @@ def search_memory(query: str, k: int = 5) -> List[Dict[str, Any]]:
     Cette fonction permet au moteur narratif de retrouver des scènes
     passées similaires, afin d'assurer une continuité logique.
     """
+    results: List[Dict[str, Any]] = []
+
+    if MEMORY_BACKEND == "flat":
+        store = get_flat_store()
+        if len(store) == 0:
+            return results
+
+        query_vector = get_embeddings().embed_query(query)
+        hits = store.search(
+            query_vector,
+            k=k,
+            filters=filters,
+            skip_recent=skip_recent,
+            recency_weight=RECENCY_WEIGHT,
+            recency_half_life=RECENCY_HALF_LIFE
+        )
+        for score, idx in hits:
+            text, metadata = store.texts.get(idx), store.metadatas.get(idx)
+            if text is None or metadata is None:
+                continue  # entrée compactée entre la recherche et la lecture
+            results.append({
+                "scene_text": text,
+                "metadata": metadata
+            })
+        return results
+
     vs = get_vectorstore()
 
     # Recherche vectorielle : FAISS renvoie les documents les plus proches.
-    docs = vs.similarity_search(query, k=k)
+    # Le filtre de LangChain ne compare que des valeurs exactes, après la recherche.
+    with _lock:
+        if filters:
+            scalar_filters = {key: value for key, value in filters.items() if key != "flags"}
+            fetch_k = _fetch_k(vs, k, scalar_filters)
+            docs = vs.similarity_search(query, k=k, filter=scalar_filters, fetch_k=fetch_k) if fetch_k else []
+        else:
+            docs = vs.similarity_search(query, k=k)
 
-    results: List[Dict[str, Any]] = []
     for doc in docs:
         results.append({
             "scene_text": doc.page_content,
@@ -0,0 +1,180 @@
+"""
+Ingestion du lore dans la base plein texte (SQLite FTS5).
+
+Usage :
+    python -m src.rag.ingest                        # fichiers de src/rag/data
+    python -m src.rag.ingest monde.jsonl bible/     # fichiers ou dossiers
+    python -m src.rag.ingest --force --db data/lore.db
+
+Les fichiers .json (tableau d'entrées) et .jsonl (une entrée par ligne) sont
+lus en flux : seule l'entrée en cours de décodage est gardée en mémoire.
+La catégorie est le nom du fichier, sauf si l'entrée contient un champ "category".
+"""
+import argparse
+import json
+import os
+from typing import Dict, Any, Iterator, List
+
+from src.rag.loader import DATA_DIR
+from src.rag.store import LoreStore, LORE_DB_PATH
+
+# Taille des blocs lus depuis le disque.
+CHUNK_SIZE = 64 * 1024
+
+# Taille maximale (en caractères) d'un élément du tableau : au-delà, sans
+# élément décodable, le fichier est considéré comme mal formé.
+MAX_ITEM_CHARS = 16 * 1024 * 1024
+
+_decoder = json.JSONDecoder()
+
+
+def iter_json_array(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Parcourt un fichier JSON contenant un tableau, élément par élément,
+    sans charger le fichier entier.
+
+    Paramètres :
+        path (str) : chemin du fichier.
+
+    Retour :
+        itérateur sur les éléments du tableau.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = ""
+        pos = 0
+        started = False
+        eof = False
+
+        while True:
+            # On saute les blancs et les virgules entre les éléments.
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+
+            if pos >= len(buffer):
+                if eof:
+                    return
+                buffer = f.read(CHUNK_SIZE)
+                pos = 0
+                eof = buffer == ""
+                continue
+
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError(f"{path} : un tableau JSON est attendu.")
+                started = True
+                pos += 1
+                continue
+
+            if buffer[pos] == "]":
+                return
+
+            try:
+                item, end = _decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Élément coupé par la fin du bloc : on lit la suite.
+                if eof:
+                    raise
+                if len(buffer) - pos > MAX_ITEM_CHARS:
+                    raise ValueError(f"{path} : aucun élément décodable en {MAX_ITEM_CHARS} caractères.")
+                chunk = f.read(CHUNK_SIZE)
+                eof = chunk == ""
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+
+            yield item
+            pos = end
+
+            # On libère la partie déjà décodée du tampon.
+            if pos > CHUNK_SIZE:
+                buffer = buffer[pos:]
+                pos = 0
+
+
+def iter_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Parcourt un fichier JSONL (une entrée JSON par ligne).
+    Les lignes invalides sont signalées et ignorées.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Ligne JSONL invalide ignorée : {path}:{number}")
+
+
+def collect_files(paths: List[str]) -> List[str]:
+    """
+    Liste les fichiers .json / .jsonl à partir de fichiers ou de dossiers.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for filename in sorted(os.listdir(path)):
+                if filename.endswith((".json", ".jsonl")):
+                    files.append(os.path.join(path, filename))
+        else:
+            files.append(path)
+    return files
+
+
+def ingest_file(store: LoreStore, path: str, force: bool = False) -> int:
+    """
+    Ingère un fichier de lore dans la base. Les entrées retirées du
+    fichier depuis la dernière ingestion sont supprimées de la base.
+
+    Paramètres :
+        store (LoreStore) : base de destination.
+        path (str) : fichier .json ou .jsonl.
+        force (bool) : réingère le fichier même s'il n'a pas changé.
+
+    Retour :
+        int : nombre d'entrées lues (0 si le fichier a été ignoré).
+    """
+    if not force and store.source_unchanged(path):
+        print("Inchangé, ignoré :", path)
+        return 0
+
+    filename = os.path.basename(path)
+    if filename.endswith(".jsonl"):
+        category = filename[:-len(".jsonl")]
+        entries = iter_jsonl(path)
+    else:
+        category = filename[:-len(".json")]
+        entries = iter_json_array(path)
+
+    try:
+        count = store.upsert_many(entries, category, source=path, prune=True)
+    except ValueError as e:
+        # Fichier mal formé : les entrées lues avant l'erreur sont conservées,
+        # et le fichier n'est pas marqué comme ingéré pour être retraité ensuite.
+        print(f"❌ {path} : JSON invalide ({e}), ingestion partielle.")
+        return 0
+
+    store.mark_source(path)
+    print(f"{path} : {count} entrées")
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingestion du lore dans la base plein texte.")
+    parser.add_argument("paths", nargs="*", default=[DATA_DIR], help="fichiers ou dossiers à ingérer")
+    parser.add_argument("--db", default=LORE_DB_PATH, help="chemin de la base SQLite")
+    parser.add_argument("--force", action="store_true", help="réingère les fichiers inchangés")
+    args = parser.parse_args(argv)
+
+    store = LoreStore(args.db)
+    total = 0
+    for path in collect_files(args.paths):
+        total += ingest_file(store, path, force=args.force)
+
+    print(f"Total : {total} entrées lues, {store.count()} entrées dans la base.")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,20 @@
 import json
 import os
+from functools import lru_cache
 
 # Dossier où se trouvent les fichiers JSON contenant les données du RAG.
 DATA_DIR = "src/rag/data"
 
 
+@lru_cache(maxsize=None)
 def load_rag(theme: str):
     """
     Charge les données du RAG (lore, personnages, lieux, objets, etc.)
     en fonction d'un thème donné.
 
+    Le résultat est gardé en cache pour toute la durée du processus :
+    les fichiers ne sont lus qu'une fois par thème. Il ne doit pas être modifié.
+
     Le RAG est organisé sous forme de plusieurs fichiers JSON,
     chacun représentant une catégorie (par exemple : personnages.json, lieux.json).
 
@@ -1,4 +1,5 @@
 from src.rag.loader import load_rag
+from src.rag.store import get_lore_store
 from difflib import SequenceMatcher
 
 
@@ -26,7 +27,17 @@ def get_context(user_input: str, theme: str, max_results=5):
         str : un texte formaté contenant les éléments du RAG les plus pertinents.
     """
 
-    # On charge le RAG correspondant au thème choisi.
+    # Si la base plein texte a été construite (python -m src.rag.ingest),
+    # on l'interroge directement : la mémoire utilisée ne dépend plus
+    # de la taille du corpus.
+    store = get_lore_store()
+    if store is not None:
+        context = ""
+        for category, name, desc in store.search(user_input, theme, max_results):
+            context += f"[{category.upper()}] {name} : {desc}\n"
+        return context if context else "Aucun contexte pertinent trouvé."
+
+    # Sinon, on charge le RAG correspondant au thème choisi.
     rag = load_rag(theme)
     input_lower = user_input.lower()
     results = []
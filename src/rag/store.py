@@ -0,0 +1,344 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+# Base SQLite contenant le lore indexé en plein texte (FTS5).
+# Elle est construite par `python -m src.rag.ingest`.
+LORE_DB_PATH = "data/lore.db"
+
+# Nombre d'entrées écrites par transaction pendant l'ingestion.
+BATCH_SIZE = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS lore (
+    id INTEGER PRIMARY KEY,
+    theme TEXT NOT NULL,
+    category TEXT NOT NULL,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    keywords TEXT NOT NULL DEFAULT '',
+    extra TEXT NOT NULL DEFAULT '{}',
+    source TEXT NOT NULL DEFAULT '',
+    UNIQUE (theme, category, name)
+);
+
+CREATE INDEX IF NOT EXISTS lore_theme ON lore (theme, category);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS lore_fts USING fts5 (
+    name, keywords, description,
+    content='lore', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS lore_ai AFTER INSERT ON lore BEGIN
+    INSERT INTO lore_fts (rowid, name, keywords, description)
+    VALUES (new.id, new.name, new.keywords, new.description);
+END;
+
+CREATE TRIGGER IF NOT EXISTS lore_ad AFTER DELETE ON lore BEGIN
+    INSERT INTO lore_fts (lore_fts, rowid, name, keywords, description)
+    VALUES ('delete', old.id, old.name, old.keywords, old.description);
+END;
+
+CREATE TRIGGER IF NOT EXISTS lore_au AFTER UPDATE ON lore BEGIN
+    INSERT INTO lore_fts (lore_fts, rowid, name, keywords, description)
+    VALUES ('delete', old.id, old.name, old.keywords, old.description);
+    INSERT INTO lore_fts (rowid, name, keywords, description)
+    VALUES (new.id, new.name, new.keywords, new.description);
+END;
+
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+"""
+
+_UPSERT = """
+INSERT INTO lore (theme, category, name, description, keywords, extra, source)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (theme, category, name) DO UPDATE SET
+    description = excluded.description,
+    keywords = excluded.keywords,
+    extra = excluded.extra,
+    source = excluded.source
+WHERE lore.description IS NOT excluded.description
+   OR lore.keywords IS NOT excluded.keywords
+   OR lore.extra IS NOT excluded.extra
+   OR lore.source IS NOT excluded.source
+"""
+
+# Clés des entrées lues pendant l'ingestion d'un fichier : celles de la base
+# qui proviennent de ce fichier mais n'y figurent plus sont ensuite supprimées.
+_SEEN_SCHEMA = """
+CREATE TEMP TABLE IF NOT EXISTS ingest_seen (
+    theme TEXT NOT NULL,
+    category TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (theme, category, name)
+) WITHOUT ROWID
+"""
+
+_PRUNE = """
+DELETE FROM lore
+WHERE source = ?
+  AND NOT EXISTS (
+      SELECT 1 FROM ingest_seen AS seen
+      WHERE seen.theme = lore.theme AND seen.category = lore.category AND seen.name = lore.name
+  )
+"""
+
+# Poids BM25 des colonnes (name, keywords, description), dans le même esprit
+# que le score de get_context : le nom compte plus que les mots-clés,
+# eux-mêmes plus que la description.
+_BM25_WEIGHTS = (4.0, 3.0, 1.0)
+
+
+def normalize_entry(entry: Dict[str, Any], category: str) -> Optional[Tuple[str, str, str, str, str, str]]:
+    """
+    Convertit une entrée JSON du lore en ligne de la table `lore`.
+
+    Paramètres :
+        entry (dict) : entrée brute (theme, name/title, description/text, keywords…).
+        category (str) : catégorie par défaut (nom du fichier source).
+
+    Retour :
+        tuple | None : (theme, category, name, description, keywords, extra),
+                       ou None si l'entrée n'a pas de nom.
+    """
+    if not isinstance(entry, dict):
+        return None
+
+    name = entry.get("name") or entry.get("title")
+    if not name:
+        return None
+
+    theme = str(entry.get("theme", "")).lower()
+    category = entry.get("category") or category
+    description = entry.get("description") or entry.get("text") or ""
+    keywords = " ".join(str(k) for k in entry.get("keywords", []))
+
+    # Les autres champs sont conservés tels quels.
+    known = {"theme", "category", "name", "title", "description", "text", "keywords"}
+    extra = {k: v for k, v in entry.items() if k not in known}
+
+    return theme, category, name, description, keywords, json.dumps(extra, ensure_ascii=False, sort_keys=True)
+
+
+def build_match_query(user_input: str) -> str:
+    """
+    Construit une requête FTS5 à partir du texte du joueur.
+
+    Chaque mot d'au moins trois lettres devient un préfixe recherché ;
+    le pluriel simple (s, x) est retiré pour rapprocher "forêts" de "forêt".
+    Les mots sont combinés par OR et classés ensuite par BM25.
+    """
+    terms = []
+    for word in re.findall(r"\w+", user_input.lower()):
+        if len(word) < 3:
+            continue
+        if len(word) > 4 and word[-1] in "sx":
+            word = word[:-1]
+        term = f'"{word}"*'
+        if term not in terms:
+            terms.append(term)
+    return " OR ".join(terms)
+
+
+class LoreStore:
+    """
+    Stockage du lore sur disque dans SQLite, indexé en plein texte avec FTS5.
+
+    Les entrées sont rangées par thème et par catégorie, avec une clé unique
+    (theme, category, name) qui permet des mises à jour incrémentales :
+    une entrée inchangée n'est pas réécrite. Chaque entrée garde le fichier
+    dont elle provient, pour supprimer celles qui en ont été retirées.
+
+    La connexion est partagée par les threads de l'interface : chaque accès
+    à la base passe par un verrou.
+    """
+
+    def __init__(self, path: str = LORE_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # check_same_thread=False : l'interface Streamlit peut appeler la recherche
+        # depuis plusieurs threads ; les accès sont sérialisés par self._lock.
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        self._migrate()
+        self.conn.execute("CREATE INDEX IF NOT EXISTS lore_source ON lore (source)")
+
+    def _migrate(self):
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(lore)")}
+        if "source" not in columns:
+            # Base construite avant le suivi des fichiers d'origine : on oublie
+            # les fichiers ingérés pour que la prochaine ingestion les relise.
+            with self.conn:
+                self.conn.execute("ALTER TABLE lore ADD COLUMN source TEXT NOT NULL DEFAULT ''")
+                self.conn.execute("DELETE FROM sources")
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    # --------------------------------------------------------
+    # Écriture
+    # --------------------------------------------------------
+
+    def upsert_many(
+        self,
+        entries: Iterable[Dict[str, Any]],
+        category: str,
+        source: str = "",
+        prune: bool = False
+    ) -> int:
+        """
+        Insère ou met à jour des entrées par lots de BATCH_SIZE.
+        La mémoire utilisée reste bornée quelle que soit la taille du flux.
+
+        Paramètres :
+            entries (itérable de dict) : entrées brutes.
+            category (str) : catégorie par défaut.
+            source (str) : fichier d'origine des entrées.
+            prune (bool) : une fois le flux lu en entier, supprime les entrées
+                           de ce fichier qui n'y figurent plus.
+
+        Retour :
+            int : nombre d'entrées lues.
+        """
+        source = os.path.abspath(source) if source else ""
+        with self._lock:
+            self.conn.execute(_SEEN_SCHEMA)
+            self.conn.execute("DELETE FROM ingest_seen")
+
+        count = 0
+        batch = []
+        try:
+            for entry in entries:
+                row = normalize_entry(entry, category)
+                if row is None:
+                    continue
+                batch.append(row + (source,))
+                count += 1
+                if len(batch) >= BATCH_SIZE:
+                    self._write_batch(batch)
+                    batch = []
+        finally:
+            # Si le flux s'interrompt sur une erreur, les entrées déjà lues sont
+            # gardées, mais rien n'est supprimé : la suite du fichier n'a pas été lue.
+            if batch:
+                self._write_batch(batch)
+
+        if prune and source:
+            with self._lock, self.conn:
+                removed = self.conn.execute(_PRUNE, (source,)).rowcount
+            if removed:
+                print(f"{source} : {removed} entrées supprimées (retirées du fichier)")
+        return count
+
+    def _write_batch(self, rows):
+        with self._lock, self.conn:
+            self.conn.executemany(_UPSERT, rows)
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO ingest_seen (theme, category, name) VALUES (?, ?, ?)",
+                (row[:3] for row in rows)
+            )
+
+    def source_unchanged(self, path: str) -> bool:
+        """
+        Indique si un fichier source a déjà été ingéré sans modification depuis.
+        """
+        stat = os.stat(path)
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT size, mtime FROM sources WHERE path = ?", (os.path.abspath(path),)
+            ).fetchone()
+        return row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime
+
+    def mark_source(self, path: str):
+        stat = os.stat(path)
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sources (path, size, mtime) VALUES (?, ?, ?)",
+                (os.path.abspath(path), stat.st_size, stat.st_mtime)
+            )
+
+    # --------------------------------------------------------
+    # Lecture
+    # --------------------------------------------------------
+
+    def count(self, theme: Optional[str] = None) -> int:
+        with self._lock:
+            if theme is None:
+                return self.conn.execute("SELECT COUNT(*) FROM lore").fetchone()[0]
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM lore WHERE theme = ?", (theme.lower(),)
+            ).fetchone()[0]
+
+    def search(self, user_input: str, theme: str, max_results: int = 5) -> List[Tuple[str, str, str]]:
+        """
+        Recherche les entrées du thème les plus pertinentes pour l'action du joueur.
+
+        Paramètres :
+            user_input (str) : texte saisi par le joueur.
+            theme (str) : thème narratif.
+            max_results (int) : nombre maximum de résultats.
+
+        Retour :
+            list[tuple] : (category, name, description), du plus pertinent au moins pertinent.
+        """
+        query = build_match_query(user_input)
+        if not query:
+            return []
+
+        with self._lock:
+            return self.conn.execute(
+                """
+                SELECT lore.category, lore.name, lore.description
+                FROM lore_fts
+                JOIN lore ON lore.id = lore_fts.rowid
+                WHERE lore_fts MATCH ? AND lore.theme = ?
+                ORDER BY bm25(lore_fts, ?, ?, ?)
+                LIMIT ?
+                """,
+                (query, theme.lower(), *_BM25_WEIGHTS, max_results)
+            ).fetchall()
+
+    def iter_names(self, theme: str) -> Iterable[Tuple[str, str, List[str]]]:
+        """
+        Parcourt les noms des entrées d'un thème, avec leurs alias éventuels
+        (champ "aliases" des fichiers sources), sans charger les descriptions.
+
+        Retour :
+            itérable de (category, name, aliases).
+        """
+        # Lecture complète sous le verrou : le curseur ne reste pas ouvert
+        # pendant que d'autres threads utilisent la connexion.
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT category, name, extra FROM lore WHERE theme = ?", (theme.lower(),)
+            ).fetchall()
+        for category, name, extra in rows:
+            aliases = json.loads(extra).get("aliases", []) if "aliases" in extra else []
+            yield category, name, [a for a in aliases if isinstance(a, str)]
+
+
+# Instance partagée, ouverte à la première recherche.
+_store = None
+
+
+def get_lore_store() -> Optional[LoreStore]:
+    """
+    Retourne la base de lore partagée, ou None si elle n'a pas encore été construite.
+    """
+    global _store
+    if _store is None and os.path.exists(LORE_DB_PATH):
+        _store = LoreStore(LORE_DB_PATH)
+    return _store
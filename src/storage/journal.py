@@ -0,0 +1,435 @@
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from typing import Dict, Any, List, Optional
+
+# Dossier où sont rangées les histoires sauvegardées (un sous-dossier par histoire).
+SESSIONS_DIR = "data/sessions"
+
+# Un snapshot compact est écrit toutes les N entrées du journal.
+SNAPSHOT_EVERY = 20
+
+# Nombre de scènes gardées dans le snapshot et rendues au rechargement ;
+# l'histoire complète reste dans le journal.
+HISTORY_TAIL = 200
+
+# Format des identifiants d'histoire (voir start_story) : ils servent de nom
+# de dossier et arrivent aussi par l'URL.
+STORY_ID_PATTERN = re.compile(r"[0-9a-f]{8,32}")
+
+JOURNAL_FILE = "journal.jsonl"
+SNAPSHOT_FILE = "snapshot.bin"
+META_FILE = "meta.json"
+
+
+# ============================================================
+# DELTAS D'ÉTAT
+# ============================================================
+
+def _copy(value):
+    """
+    Copie profonde d'une valeur JSON (l'état est modifié en place par le moteur).
+    """
+    return json.loads(json.dumps(value, ensure_ascii=False))
+
+
+def diff_state(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Calcule le delta entre deux versions de l'état narratif.
+
+    Les listes qui ont seulement grandi (inventaire) sont enregistrées sous
+    forme d'ajouts. Une liste à fenêtre glissante (historique limité à
+    MAX_HISTORY entrées, qui perd sa tête quand sa fin grandit) est
+    enregistrée comme le nombre d'entrées retirées en tête ("shift") plus
+    les ajouts. Un dictionnaire qui a seulement gagné ou changé des clés
+    (flags) n'enregistre que celles-ci ("merge"). Les autres clés modifiées
+    sont remplacées entièrement.
+
+    Paramètres :
+        old (dict) : état avant le tour.
+        new (dict) : état après le tour.
+
+    Retour :
+        dict : delta {"set": {...}, "merge": {...}, "shift": {...}, "append": {...}, "del": [...]}.
+    """
+    delta = {"set": {}, "merge": {}, "shift": {}, "append": {}, "del": []}
+
+    for key, value in new.items():
+        if key not in old:
+            delta["set"][key] = value
+            continue
+
+        previous = old[key]
+        if previous == value:
+            continue
+
+        # Dictionnaire sans clé retirée : on n'écrit que les clés changées.
+        if isinstance(previous, dict) and isinstance(value, dict) and previous.keys() <= value.keys():
+            delta["merge"][key] = {k: v for k, v in value.items() if k not in previous or previous[k] != v}
+            continue
+
+        # Liste qui a perdu sa tête et/ou grandi : on n'écrit que la fin.
+        shift = _shift(previous, value) if isinstance(previous, list) and isinstance(value, list) else None
+        if shift is None:
+            delta["set"][key] = value
+            continue
+        if shift:
+            delta["shift"][key] = shift
+        kept = len(previous) - shift
+        if len(value) > kept:
+            delta["append"][key] = value[kept:]
+
+    for key in old:
+        if key not in new:
+            delta["del"].append(key)
+
+    return delta
+
+
+def _shift(previous: List[Any], value: List[Any]) -> Optional[int]:
+    """
+    Plus petit nombre n d'entrées à retirer en tête de `previous` pour que
+    le reste soit le début de `value`, ou None si `value` ne prolonge
+    aucune fin non vide de `previous`. Une liste vide est prolongée par toute liste.
+    """
+    if not previous:
+        return 0
+    for n in range(len(previous)):
+        kept = len(previous) - n
+        if kept <= len(value) and value[:kept] == previous[n:]:
+            return n
+    return None
+
+
+def apply_delta(state: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Applique un delta produit par diff_state.
+
+    Paramètres :
+        state (dict) : état à mettre à jour (modifié en place).
+        delta (dict) : delta à appliquer.
+
+    Retour :
+        dict : l'état mis à jour.
+    """
+    for key, value in delta.get("set", {}).items():
+        state[key] = value
+    for key, values in delta.get("merge", {}).items():
+        state.setdefault(key, {}).update(values)
+    for key, count in delta.get("shift", {}).items():
+        del state.setdefault(key, [])[:count]
+    for key, items in delta.get("append", {}).items():
+        state.setdefault(key, []).extend(items)
+    for key in delta.get("del", []):
+        state.pop(key, None)
+    return state
+
+
+# ============================================================
+# JOURNAL D'UNE HISTOIRE
+# ============================================================
+
+class StoryJournal:
+    """
+    Journal de sauvegarde d'une histoire.
+
+    Chaque histoire possède son dossier contenant :
+    - journal.jsonl : journal en ajout seul, une ligne par tour (delta d'état + scène)
+    - snapshot.bin : snapshot compressé de l'histoire complète, avec la position
+      du journal à laquelle il correspond
+    - meta.json : quelques informations pour lister les histoires sans les charger
+
+    Le chargement lit le dernier snapshot puis ne rejoue que la fin du journal.
+    """
+
+    def __init__(self, story_id: str, base_dir: str = SESSIONS_DIR):
+        """
+        Paramètres :
+            story_id (str) : identifiant de l'histoire (STORY_ID_PATTERN).
+            base_dir (str) : dossier des sauvegardes.
+
+        Lève ValueError si l'identifiant ne désigne pas un dossier de base_dir.
+        """
+        if not isinstance(story_id, str) or not STORY_ID_PATTERN.fullmatch(story_id):
+            raise ValueError(f"Identifiant d'histoire invalide : {story_id!r}")
+        self.story_id = story_id
+        self.dir = os.path.join(base_dir, story_id)
+        base = os.path.realpath(base_dir)
+        if os.path.commonpath([base, os.path.realpath(self.dir)]) != base:
+            raise ValueError(f"Dossier d'histoire hors de {base_dir} : {story_id!r}")
+        self.journal_path = os.path.join(self.dir, JOURNAL_FILE)
+        self.snapshot_path = os.path.join(self.dir, SNAPSHOT_FILE)
+        self.meta_path = os.path.join(self.dir, META_FILE)
+
+        # Dernière version connue de l'histoire, pour calculer les deltas.
+        self._codex: Dict[str, Any] = {}
+        self._state: Dict[str, Any] = {}
+        self._scene: Dict[str, Any] = {}
+        self._history: List[Dict[str, Any]] = []
+        self._turn = 0
+        self._since_snapshot = 0
+
+    # --------------------------------------------------------
+    # Écriture
+    # --------------------------------------------------------
+
+    def create(self, codex: Dict[str, Any], state: Dict[str, Any], scene: Dict[str, Any]):
+        """
+        Démarre le journal d'une nouvelle histoire avec sa première scène.
+        """
+        os.makedirs(self.dir, exist_ok=True)
+
+        self._codex = _copy(codex)
+        self._state = _copy(state)
+        self._scene = _copy(scene)
+        self._history = [{"scene_text": scene.get("scene_text", "")}]
+        self._turn = 0
+
+        # Le journal repart de zéro si une histoire portait déjà cet identifiant.
+        with open(self.journal_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({
+                "type": "start",
+                "turn": 0,
+                "codex": self._codex,
+                "state": self._state,
+                "scene": self._scene
+            }, ensure_ascii=False) + "\n")
+
+        self.write_snapshot()
+
+    def append_turn(self, scene: Dict[str, Any], state: Dict[str, Any]):
+        """
+        Ajoute un tour au journal : la scène affichée et le delta d'état.
+        Un snapshot est écrit toutes les SNAPSHOT_EVERY entrées.
+        """
+        new_state = _copy(state)
+        delta = diff_state(self._state, new_state)
+        self._turn += 1
+
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({
+                "type": "turn",
+                "turn": self._turn,
+                "scene": scene,
+                "delta": delta
+            }, ensure_ascii=False) + "\n")
+
+        self._state = new_state
+        self._scene = _copy(scene)
+        self._add_history(scene)
+
+        self._since_snapshot += 1
+        if self._since_snapshot >= SNAPSHOT_EVERY:
+            self.write_snapshot()
+        else:
+            self._write_meta()
+
+    def write_snapshot(self):
+        """
+        Écrit un snapshot compressé de l'histoire et la position du journal
+        correspondante. L'écriture passe par un fichier temporaire pour qu'un
+        arrêt brutal ne laisse jamais de snapshot corrompu.
+        """
+        offset = os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) else 0
+        payload = json.dumps({
+            "turn": self._turn,
+            "journal_offset": offset,
+            "codex": self._codex,
+            "state": self._state,
+            "scene": self._scene,
+            "history": self._history[-HISTORY_TAIL:]
+        }, ensure_ascii=False).encode("utf-8")
+
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(zlib.compress(payload, 6))
+        os.replace(tmp_path, self.snapshot_path)
+
+        self._write_meta()
+        self._since_snapshot = 0
+
+    def _write_meta(self):
+        meta = {
+            "story_id": self.story_id,
+            "theme": self._codex.get("theme", ""),
+            "pitch": self._codex.get("pitch", ""),
+            "turn": self._turn,
+            "updated_at": time.time()
+        }
+        # Comme le snapshot : un arrêt brutal ne laisse jamais de meta.json tronqué.
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, self.meta_path)
+        _touch_listing(os.path.dirname(self.dir), meta)
+
+    # --------------------------------------------------------
+    # Lecture
+    # --------------------------------------------------------
+
+    def exists(self) -> bool:
+        return os.path.exists(self.journal_path)
+
+    def load(self) -> Dict[str, Any]:
+        """
+        Recharge l'histoire : dernier snapshot + rejeu des tours écrits après lui.
+
+        Une fin de journal tronquée par un arrêt brutal est retirée du
+        fichier, pour que le tour suivant ne soit pas écrit à sa suite.
+
+        Retour :
+            dict : {"codex", "state", "scene", "history", "history_start", "turn"} ;
+                   "history" ne contient que les HISTORY_TAIL dernières scènes,
+                   la première étant la scène numéro history_start (à partir de 0).
+        """
+        offset = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "rb") as f:
+                snap = json.loads(zlib.decompress(f.read()).decode("utf-8"))
+            self._codex = snap["codex"]
+            self._state = snap["state"]
+            self._scene = snap["scene"]
+            self._history = snap["history"]
+            self._turn = snap["turn"]
+            offset = snap["journal_offset"]
+
+        # On ne lit que la fin du journal, à partir de la position du snapshot.
+        replayed = 0
+        end = good_end = offset
+        missing_newline = False
+        with open(self.journal_path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                end += len(line)
+                try:
+                    record = json.loads(line.decode("utf-8"))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    # Ligne tronquée par un arrêt brutal : on l'ignore.
+                    print("Ligne de journal illisible ignorée :", self.story_id)
+                    continue
+                self._replay(record)
+                replayed += 1
+                # Position de fin du dernier enregistrement lisible.
+                good_end = end
+                missing_newline = not line.endswith(b"\n")
+
+        if good_end < end or missing_newline:
+            self._repair_tail(good_end, missing_newline)
+
+        self._since_snapshot = replayed
+
+        return {
+            "codex": _copy(self._codex),
+            "state": _copy(self._state),
+            "scene": _copy(self._scene),
+            "history": _copy(self._history),
+            "history_start": self._turn + 1 - len(self._history),
+            "turn": self._turn
+        }
+
+    def _repair_tail(self, good_end: int, missing_newline: bool):
+        # Coupe les octets qui suivent le dernier enregistrement lisible, et
+        # termine celui-ci par un saut de ligne s'il lui manque.
+        with open(self.journal_path, "r+b") as f:
+            f.truncate(good_end)
+            if missing_newline:
+                f.seek(good_end)
+                f.write(b"\n")
+        print("Fin de journal tronquée retirée :", self.story_id)
+
+    def _add_history(self, scene: Dict[str, Any]):
+        self._history.append({"scene_text": scene.get("scene_text", "Scène introuvable.")})
+        if len(self._history) > HISTORY_TAIL:
+            del self._history[:-HISTORY_TAIL]
+
+    def _replay(self, record: Dict[str, Any]):
+        if record.get("type") == "start":
+            self._codex = record["codex"]
+            self._state = record["state"]
+            self._scene = record["scene"]
+            self._history = [{"scene_text": self._scene.get("scene_text", "")}]
+            self._turn = 0
+        elif record.get("type") == "turn":
+            apply_delta(self._state, record.get("delta", {}))
+            self._scene = record["scene"]
+            self._add_history(self._scene)
+            self._turn = record["turn"]
+
+
+# ============================================================
+# INDEX DES HISTOIRES
+# ============================================================
+
+# Liste des histoires déjà lue, par dossier de sauvegarde :
+# (date de modification du dossier, métadonnées de la plus récente à la plus ancienne).
+_listings: Dict[str, Any] = {}
+_listing_lock = threading.Lock()
+
+
+def _touch_listing(base_dir: str, meta: Dict[str, Any]):
+    """
+    Place une histoire qui vient d'être écrite en tête de la liste en cache.
+    """
+    key = os.path.realpath(base_dir)
+    with _listing_lock:
+        cached = _listings.get(key)
+        if cached is None:
+            return
+        stories = [m for m in cached[1] if m.get("story_id") != meta["story_id"]]
+        stories.insert(0, meta)
+        # La date du dossier n'est pas reprise : une histoire créée entre-temps
+        # par un autre processus provoquera la relecture suivante.
+        _listings[key] = (cached[0], stories)
+
+
+def list_stories(base_dir: str = SESSIONS_DIR, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Liste les histoires sauvegardées, de la plus récente à la plus ancienne.
+
+    Les fichiers meta.json ne sont lus qu'au premier appel, puis quand une
+    histoire est créée dans le dossier (sa date de modification change) ;
+    les histoires écrites par ce processus sont remontées en tête à chaque
+    tour. Une partie jouée dans un autre processus n'est reclassée qu'à la
+    prochaine relecture.
+
+    Paramètres :
+        base_dir (str) : dossier des sauvegardes.
+        limit (int | None) : nombre maximum d'histoires renvoyées.
+
+    Retour :
+        list[dict] : métadonnées des histoires.
+    """
+    key = os.path.realpath(base_dir)
+    try:
+        mtime = os.stat(base_dir).st_mtime_ns
+    except OSError:
+        return []
+
+    with _listing_lock:
+        cached = _listings.get(key)
+    if cached is None or cached[0] != mtime:
+        stories = _scan_stories(base_dir)
+        with _listing_lock:
+            _listings[key] = (mtime, stories)
+    else:
+        stories = cached[1]
+    return [dict(m) for m in (stories[:limit] if limit else stories)]
+
+
+def _scan_stories(base_dir: str) -> List[Dict[str, Any]]:
+    stories = []
+    for entry in os.scandir(base_dir):
+        if not entry.is_dir():
+            continue
+        meta_path = os.path.join(entry.path, META_FILE)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                stories.append(json.load(f))
+        except (OSError, json.JSONDecodeError):
+            continue
+
+    stories.sort(key=lambda m: m.get("updated_at", 0), reverse=True)
+    return stories
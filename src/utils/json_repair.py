@@ -0,0 +1,219 @@
+import json
+import re
+from typing import Any, Optional, Tuple
+
+# Bloc markdown ```json ... ``` (la clôture finale peut manquer si la réponse est coupée).
+_FENCE = re.compile(r"```[a-zA-Z]*\s*(.*?)(?:```|$)", re.DOTALL)
+
+# Mots Python que les modèles écrivent parfois à la place de true/false/null.
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+_CLOSING = {"{": "}", "[": "]"}
+
+_decoder = json.JSONDecoder(strict=False)
+
+
+def extract_json_text(raw: str, expect: str = "{") -> Optional[str]:
+    """
+    Isole la partie JSON d'une réponse de modèle : contenu d'un bloc markdown
+    s'il y en a un, puis tout ce qui suit la première accolade (ou le premier
+    crochet si expect vaut "[").
+
+    Le type attendu passe avant l'autre : dans "[Narrateur] {...}", le JSON
+    commence à l'accolade. Sans ouvrant du type attendu, le premier des deux sert.
+
+    Retour :
+        str | None : le texte à partir du début du JSON, ou None s'il n'y en a pas.
+    """
+    text = raw.strip()
+
+    match = _FENCE.search(text)
+    if match and ("{" in match.group(1) or "[" in match.group(1)):
+        text = match.group(1)
+
+    start = text.find(expect)
+    if start == -1:
+        starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+        if not starts:
+            return None
+        start = min(starts)
+    return text[start:]
+
+
+def _normalize(text: str) -> Tuple[str, list, list]:
+    """
+    Réécrit le texte caractère par caractère en corrigeant les erreurs courantes :
+    - chaînes entre apostrophes simples -> guillemets doubles
+    - True / False / None -> true / false / null
+    - virgules en trop avant } ou ]
+    - retours à la ligne bruts dans les chaînes
+
+    Retour :
+        (texte, pile, coupures, chaîne coupée) : le texte corrigé, la pile des
+        accolades/crochets encore ouverts à la fin, les positions où l'on peut
+        couper le texte sans casser la structure (avec la pile correspondante),
+        et si le texte s'arrêtait au milieu d'une chaîne.
+    """
+    out = []
+    stack = []
+    cuts = []
+    quote = None  # guillemet de la chaîne en cours, ou None hors chaîne
+    i = 0
+    n = len(text)
+
+    while i < n:
+        c = text[i]
+
+        if quote is not None:
+            if c == "\\" and i + 1 < n:
+                nxt = text[i + 1]
+                # \' n'existe pas en JSON : une apostrophe suffit.
+                out.append("'" if nxt == "'" else c + nxt)
+                i += 2
+                continue
+            if c == quote:
+                out.append('"')
+                quote = None
+            elif c == '"':
+                # Guillemet double à l'intérieur d'une chaîne entre apostrophes.
+                out.append('\\"')
+            elif c == "\n":
+                out.append("\\n")
+            else:
+                out.append(c)
+            i += 1
+            continue
+
+        if c in "\"'":
+            quote = c
+            out.append('"')
+        elif c in "{[":
+            stack.append(c)
+            out.append(c)
+        elif c in "}]":
+            # Virgule en trop juste avant la fermeture.
+            while out and out[-1] in " \t\r\n":
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if stack:
+                stack.pop()
+            out.append(c)
+            if not stack:
+                # Objet complet : le texte qui suit est ignoré.
+                return "".join(out), stack, cuts, False
+        elif c == ",":
+            # Avant une virgule, la valeur précédente est complète : on peut couper ici.
+            cuts.append((len(out), list(stack)))
+            out.append(c)
+        elif c.isalpha():
+            j = i
+            while j < n and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            word = text[i:j]
+            out.append(_LITERALS.get(word, word))
+            i = j
+            continue
+        else:
+            out.append(c)
+        i += 1
+
+    # Texte coupé au milieu d'une chaîne : on la referme.
+    if quote is not None:
+        out.append('"')
+    return "".join(out), stack, cuts, quote is not None
+
+
+def _close(text: str, stack: list) -> str:
+    text = text.rstrip()
+    # Clé sans valeur ou virgule finale : on complète ou on retire.
+    if text.endswith(":"):
+        text += " null"
+    elif text.endswith(","):
+        text = text[:-1]
+    return text + "".join(_CLOSING[c] for c in reversed(stack))
+
+
+def _drop_incomplete(value: Any, stack: list, cut_in_string: bool) -> Any:
+    """
+    Nettoie une valeur refermée par _close après une coupure : les clés sans
+    valeur (null ajouté par _close) sont retirées, et le dernier élément de la
+    liste ouverte la plus profonde l'est aussi s'il était incomplet (chaîne
+    coupée, ou objet / liste encore ouvert), comme un choix à moitié écrit.
+
+    Les conteneurs restés ouverts sont, de proche en proche, le dernier
+    élément de leur parent : la pile suffit à les retrouver.
+    """
+    chain = [value]
+    for _ in stack[1:]:
+        parent = chain[-1]
+        children = parent if isinstance(parent, list) else list(parent.values())
+        if not children or not isinstance(children[-1], (dict, list)):
+            break
+        chain.append(children[-1])
+
+    for container in chain:
+        if isinstance(container, dict):
+            for key in [k for k, v in container.items() if v is None]:
+                del container[key]
+
+    lists = [i for i, container in enumerate(chain) if isinstance(container, list)]
+    if lists:
+        deepest = lists[-1]
+        if chain[deepest] and (deepest < len(chain) - 1 or cut_in_string):
+            chain[deepest].pop()
+    return value
+
+
+def _loads(text: str) -> Optional[Any]:
+    # Un null au premier niveau n'est pas une réponse exploitable : il est
+    # traité comme un échec de décodage, au même titre qu'un texte invalide.
+    try:
+        value, _ = _decoder.raw_decode(text)
+        return value
+    except (json.JSONDecodeError, ValueError):
+        return None
+
+
+def parse_json_lenient(raw: str, expect: str = "{") -> Tuple[Optional[Any], str]:
+    """
+    Décode une réponse JSON de modèle en tolérant les malformations courantes :
+    bloc markdown, texte avant ou après l'objet, apostrophes simples,
+    True/False/None, virgules en trop, objet coupé en cours de route.
+
+    Un objet coupé est refermé, sans les clés restées sans valeur ni le
+    dernier élément d'une liste s'il était incomplet.
+
+    Paramètres :
+        raw (str) : réponse brute du modèle.
+        expect (str) : "{" si un objet est attendu (défaut), "[" pour une liste.
+
+    Retour :
+        (valeur, statut) : statut "ok" si le JSON était valide tel quel,
+                           "repaired" s'il a fallu le corriger, "failed" sinon
+                           (la valeur est alors None, y compris pour un null).
+    """
+    text = extract_json_text(raw, expect)
+    if text is None:
+        return None, "failed"
+
+    # JSON valide (éventuellement suivi de texte parasite).
+    value = _loads(text)
+    if value is not None:
+        return value, "ok"
+
+    normalized, stack, cuts, cut_in_string = _normalize(text)
+    value = _loads(_close(normalized, stack))
+    if value is not None:
+        if stack:
+            value = _drop_incomplete(value, stack, cut_in_string)
+        return value, "repaired"
+
+    # Dernier recours pour un objet coupé : on revient à la dernière valeur
+    # complète et on referme la structure à partir de là.
+    for position, cut_stack in reversed(cuts):
+        value = _loads(_close(normalized[:position], cut_stack))
+        if value is not None:
+            return value, "repaired"
+
+    return None, "failed"
@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional
+
+# Nombre maximum d'appels conservés (les plus anciens sont oubliés).
+MAX_RECORDS = 10_000
+
+# Au-delà de ce temps de chargement (s), on considère qu'Ollama a rechargé le modèle.
+RELOAD_THRESHOLD_S = 0.5
+
+
+def _seconds(ns) -> float:
+    return (ns or 0) / 1e9
+
+
+def stats_from_final(final: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convertit l'enregistrement final d'un flux Ollama ("done": true)
+    en statistiques lisibles (durées en secondes).
+    """
+    load_s = _seconds(final.get("load_duration"))
+    return {
+        "prompt_tokens": final.get("prompt_eval_count", 0) or 0,
+        "eval_tokens": final.get("eval_count", 0) or 0,
+        "prompt_s": _seconds(final.get("prompt_eval_duration")),
+        "eval_s": _seconds(final.get("eval_duration")),
+        "load_s": load_s,
+        "total_s": _seconds(final.get("total_duration")),
+        "reload": load_s >= RELOAD_THRESHOLD_S,
+        "done_reason": final.get("done_reason")
+    }
+
+
+def _aggregate(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    prompt_tokens = sum(r["prompt_tokens"] for r in records)
+    eval_tokens = sum(r["eval_tokens"] for r in records)
+    prompt_s = sum(r["prompt_s"] for r in records)
+    eval_s = sum(r["eval_s"] for r in records)
+    return {
+        "calls": len(records),
+        "prompt_chars": sum(r["prompt_chars"] for r in records),
+        "prompt_tokens": prompt_tokens,
+        "eval_tokens": eval_tokens,
+        "prompt_tokens_per_s": prompt_tokens / prompt_s if prompt_s else 0.0,
+        "eval_tokens_per_s": eval_tokens / eval_s if eval_s else 0.0,
+        "load_s": sum(r["load_s"] for r in records),
+        "wall_s": sum(r["wall_s"] for r in records),
+        "reloads": sum(1 for r in records if r["reload"]),
+        "truncated": sum(1 for r in records if r["done_reason"] in ("length", "deadline"))
+    }
+
+
+class TokenLedger:
+    """
+    Registre des appels au modèle, construit à partir des statistiques
+    qu'Ollama envoie à la fin de chaque flux.
+
+    Chaque appel est étiqueté par étape (scene, intent, codex…), session
+    et tour, ce qui permet de distinguer un rechargement du modèle, un prompt
+    trop long ou une génération trop bavarde.
+    """
+
+    def __init__(self, max_records: int = MAX_RECORDS):
+        self._lock = threading.Lock()
+        self._records = deque(maxlen=max_records)
+
+    def record(self, model: str, stage: Optional[str], session: Optional[str], turn: Optional[str],
+               final: Dict[str, Any], wall_s: float, prompt_chars: int = 0) -> Dict[str, Any]:
+        """
+        Enregistre un appel terminé.
+
+        Paramètres :
+            model (str) : modèle Ollama appelé.
+            stage (str | None) : étape du pipeline à l'origine de l'appel.
+            session (str | None) : session de jeu.
+            turn (str | None) : identifiant du tour (plusieurs appels par tour).
+            final (dict) : enregistrement final du flux Ollama.
+            wall_s (float) : durée de l'appel mesurée côté client.
+            prompt_chars (int) : taille des messages envoyés, en caractères.
+
+        Retour :
+            dict : l'entrée ajoutée au registre.
+        """
+        entry = {
+            "time": time.time(),
+            "model": model,
+            "stage": stage or "other",
+            "session": session or "default",
+            "turn": turn,
+            "wall_s": wall_s,
+            "prompt_chars": prompt_chars
+        }
+        entry.update(stats_from_final(final))
+        with self._lock:
+            self._records.append(entry)
+        return entry
+
+    def records(self, session: Optional[str] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Retourne les appels enregistrés (du plus ancien au plus récent),
+        éventuellement limités à une session et aux `limit` derniers.
+        """
+        with self._lock:
+            records = [r for r in self._records if session is None or r["session"] == session]
+        return records[-limit:] if limit else records
+
+    def summary(self, session: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Agrège le registre : totaux, débits (tokens/s), nombre de rechargements,
+        tokens moyens par tour et détail par étape.
+
+        Paramètres :
+            session (str | None) : limite l'agrégat à une session.
+
+        Retour :
+            dict : agrégat global, avec "per_turn" et "by_stage".
+        """
+        records = self.records(session)
+        summary = _aggregate(records)
+
+        turns: Dict[str, List[Dict[str, Any]]] = {}
+        for r in records:
+            if r["turn"] is not None:
+                turns.setdefault(r["turn"], []).append(r)
+        summary["turns"] = len(turns)
+        summary["per_turn"] = {
+            "calls": sum(len(t) for t in turns.values()) / len(turns) if turns else 0.0,
+            "prompt_tokens": sum(r["prompt_tokens"] for t in turns.values() for r in t) / len(turns) if turns else 0.0,
+            "eval_tokens": sum(r["eval_tokens"] for t in turns.values() for r in t) / len(turns) if turns else 0.0,
+            "wall_s": sum(r["wall_s"] for t in turns.values() for r in t) / len(turns) if turns else 0.0
+        }
+
+        stages: Dict[str, List[Dict[str, Any]]] = {}
+        for r in records:
+            stages.setdefault(r["stage"], []).append(r)
+        summary["by_stage"] = {stage: _aggregate(rs) for stage, rs in stages.items()}
+        return summary
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+
+# Registre partagé par tout le processus.
+_ledger = TokenLedger()
+
+
+def get_ledger() -> TokenLedger:
+    return _ledger
@@ -1,7 +1,330 @@
+import os
+import socket
+import time
+import threading
 import requests
 import json
+from contextlib import contextmanager, nullcontext
+from typing import Callable, List, Optional
 
-def ollama_chat(model, messages):
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from src.utils.turn_context import current_turn, TurnCancelled
+from src.utils.ledger import get_ledger
+
+# Adresse du serveur Ollama. La variable d'environnement OLLAMA_HOST
+# (la même que celle du CLI Ollama) permet de viser un autre serveur.
+OLLAMA_URL = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+if not OLLAMA_URL.startswith("http"):
+    OLLAMA_URL = "http://" + OLLAMA_URL
+
+# Durée maximale d'un appel, en secondes, chargement du modèle compris.
+# Chaque appel peut fixer la sienne (paramètre deadline) ; None désactive la limite.
+DEFAULT_DEADLINE_S = 180.0
+
+# Délai maximal d'établissement de la connexion au serveur.
+CONNECT_TIMEOUT_S = 5.0
+
+# Intervalle de vérification de l'annulation pendant un appel (s) : la
+# connexion est coupée au plus tard après ce délai, même sans aucun fragment.
+CANCEL_POLL_S = 0.05
+
+# Durée pendant laquelle Ollama garde un modèle chargé après un appel.
+# Elle est envoyée avec chaque appel : Ollama la recalcule à chaque requête,
+# et une requête sans keep_alive reprendrait sa durée par défaut (5 minutes).
+# La variable d'environnement OLLAMA_KEEP_ALIVE (la même que celle du serveur)
+# permet de la changer.
+DEFAULT_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE") or "30m"
+
+# Limite d'appels simultanés (voir limit_concurrency) : un sémaphore de
+# threading ou de multiprocessing, ou None pour ne pas limiter.
+_call_slots = None
+
+# Options Ollama ajoutées à chaque appel du thread courant (voir generation_options).
+_local = threading.local()
+
+
+def limit_concurrency(slots):
+    """
+    Limite le nombre d'appels simultanés au serveur Ollama.
+
+    Paramètres :
+        slots (Semaphore | None) : sémaphore partagé par les appelants ;
+                                   un sémaphore de multiprocessing permet de
+                                   limiter plusieurs processus à la fois.
+                                   None supprime la limite.
+    """
+    global _call_slots
+    _call_slots = slots
+
+
+@contextmanager
+def generation_options(**options):
+    """
+    Ajoute des options Ollama (seed, temperature…) à tous les appels du
+    thread courant le temps du bloc `with`. Les options passées à
+    ollama_chat restent prioritaires.
+    """
+    previous = getattr(_local, "options", {})
+    _local.options = {**previous, **options}
+    try:
+        yield
+    finally:
+        _local.options = previous
+
+
+class ChatResponse(str):
+    """
+    Texte renvoyé par ollama_chat : une chaîne ordinaire, qui indique en plus
+    pourquoi la génération s'est arrêtée.
+
+    done_reason :
+        "stop" : le modèle a terminé sa réponse
+        "length" : limite de tokens (num_predict) atteinte, texte coupé
+        "deadline" : délai de l'appel dépassé, texte partiel
+    """
+
+    done_reason: Optional[str] = None
+
+    def __new__(cls, text: str, done_reason: Optional[str] = None):
+        obj = super().__new__(cls, text)
+        obj.done_reason = done_reason
+        return obj
+
+    @property
+    def truncated(self) -> bool:
+        return self.done_reason in ("length", "deadline")
+
+
+def is_truncated(raw) -> bool:
+    """
+    True si la réponse a été coupée (limite de tokens ou délai dépassé).
+    """
+    return bool(getattr(raw, "truncated", False))
+
+
+class _CallWatch:
+    """
+    Surveillance d'un appel depuis un thread à part : à l'échéance, ou dès
+    l'annulation, le socket de la connexion est coupé. shutdown() réveille la
+    lecture bloquée du thread de l'appel (attente des en-têtes, pendant le
+    chargement du modèle, comme attente d'un fragment), ce que close() seul
+    ne fait pas.
+
+    Les connexions de l'appel sont relevées par les pools de _WATCHED_POOLS,
+    dans le thread de l'appel (voir _watch_connection).
+    """
+
+    def __init__(self, expires: Optional[float], cancelled: Callable[[], bool]):
+        self.expires = expires
+        self.cancelled = cancelled
+        self.connections: List = []
+        # Cause de la coupure : "deadline", "cancelled", ou None.
+        self.reason: Optional[str] = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ollama-watch", daemon=True)
+
+    def __enter__(self):
+        _local.watch = self
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        _local.watch = None
+        self._done.set()
+        self._thread.join()
+
+    def add(self, conn):
+        # Le nom de l'attribut n'est pas garanti par urllib3 : une version qui
+        # le changerait doit faire échouer l'appel, pas rendre l'annulation muette.
+        if not hasattr(conn, "sock"):
+            raise RuntimeError(f"Connexion {type(conn).__name__} sans attribut sock : annulation impossible.")
+        with self._lock:
+            self.connections.append(conn)
+            stopped = self.reason is not None
+        if stopped:
+            self._shutdown()
+
+    def _run(self):
+        while True:
+            timeout = CANCEL_POLL_S
+            if self.expires is not None:
+                timeout = min(timeout, max(0.0, self.expires - time.perf_counter()))
+            if self._done.wait(timeout):
+                return
+            if self.cancelled():
+                reason = "cancelled"
+            elif self.expires is not None and time.perf_counter() >= self.expires:
+                reason = "deadline"
+            else:
+                continue
+            with self._lock:
+                self.reason = reason
+            self._shutdown()
+            return
+
+    def _shutdown(self):
+        with self._lock:
+            connections = list(self.connections)
+        for conn in connections:
+            sock = conn.sock
+            if sock is None:
+                continue  # connexion pas encore ouverte, ou déjà fermée
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def _watch_connection(conn):
+    watch = getattr(_local, "watch", None)
+    if watch is not None:
+        watch.add(conn)
+
+
+class _WatchedHTTPPool(HTTPConnectionPool):
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        _watch_connection(conn)
+        return conn
+
+
+class _WatchedHTTPSPool(HTTPSConnectionPool):
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        _watch_connection(conn)
+        return conn
+
+
+_WATCHED_POOLS = {"http": _WatchedHTTPPool, "https": _WatchedHTTPSPool}
+
+
+def _watched_session() -> requests.Session:
+    """
+    Session d'un seul appel (comme requests.post), dont les connexions
+    sont relevées par la surveillance de l'appel en cours.
+    """
+    adapter = HTTPAdapter()
+    adapter.poolmanager.pool_classes_by_scheme = _WATCHED_POOLS
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _stream_lines(response, watch: _CallWatch):
+    """
+    Lignes du flux HTTP, jusqu'à sa fin ou jusqu'à la coupure de la
+    connexion par la surveillance de l'appel, qui termine le flux sans erreur.
+    """
+    try:
+        # chunk_size=None : chaque fragment est traité dès son arrivée.
+        for line in response.iter_lines(chunk_size=None):
+            if watch.reason is not None:
+                return
+            yield line
+    except Exception:
+        # Connexion coupée par la surveillance, ou délai de lecture atteint à
+        # l'échéance (l'exception dépend du moment) : ce n'est une erreur qu'avant.
+        if watch.reason is None and (watch.expires is None or time.perf_counter() < watch.expires):
+            raise
+
+
+def _stream_chat(payload, deadline, turn, cancel):
+    """
+    Envoie la requête et lit le flux jusqu'à sa fin, l'échéance ou l'annulation.
+
+    Retour :
+        (texte, enregistrement final ou None, raison de l'arrêt)
+    """
+    expires = time.perf_counter() + deadline if deadline is not None else None
+
+    def cancelled():
+        return (turn is not None and turn.cancelled) or (cancel is not None and cancel.is_set())
+
+    # On va accumuler progressivement les fragments de texte renvoyés.
+    full_text = ""
+    final = None
+    done_reason = None
+
+    # La surveillance coupe la connexion à l'échéance ou dès l'annulation,
+    # y compris pendant l'attente des en-têtes ; le délai de lecture n'est
+    # qu'un filet de sécurité.
+    with _watched_session() as session, _CallWatch(expires, cancelled) as watch:
+        try:
+            response = session.post(
+                f"{OLLAMA_URL}/api/chat",
+                json=payload,
+                stream=True,
+                timeout=(CONNECT_TIMEOUT_S, deadline)
+            )
+        except requests.exceptions.ReadTimeout:
+            # Aucune réponse avant l'échéance (modèle en cours de chargement…).
+            response = None
+            done_reason = "deadline"
+        except requests.exceptions.ConnectionError:
+            # Connexion coupée par la surveillance avant les en-têtes.
+            if watch.reason is None:
+                raise
+            response = None
+            done_reason = "deadline"
+
+        # Lecture ligne par ligne du flux renvoyé par Ollama.
+        # La connexion est toujours fermée en sortie : en cas d'annulation ou de
+        # délai dépassé, Ollama voit le client partir et arrête de générer.
+        if response is not None:
+            with response:
+                for line in _stream_lines(response, watch):
+                    if cancelled():
+                        break
+
+                    if not line:
+                        continue  # ignore les lignes vides
+
+                    try:
+                        # Chaque ligne est un petit JSON contenant un fragment de message.
+                        data = json.loads(line.decode("utf-8"))
+                    except json.JSONDecodeError:
+                        # Si une ligne n'est pas du JSON valide, on l'affiche pour debug.
+                        print("Ligne non JSON :", line)
+                        continue
+
+                    # Les fragments utiles se trouvent dans data["message"]["content"].
+                    if "message" in data and "content" in data["message"]:
+                        chunk = data["message"]["content"]
+                        full_text += chunk  # on concatène le fragment au texte complet
+                        if turn is not None:
+                            turn.add_text(chunk)
+
+                    # Le dernier enregistrement porte les statistiques de l'appel.
+                    if data.get("done"):
+                        final = data
+                        done_reason = data.get("done_reason", "stop")
+
+    if cancelled() or watch.reason == "cancelled":
+        print("=== OLLAMA ANNULÉ ===\n")
+        raise TurnCancelled()
+
+    # Flux interrompu avant l'enregistrement final : le délai est dépassé.
+    if final is None and expires is not None and time.perf_counter() >= expires:
+        done_reason = "deadline"
+
+    return full_text, final, done_reason
+
+
+def ollama_chat(
+    model,
+    messages,
+    format=None,
+    options=None,
+    keep_alive=DEFAULT_KEEP_ALIVE,
+    stage=None,
+    deadline=DEFAULT_DEADLINE_S,
+    max_tokens=None,
+    cancel: Optional[threading.Event] = None
+):
     """
     Envoie une requête au serveur Ollama en mode streaming et récupère
     la réponse complète sous forme de texte.
@@ -9,10 +332,40 @@ def ollama_chat(model, messages):
     Paramètres :
         model (str) : nom du modèle Ollama à utiliser.
         messages (list) : liste de messages au format chat (role + content).
+        format (str | dict | None) : contrainte de sortie transmise à Ollama,
+                                     "json" ou un schéma JSON complet.
+        options (dict | None) : options de génération Ollama (num_predict, seed…).
+        keep_alive (str | None) : durée pendant laquelle Ollama garde le modèle
+                                  en mémoire après l'appel (ex : "30m") ;
+                                  None : durée par défaut du serveur.
+        stage (str | None) : étape du pipeline à l'origine de l'appel, reprise
+                             dans le registre de tokens (voir ledger.py).
+        deadline (float | None) : durée maximale de l'appel en secondes
+                                  (None : pas de limite).
+        max_tokens (int | None) : nombre maximal de tokens générés
+                                  (option num_predict d'Ollama).
+        cancel (threading.Event | None) : jeton d'annulation, surveillé
+                                          pendant tout l'appel.
 
     Retour :
-        str : texte complet généré par le modèle.
+        ChatResponse : texte généré par le modèle (une str), avec la raison
+                       de l'arrêt dans done_reason.
+
+    Si le délai est dépassé, le flux est fermé (Ollama arrête alors de générer)
+    et le texte reçu jusque-là est renvoyé, avec done_reason = "deadline".
+    L'activation du jeton d'annulation ferme aussi le flux, mais lève TurnCancelled.
+
+    Si l'appel a lieu dans un tour suivi (voir turn_context), le texte reçu
+    y est publié au fil de l'eau et l'annulation du tour ferme le flux
+    (TurnCancelled est alors levée).
+
+    Les statistiques de l'enregistrement final (tokens et durées) sont
+    ajoutées au registre de tokens.
     """
+    turn = current_turn()
+    if turn is not None:
+        turn.check()
+        turn.begin_call()
 
     # Petit affichage console pour suivre les appels effectués.
     print("\n=== OLLAMA CALL ===")
@@ -21,34 +374,41 @@ def ollama_chat(model, messages):
 
     # Requête HTTP vers l'API locale d'Ollama.
     # Le paramètre stream=True permet de recevoir la réponse par morceaux.
-    response = requests.post(
-        "http://localhost:11434/api/chat",
-        json={"model": model, "messages": messages},
-        stream=True
-    )
+    payload = {"model": model, "messages": messages}
+    if format is not None:
+        payload["format"] = format
+    options = {**getattr(_local, "options", {}), **(options or {})}
+    if options:
+        payload["options"] = options
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
+    if max_tokens is not None:
+        # Une valeur déjà présente dans options est prioritaire.
+        payload["options"] = {"num_predict": max_tokens, **payload.get("options", {})}
 
-    # On va accumuler progressivement les fragments de texte renvoyés.
-    full_text = ""
+    # Au-delà de la limite d'appels simultanés, on attend une place
+    # (le délai de l'appel ne compte qu'à partir de là).
+    with _call_slots if _call_slots is not None else nullcontext():
+        started = time.perf_counter()
+        full_text, final, done_reason = _stream_chat(payload, deadline, turn, cancel)
 
-    # Lecture ligne par ligne du flux renvoyé par Ollama.
-    for line in response.iter_lines():
-        if not line:
-            continue  # ignore les lignes vides
+    if done_reason == "deadline":
+        print(f"=== OLLAMA : DÉLAI DÉPASSÉ ({deadline} s), {len(full_text)} caractères reçus ===")
+        # Pas d'enregistrement final : seules la durée et la raison sont connues.
+        final = {"done_reason": "deadline"}
 
-        try:
-            # Chaque ligne est un petit JSON contenant un fragment de message.
-            data = json.loads(line.decode("utf-8"))
-        except json.JSONDecodeError:
-            # Si une ligne n'est pas du JSON valide, on l'affiche pour debug.
-            print("Ligne non JSON :", line)
-            continue
-
-        # Les fragments utiles se trouvent dans data["message"]["content"].
-        if "message" in data and "content" in data["message"]:
-            chunk = data["message"]["content"]
-            full_text += chunk  # on concatène le fragment au texte complet
+    if final is not None:
+        get_ledger().record(
+            model,
+            stage or (turn.stage if turn is not None else None),
+            turn.session if turn is not None else None,
+            turn.turn_id if turn is not None else None,
+            final,
+            time.perf_counter() - started,
+            prompt_chars=sum(len(m.get("content", "")) for m in messages)
+        )
 
     print("=== FIN OLLAMA ===\n")
 
-    # On renvoie le texte complet généré par le modèle.
-    return full_text
+    # On renvoie le texte généré par le modèle (éventuellement partiel).
+    return ChatResponse(full_text, done_reason)
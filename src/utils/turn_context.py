@@ -0,0 +1,166 @@
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, List, Optional
+
+
+class TurnCancelled(Exception):
+    """
+    Levée dans le thread du moteur quand le tour en cours a été annulé
+    (nouvelle action du joueur ou bouton "stop").
+    """
+
+
+class TurnContext:
+    """
+    Suivi d'un tour du moteur exécuté en arrière-plan.
+
+    Le thread du moteur y publie l'étape en cours et le texte reçu d'Ollama ;
+    l'interface le lit pour afficher la progression et peut annuler le tour.
+    ollama_chat surveille l'annulation pendant tout l'appel et ferme
+    alors la connexion, ce qui arrête la génération côté Ollama.
+
+    Avec deferred=True, les écritures partagées par tout le processus
+    (mémoire longue, suivi des entités) sont mises de côté et appliquées
+    seulement quand l'interface accepte le résultat (accept()) : un tour
+    annulé ou abandonné ne laisse aucune trace.
+    """
+
+    def __init__(self, session: Optional[str] = None, deferred: bool = False):
+        """
+        Paramètres :
+            session (str | None) : session de jeu à laquelle appartient le tour
+                                   (étiquette des statistiques du registre de tokens).
+            deferred (bool) : diffère les écritures partagées jusqu'à accept().
+        """
+        self.session = session
+        self.deferred = deferred
+        # Copies propres au tour (suivi des entités...), par clé.
+        self.forks: Dict[Any, Any] = {}
+        self._pending: List[Callable[[], None]] = []
+        self.turn_id = uuid.uuid4().hex[:12]
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self.stage = "pending"
+        self.text = ""
+        self._stage_started = time.perf_counter()
+        self._durations: Dict[str, float] = {}
+
+    # --- Côté interface ---
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Copie cohérente de l'étape en cours et du texte reçu pendant l'appel en cours.
+        """
+        with self._lock:
+            return {"stage": self.stage, "text": self.text, "cancelled": self.cancelled}
+
+    # --- Côté moteur ---
+
+    def check(self):
+        if self._cancelled.is_set():
+            raise TurnCancelled()
+
+    def stage_durations(self) -> Dict[str, float]:
+        """
+        Temps passé dans chaque étape depuis le début du tour (en secondes),
+        étape en cours comprise.
+        """
+        with self._lock:
+            durations = dict(self._durations)
+            if self.stage != "pending":
+                durations[self.stage] = durations.get(self.stage, 0.0) + time.perf_counter() - self._stage_started
+        return durations
+
+    def set_stage(self, stage: str):
+        self.check()
+        with self._lock:
+            now = time.perf_counter()
+            if self.stage != "pending":
+                self._durations[self.stage] = self._durations.get(self.stage, 0.0) + now - self._stage_started
+            self._stage_started = now
+            self.stage = stage
+            self.text = ""
+
+    def begin_call(self):
+        with self._lock:
+            self.text = ""
+
+    def add_text(self, chunk: str):
+        with self._lock:
+            self.text += chunk
+
+    def on_accept(self, action: Callable[[], None]):
+        """
+        Met de côté une écriture partagée, appliquée par accept().
+        """
+        with self._lock:
+            self._pending.append(action)
+
+    # --- Acceptation du résultat ---
+
+    def accept(self):
+        """
+        Applique, dans l'ordre, les écritures mises de côté pendant le tour.
+        Une écriture en échec n'empêche pas les suivantes.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for action in pending:
+            try:
+                action()
+            except Exception as e:
+                print("❌ Écriture différée du tour impossible :", e)
+
+
+_local = threading.local()
+
+
+def current_turn() -> Optional[TurnContext]:
+    """
+    Retourne le tour suivi par le thread courant, ou None (appel synchrone classique).
+    """
+    return getattr(_local, "turn", None)
+
+
+@contextmanager
+def turn_context(turn: TurnContext):
+    """
+    Associe un tour au thread courant le temps du bloc `with`.
+    """
+    previous = current_turn()
+    _local.turn = turn
+    try:
+        yield turn
+    finally:
+        _local.turn = previous
+
+
+def after_accept(action: Callable[[], None]):
+    """
+    Applique une écriture partagée : tout de suite hors d'un tour différé,
+    sinon quand le résultat du tour est accepté.
+    """
+    turn = current_turn()
+    if turn is not None and turn.deferred:
+        turn.on_accept(action)
+    else:
+        action()
+
+
+def report_stage(stage: str):
+    """
+    Publie l'étape du pipeline en cours (sans effet hors d'un tour suivi).
+    Lève TurnCancelled si le tour a été annulé entre-temps.
+    """
+    turn = current_turn()
+    if turn is not None:
+        turn.set_stage(stage)
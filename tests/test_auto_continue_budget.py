@@ -0,0 +1,33 @@
+import src.engine.auto_continue_budget as budget_module
+from src.engine.auto_continue_budget import AutoContinueBudget
+
+
+def test_allows_another_within_budget_and_step_limit(monkeypatch):
+    monkeypatch.setattr(budget_module, "_step_times", {"pipeline": 10.0})
+    budget = AutoContinueBudget(budget_s=45.0, max_steps=2)
+    assert budget.allows_another("pipeline")
+    assert budget.stopped_by is None
+
+    budget.chain()
+    budget.chain()
+    assert not budget.allows_another("pipeline")
+    assert budget.stopped_by == "max_steps"
+
+
+def test_refuses_a_step_that_would_not_fit(monkeypatch):
+    monkeypatch.setattr(budget_module, "_step_times", {"fused": 10.0})
+    budget = AutoContinueBudget(budget_s=45.0)
+    budget.started -= 40.0
+    assert not budget.allows_another("fused")
+    assert budget.stopped_by == "budget"
+    # Un mode jamais mesuré prend la durée par défaut.
+    assert budget_module.estimated_step_time("pipeline") == budget_module.DEFAULT_STEP_S
+
+
+def test_record_step_updates_moving_average(monkeypatch):
+    monkeypatch.setattr(budget_module, "_step_times", {})
+    budget = AutoContinueBudget()
+    budget.record_step("pipeline", 10.0)
+    budget.record_step("pipeline", 20.0)
+    expected = (1 - budget_module.STEP_TIME_ALPHA) * 10.0 + budget_module.STEP_TIME_ALPHA * 20.0
+    assert abs(budget_module.estimated_step_time("pipeline") - expected) < 1e-9
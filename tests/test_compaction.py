@@ -0,0 +1,50 @@
+import numpy as np
+
+import src.memory.compaction as compaction
+from src.memory.flat_store import FlatMemoryStore
+
+
+class FakeEmbeddings:
+    def embed_documents(self, texts):
+        return [[float(len(text)), 1.0, 0.0, 0.0] for text in texts]
+
+
+def summarize(texts):
+    return " / ".join(text[:10] for text in texts)
+
+
+def store_with_scenes(count, milestone_of, story_id="0123abcd"):
+    store = FlatMemoryStore()
+    vectors = np.ones((count, 4), dtype=np.float32)
+    metadatas = [{"story_id": story_id, "milestone_index": milestone_of(i)} for i in range(count)]
+    store.add(vectors, [f"Scène {i}." for i in range(count)], metadatas)
+    return store
+
+
+def test_plan_keeps_current_milestone_and_recent_scenes():
+    entries = [{"id": i, "metadata": {"milestone_index": 0 if i < 20 else 1}} for i in range(60)]
+    groups = compaction.plan_compaction(entries, keep_recent=30, batch=8)
+    assert [len(g) for g in groups] == [8, 8, 4]
+    assert max(i for g in groups for i in g) < 20
+
+    groups = compaction.plan_compaction(entries, keep_recent=30, batch=8, include_current=True)
+    assert max(i for g in groups for i in g) == 29
+
+
+def test_stuck_milestone_is_summarized_before_dropping():
+    count = compaction.MAX_ENTRIES_PER_STORY + 10
+    store = store_with_scenes(count, lambda i: 0)
+    report = compaction.compact_story("0123abcd", store=store, summarizer=summarize, embeddings=FakeEmbeddings())
+    assert report["dropped"] == 0
+    assert report["after"] <= compaction.COMPACTION_THRESHOLD
+    kept = [store.texts[i] for i in store.story_entries("0123abcd")]
+    assert kept[-compaction.KEEP_RECENT:] == [f"Scène {i}." for i in range(count - compaction.KEEP_RECENT, count)]
+
+
+def test_idle_story_waits_for_new_entries(monkeypatch):
+    monkeypatch.setattr(compaction, "_idle", {"0123abcd": 130})
+    monkeypatch.setattr(compaction, "_pending", set())
+    monkeypatch.setattr(compaction, "_queue", compaction.queue.Queue())
+    monkeypatch.setattr(compaction, "_thread", object())
+    assert not compaction.schedule_compaction("0123abcd", 131)
+    assert compaction.schedule_compaction("0123abcd", 130 + compaction.COMPACTION_BATCH)
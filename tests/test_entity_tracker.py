@@ -0,0 +1,34 @@
+from src.engine.entity_tracker import AhoCorasick, EntityTracker, build_codex_core
+
+
+CODEX = {
+    "pitch": "Une quête.",
+    "theme": "fantasy",
+    "personnages": ["Aelwyn la Vagabonde", "Maître Corvin", "Isolde"],
+    "lieux": ["Forêt d'Émeraude", "Tour Noire"],
+    "milestones": ["Retrouver Maître Corvin dans la foret d'emeraude", "Fuir"]
+}
+
+
+def test_codex_core_keeps_protagonist_and_milestone_entities():
+    core = build_codex_core(CODEX, {"milestone_index": 0}, [("Isolde", "personnage"), ("Tour Noire", "lieu")])
+    assert core["objectif_actuel"] == CODEX["milestones"][0]
+    assert core["personnages_actifs"] == ["Aelwyn la Vagabonde", "Maître Corvin", "Isolde"]
+    assert core["lieux_actifs"] == ["Forêt d'Émeraude", "Tour Noire"]
+
+    core = build_codex_core(CODEX, {"milestone_index": 1}, [("Aelwyn la Vagabonde", "personnage")])
+    assert core["personnages_actifs"] == ["Aelwyn la Vagabonde"]
+    assert core["lieux_actifs"] == []
+
+
+def test_aho_corasick_finds_overlapping_patterns():
+    automaton = AhoCorasick(["he", "she", "his", "hers"])
+    found = sorted((start, end, automaton.patterns[index]) for start, end, index in automaton.finditer("ushers"))
+    assert found == [(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")]
+
+
+def test_tracker_matches_whole_folded_words():
+    tracker = EntityTracker.from_codex(CODEX)
+    tracker.next_turn()
+    tracker.observe("Aelwyn traverse la FORET D'EMERAUDE ; Isoldee n'est pas là.")
+    assert tracker.active() == [("Aelwyn la Vagabonde", "personnage"), ("Forêt d'Émeraude", "lieu")]
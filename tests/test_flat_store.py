@@ -0,0 +1,84 @@
+import time
+
+import numpy as np
+
+import src.memory.flat_store as flat_store
+from src.memory.flat_store import FlatMemoryStore
+
+
+def fill(store, count, story_id, rng, dim=16):
+    vectors = rng.standard_normal((count, dim)).astype(np.float32)
+    ids = store.add(vectors, [f"{story_id}-{i}" for i in range(count)], [{"story_id": story_id} for _ in range(count)])
+    return vectors, ids
+
+
+def wait_for_ann(store):
+    for _ in range(200):
+        if store._ann is not None and not store._ann_building:
+            return
+        time.sleep(0.02)
+    raise AssertionError("index HNSW non construit")
+
+
+def test_small_story_gets_k_results_from_shared_ann(monkeypatch):
+    monkeypatch.setattr(flat_store, "ANN_THRESHOLD", 500)
+    monkeypatch.setattr(flat_store, "ANN_MIN_CANDIDATES", 50)
+    rng = np.random.default_rng(0)
+    store = FlatMemoryStore()
+    fill(store, 2000, "big", rng)
+    small_vectors, small_ids = fill(store, 60, "small", rng)
+    wait_for_ann(store)
+    assert len(store._ann_ids) == 2060
+
+    hits = store.search(small_vectors[3], k=5, filters={"story_id": "small"})
+    assert len(hits) == 5
+    assert hits[0][1] == small_ids[3]
+    assert all(store.metadatas[entry_id]["story_id"] == "small" for _, entry_id in hits)
+
+
+def test_replaced_entries_are_not_returned_by_ann(monkeypatch):
+    monkeypatch.setattr(flat_store, "ANN_THRESHOLD", 500)
+    monkeypatch.setattr(flat_store, "ANN_MIN_CANDIDATES", 50)
+    rng = np.random.default_rng(1)
+    store = FlatMemoryStore()
+    vectors, ids = fill(store, 1000, "big", rng)
+    wait_for_ann(store)
+
+    new_id = store.replace(ids[0], -vectors[0], "résumé", {"story_id": "big"})
+    hits = store.search(vectors[0], k=5, filters={"story_id": "big"})
+    assert ids[0] not in [entry_id for _, entry_id in hits]
+    assert store.search(-vectors[0], k=1, filters={"story_id": "big"})[0][1] == new_id
+
+
+def test_filters_and_top_k():
+    store = FlatMemoryStore(initial_capacity=2)
+    vectors = np.eye(4, dtype=np.float32)
+    ids = store.add(
+        vectors,
+        ["a", "b", "c", "d"],
+        [
+            {"story_id": "s1", "milestone_index": 0, "flags": {"porte": True}},
+            {"story_id": "s1", "milestone_index": 1},
+            {"story_id": "s2", "milestone_index": 0},
+            {"story_id": "s1", "milestone_index": 1, "flags": {"porte": True}},
+        ]
+    )
+    query = [1.0, 0.5, 0.2, 0.1]
+
+    assert [i for _, i in store.search(query, k=2)] == [ids[0], ids[1]]
+    assert [i for _, i in store.search(query, k=5, filters={"story_id": "s1"})] == [ids[0], ids[1], ids[3]]
+    assert [i for _, i in store.search(query, k=5, filters={"story_id": "s1", "milestone_index": [1]})] == [ids[1], ids[3]]
+    assert [i for _, i in store.search(query, k=5, filters={"flags": {"porte": True}})] == [ids[0], ids[3]]
+    assert store.search(query, filters={"story_id": "inconnue"}) == []
+    assert [i for _, i in store.search(query, k=5, filters={"story_id": "s1"}, skip_recent=1)] == [ids[0], ids[1]]
+
+    assert store.remove([ids[0]]) == 1
+    assert store.story_count("s1") == 2
+    assert [i for _, i in store.search(query, k=1, filters={"story_id": "s1"})] == [ids[1]]
+
+
+def test_recency_bonus_favors_recent_entries():
+    store = FlatMemoryStore()
+    ids = store.add(np.ones((3, 4), dtype=np.float32), ["a", "b", "c"], [{"story_id": "s"}] * 3)
+    hits = store.search([1, 1, 1, 1], k=3, recency_weight=0.1, recency_half_life=1.0)
+    assert [i for _, i in hits] == list(reversed(ids))
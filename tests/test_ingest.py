@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+import src.rag.ingest as ingest
+from src.rag.ingest import iter_json_array
+
+
+def write(tmp_path, text):
+    path = tmp_path / "lore.json"
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_reads_items_across_chunk_boundaries(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "CHUNK_SIZE", 7)
+    items = [{"name": f"Lieu {i}", "description": "x" * i} for i in range(20)]
+    path = write(tmp_path, " \n" + json.dumps(items, ensure_ascii=False, indent=2))
+    assert list(iter_json_array(path)) == items
+
+
+def test_empty_array_and_non_array(tmp_path):
+    assert list(iter_json_array(write(tmp_path, "[ ]"))) == []
+    with pytest.raises(ValueError):
+        list(iter_json_array(write(tmp_path, '{"name": "Lieu"}')))
+
+
+def test_truncated_or_oversized_items_fail(tmp_path, monkeypatch):
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_array(write(tmp_path, '[{"name": "A"}, {"name": ')))
+
+    monkeypatch.setattr(ingest, "CHUNK_SIZE", 8)
+    monkeypatch.setattr(ingest, "MAX_ITEM_CHARS", 32)
+    with pytest.raises(ValueError):
+        list(iter_json_array(write(tmp_path, '[{"name": "' + "x" * 100 + '"}]')))
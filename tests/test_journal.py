@@ -0,0 +1,105 @@
+import json
+import os
+
+from src.engine.state import MAX_HISTORY, initial_state, trim_history, update_state
+from src.storage.journal import StoryJournal, apply_delta, diff_state
+
+
+CODEX = {"theme": "fantasy", "pitch": "Une quête.", "milestones": ["A", "B"], "personnages": [], "lieux": []}
+
+
+def play(state, turn):
+    # Même enchaînement que commit_scene puis finish_turn.
+    new_state = update_state(state, {"flags": {f"f{turn}": True}})
+    new_state["history"].append({"scene_text": f"Scène {turn} " + "x" * 200})
+    trim_history(new_state)
+    return new_state
+
+
+def test_diff_state_round_trip():
+    old = {"a": 1, "inv": ["épée"], "history": [1, 2, 3], "gone": True}
+    new = {"a": 2, "inv": ["épée", "torche"], "history": [2, 3, 4, 5], "flags": {"x": 1}}
+    delta = diff_state(old, new)
+    assert delta["shift"] == {"history": 1}
+    assert delta["append"] == {"inv": ["torche"], "history": [4, 5]}
+    assert apply_delta(json.loads(json.dumps(old)), delta) == new
+
+
+def test_diff_state_merges_grown_dict():
+    old = {"flags": {"a": 1, "b": 2}}
+    new = {"flags": {"a": 1, "b": 3, "c": 4}}
+    delta = diff_state(old, new)
+    assert delta["merge"] == {"flags": {"b": 3, "c": 4}}
+    assert apply_delta(json.loads(json.dumps(old)), delta) == new
+
+
+def test_diff_state_replaces_reordered_list():
+    old = {"inv": ["a", "b", "c"]}
+    new = {"inv": ["a", "c"]}
+    delta = diff_state(old, new)
+    assert delta["set"] == {"inv": ["a", "c"]}
+    assert apply_delta(dict(old), delta) == new
+
+
+def test_journal_lines_stay_flat_after_history_cap(tmp_path):
+    state = initial_state(CODEX)
+    state["history"] = []
+    state["story_id"] = "0123abcd"
+    journal = StoryJournal("0123abcd", base_dir=str(tmp_path))
+    journal.create(CODEX, state, {"scene_text": "Début"})
+
+    for turn in range(1, 3 * MAX_HISTORY):
+        state = play(json.loads(json.dumps(state)), turn)
+        journal.append_turn({"scene_text": f"Scène {turn}"}, state)
+
+    with open(journal.journal_path, "r", encoding="utf-8") as f:
+        sizes = [len(line) for line in f][1:]
+    after_cap = sizes[MAX_HISTORY + 2:]
+    assert max(after_cap) - min(after_cap) < 50
+    assert max(after_cap) < 2000
+
+    loaded = StoryJournal("0123abcd", base_dir=str(tmp_path)).load()
+    assert loaded["state"] == state
+    assert len(loaded["state"]["history"]) == MAX_HISTORY
+
+
+def test_load_repairs_torn_tail(tmp_path):
+    journal = StoryJournal("89abcdef", base_dir=str(tmp_path))
+    journal.create(CODEX, {"history": []}, {"scene_text": "Début"})
+    journal.append_turn({"scene_text": "Un"}, {"history": [1]})
+    with open(journal.journal_path, "a", encoding="utf-8") as f:
+        f.write('{"type": "turn", "tu')
+
+    reloaded = StoryJournal("89abcdef", base_dir=str(tmp_path))
+    assert reloaded.load()["turn"] == 1
+    reloaded.append_turn({"scene_text": "Deux"}, {"history": [1, 2]})
+    data = StoryJournal("89abcdef", base_dir=str(tmp_path)).load()
+    assert data["turn"] == 2 and data["state"] == {"history": [1, 2]}
+
+
+def test_rejects_path_traversal(tmp_path):
+    for story_id in ("../etc", "ABCDEF12", "abc", os.sep.join(["ab", "cdefgh12"])):
+        try:
+            StoryJournal(story_id, base_dir=str(tmp_path))
+        except ValueError:
+            continue
+        raise AssertionError(story_id)
+
+
+def test_list_stories_follows_writes_without_rescanning(tmp_path, monkeypatch):
+    import src.storage.journal as journal_module
+
+    base = str(tmp_path)
+    first = StoryJournal("aaaaaaaa", base_dir=base)
+    first.create(CODEX, {"history": []}, {"scene_text": "A"})
+    second = StoryJournal("bbbbbbbb", base_dir=base)
+    second.create(CODEX, {"history": []}, {"scene_text": "B"})
+    assert [m["story_id"] for m in journal_module.list_stories(base)] == ["bbbbbbbb", "aaaaaaaa"]
+
+    scans = []
+    original = journal_module._scan_stories
+    monkeypatch.setattr(journal_module, "_scan_stories", lambda d: scans.append(d) or original(d))
+    first.append_turn({"scene_text": "A2"}, {"history": [1]})
+    assert [m["story_id"] for m in journal_module.list_stories(base, limit=1)] == ["aaaaaaaa"]
+    assert scans == []
+    assert not os.path.exists(first.meta_path + ".tmp")
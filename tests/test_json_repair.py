@@ -0,0 +1,38 @@
+from src.utils.json_repair import parse_json_lenient
+
+
+def test_valid_json_with_surrounding_text():
+    assert parse_json_lenient('Voici : {"a": [1, 2]} Bonne lecture.') == ({"a": [1, 2]}, "ok")
+
+
+def test_prefers_expected_object_over_leading_bracket():
+    raw = '[Narrateur] {"scene_text": "La porte grince.", "choices": ["Entrer"]}'
+    assert parse_json_lenient(raw) == ({"scene_text": "La porte grince.", "choices": ["Entrer"]}, "ok")
+    assert parse_json_lenient('Liste : [1, 2]', expect="[") == ([1, 2], "ok")
+
+
+def test_repairs_common_mistakes():
+    raw = "```json\n{'a': True, 'b': None, 'c': [1, 2,],}\n```"
+    assert parse_json_lenient(raw) == ({"a": True, "b": None, "c": [1, 2]}, "repaired")
+
+
+def test_truncated_object_drops_incomplete_parts():
+    value, status = parse_json_lenient('{"scene_text": "La nuit tombe.", "choices": ["Fuir", "Se cach')
+    assert status == "repaired"
+    assert value == {"scene_text": "La nuit tombe.", "choices": ["Fuir"]}
+
+    value, _ = parse_json_lenient('{"scene_text": "La nuit", "choices": ["Fuir"], "consequences":')
+    assert value == {"scene_text": "La nuit", "choices": ["Fuir"]}
+
+    value, _ = parse_json_lenient('{"choices": [{"text": "Fuir"}, {"text": "Se')
+    assert value == {"choices": [{"text": "Fuir"}]}
+
+
+def test_truncated_scene_text_is_kept():
+    value, status = parse_json_lenient('{"scene_text": "La nuit tombe sur')
+    assert (value, status) == ({"scene_text": "La nuit tombe sur"}, "repaired")
+
+
+def test_failures():
+    for raw in ("", "Pas de JSON ici.", "null", "```json\nnull\n```"):
+        assert parse_json_lenient(raw) == (None, "failed")